@@ -0,0 +1,430 @@
+"""Benchmark scan & download Kitsu Downloader terhadap server Kitsu tiruan lokal.
+
+Server tiruan melayani endpoint REST yang dipakai gazu, analyze_single_project,
+scan_entity, bulk scan, dan URL download dari generate_url_candidates.
+Data project dibuat sintetis, latency dan error bisa disuntikkan.
+
+Contoh:
+    python bench_kitsu.py --shots 500 --assets 100 --latency-ms 20 --modes live,bulk
+    python bench_kitsu.py --error-rate 0.05 --download-files 200 --json hasil.json
+"""
+import gazu
+import os
+import re
+import io
+import sys
+import time
+import json
+import uuid
+import random
+import shutil
+import argparse
+import tempfile
+import threading
+import tracemalloc
+import contextlib
+from collections import Counter
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+import download_kitsu as dk
+
+# ==========================================
+# DATA PROJECT SINTETIS
+# ==========================================
+
+STAMP = "2024-01-01T00:00:00"
+
+def new_id():
+    return str(uuid.uuid4())
+
+def make_project(name, shots=200, assets=50, task_types=3, revisions=3, file_size=262144,
+                 episodes=2, sequences=4, preview_ratio=0.5, seed=1):
+    """Satu project lengkap (episode/sequence/shot/asset/task/file) dalam bentuk koleksi /data/<nama>"""
+    rng = random.Random(seed)
+    project = {'id': new_id(), 'name': name, 'project_status_name': "Open"}
+    db = {name: [] for name in ("episodes", "sequences", "shots", "assets", "tasks",
+                                "preview-files", "output-files", "working-files")}
+    db['projects'] = [project]
+    db['task-types'] = [{'id': new_id(), 'name': f"Task{k + 1}"} for k in range(task_types)]
+    output_type_id = new_id()
+
+    for e in range(episodes):
+        db['episodes'].append({'id': new_id(), 'name': f"EP{e + 1:02d}", 'project_id': project['id'], 'type': "Episode"})
+    for q in range(sequences):
+        episode = db['episodes'][q % len(db['episodes'])] if db['episodes'] else None
+        db['sequences'].append({
+            'id': new_id(), 'name': f"SQ{q + 1:02d}", 'project_id': project['id'], 'type': "Sequence",
+            'parent_id': episode and episode['id'], 'episode_id': episode and episode['id'],
+        })
+
+    def add_preview(task_id=None):
+        if rng.random() >= preview_ratio: return None
+        ext = rng.choice(("mp4", "png"))
+        preview = {'id': new_id(), 'original_name': f"preview_{len(db['preview-files'])}", 'extension': ext,
+                   'file_size': file_size, 'revision': 1, 'task_id': task_id, 'updated_at': STAMP}
+        db['preview-files'].append(preview)
+        return preview['id']
+
+    entities = []
+    for i in range(shots):
+        sequence = db['sequences'][i % len(db['sequences'])]
+        shot = {'id': new_id(), 'name': f"SH{i + 1:04d}", 'project_id': project['id'], 'type': "Shot",
+                'parent_id': sequence['id'], 'sequence_id': sequence['id'], 'episode_id': sequence['episode_id'],
+                'updated_at': STAMP}
+        db['shots'].append(shot)
+        entities.append(shot)
+    for i in range(assets):
+        asset = {'id': new_id(), 'name': f"AS{i + 1:04d}", 'project_id': project['id'], 'type': "Asset",
+                 'asset_type_name': rng.choice(("Props", "Character", "Environment")), 'updated_at': STAMP}
+        db['assets'].append(asset)
+        entities.append(asset)
+
+    for entity in entities:
+        entity['preview_file_id'] = add_preview()
+        for task_type in db['task-types']:
+            task = {'id': new_id(), 'name': "main", 'entity_id': entity['id'], 'project_id': project['id'],
+                    'task_type_id': task_type['id'], 'updated_at': STAMP}
+            task['preview_file_id'] = add_preview(task['id'])
+            db['tasks'].append(task)
+            for r in range(1, revisions + 1):
+                db['output-files'].append({
+                    'id': new_id(), 'name': "main", 'extension': "exr", 'file_size': file_size, 'revision': r,
+                    'entity_id': entity['id'], 'task_type_id': task_type['id'], 'output_type_id': output_type_id,
+                    'updated_at': STAMP,
+                })
+                db['working-files'].append({
+                    'id': new_id(), 'name': "main", 'extension': "blend", 'file_size': file_size, 'revision': r,
+                    'task_id': task['id'], 'entity_id': entity['id'], 'updated_at': STAMP,
+                })
+    return db
+
+# ==========================================
+# SERVER KITSU TIRUAN
+# ==========================================
+
+ID_PATTERN = re.compile(r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}")
+DOWNLOAD_PATTERN = re.compile(
+    r"^(?:movies|pictures)/originals/preview-files/(?P<preview>[^/]+)/download$"
+    r"|^data/(?P<kind>output-files|working-files)/(?P<file>[^/]+)/download$"
+)
+CHUNK = b"\0" * 65536
+
+class MockKitsu:
+    """Data + statistik server tiruan. latency dalam detik, error_rate 0..1 (balasan 503)"""
+
+    def __init__(self, db, latency=0.0, error_rate=0.0, seed=1):
+        self.db = db
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calls = Counter()
+        self.errors = 0
+        self.bytes_sent = 0
+        self.by_id = {}
+        for records in db.values():
+            for record in records: self.by_id[record['id']] = record
+        self.task_type_names = {tt['id']: tt['name'] for tt in db['task-types']}
+        # Koleksi 'entities' Kitsu mencakup episode, sequence, shot dan asset
+        db['entities'] = db['episodes'] + db['sequences'] + db['shots'] + db['assets']
+
+    def reset_stats(self):
+        with self.lock:
+            self.calls.clear()
+            self.errors = 0
+            self.bytes_sent = 0
+
+    def count(self, path):
+        with self.lock:
+            self.calls[ID_PATTERN.sub(":id", path)] += 1
+
+    def inject_error(self):
+        with self.lock:
+            if self.error_rate and self.rng.random() < self.error_rate:
+                self.errors += 1
+                return True
+        return False
+
+    def with_task_type_name(self, tasks):
+        return [dict(t, task_type_name=self.task_type_names[t['task_type_id']]) for t in tasks]
+
+    def route(self, path, query):
+        """Return (status, payload) untuk endpoint REST"""
+        parts = path.split('/')
+        if parts[0] != 'data': return 404, {}
+        if path == "data/projects/open": return 200, self.db['projects']
+        if path == "data/events/last": return 200, []
+        if len(parts) == 4 and parts[1] == 'projects' and parts[3] in ('shots', 'assets'):
+            return 200, [r for r in self.db[parts[3]] if r['project_id'] == parts[2]]
+        if len(parts) == 4 and parts[1] in ('shots', 'assets') and parts[3] == 'tasks':
+            return 200, self.with_task_type_name(t for t in self.db['tasks'] if t['entity_id'] == parts[2])
+        if len(parts) == 4 and parts[1] == 'entities' and parts[3] == 'output-files':
+            task_type_id = query.get('task_type_id')
+            return 200, [o for o in self.db['output-files'] if o['entity_id'] == parts[2]
+                         and (not task_type_id or o['task_type_id'] == task_type_id)]
+        if len(parts) == 4 and parts[1] == 'tasks' and parts[3] == 'working-files':
+            return 200, [w for w in self.db['working-files'] if w['task_id'] == parts[2]]
+        if len(parts) == 3 and parts[1] in self.db:
+            record = self.by_id.get(parts[2])
+            if record is None or record not in self.db[parts[1]]: return 404, {"message": "not found"}
+            return 200, record
+        if len(parts) == 2 and parts[1] in self.db:
+            return 200, self.list_collection(parts[1], query)
+        return 404, {}
+
+    def list_collection(self, name, query):
+        """Filter field=value atau field=[json list], dengan page/limit seperti CRUD Kitsu"""
+        rows = self.db[name]
+        for key, value in query.items():
+            if key in ('page', 'limit', 'fields'): continue
+            values = set(json.loads(value)) if value.startswith('[') else {value}
+            rows = [r for r in rows if r.get(key) in values]
+        if 'page' not in query: return rows
+        page = int(query['page'])
+        limit = int(query.get('limit') or 100)
+        nb_pages = max(1, -(-len(rows) // limit))
+        return {'data': rows[(page - 1) * limit: page * limit], 'nb_pages': nb_pages, 'page': page}
+
+    def download_size(self, match):
+        record = self.by_id.get(match.group('preview') or match.group('file'))
+        return record.get('file_size', 0) if record else None
+
+def make_handler(mock):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # Header dan body ditulis terpisah: tanpa ini delayed ACK menambah ~40ms per request
+        disable_nagle_algorithm = True
+
+        def log_message(self, *args): pass
+
+        def send_json(self, status, payload, extra=None):
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            for key, value in (extra or {}).items(): self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_HEAD(self):
+            self.handle_request(head=True)
+
+        def do_GET(self):
+            self.handle_request()
+
+        def handle_request(self, head=False):
+            parsed = urlparse(self.path)
+            path = parsed.path.strip('/')
+            if path.startswith("api/"): path = path[4:]
+            query = {k: v[0] for k, v in parse_qs(parsed.query).items()}
+            mock.count(path)
+            if mock.latency: time.sleep(mock.latency)
+            if mock.inject_error():
+                return self.send_json(503, {"message": "injected"}, {"Retry-After": "0"})
+
+            match = DOWNLOAD_PATTERN.match(path)
+            if match: return self.send_file(mock.download_size(match), head)
+            status, payload = mock.route(path, query)
+            self.send_json(status, payload)
+
+        def send_file(self, size, head):
+            if size is None: return self.send_json(404, {"message": "not found"})
+            start, end = 0, size - 1
+            rng = self.headers.get("Range")
+            if rng and size:
+                first, _, last = rng.split('=', 1)[1].partition('-')
+                start = int(first)
+                end = min(int(last), size - 1) if last else size - 1
+                if start >= size:
+                    self.send_response(416)
+                    self.send_header("Content-Range", f"bytes */{size}")
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                self.send_response(206)
+                self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+            else:
+                self.send_response(200)
+            length = end - start + 1 if size else 0
+            self.send_header("Content-Length", str(length))
+            self.send_header("Accept-Ranges", "bytes")
+            self.send_header("ETag", '"bench"')
+            self.end_headers()
+            if head: return
+            remaining = length
+            while remaining > 0:
+                block = CHUNK[:min(remaining, len(CHUNK))]
+                self.wfile.write(block)
+                remaining -= len(block)
+            with mock.lock:
+                mock.bytes_sent += length
+
+    return Handler
+
+def start_server(mock):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(mock))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+# ==========================================
+# PENGUKURAN
+# ==========================================
+
+def peak_rss_bytes():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux dalam KB, macOS dalam byte
+    return peak if sys.platform == "darwin" else peak * 1024
+
+def measure(fn, trace_memory=False):
+    """Jalankan fn tanpa output ke layar, return (hasil, detik, peak memori Python atau None)"""
+    if trace_memory: tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = fn()
+    finally:
+        duration = time.perf_counter() - start
+        peak = None
+        if trace_memory:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+    return result, duration, peak
+
+def reset_scan_state():
+    """Cache nama parent dikosongkan agar tiap mode dibandingkan dari kondisi yang sama"""
+    dk.PARENT_NAME_CACHE.clear()
+    dk.PARENT_NAME_FAILURES.clear()
+
+def relocate_queue(queue, root, target):
+    """Arahkan folder item ke folder sementara (bukan ~/Downloads)"""
+    return [item.copy(folder=os.path.join(target, os.path.relpath(item['folder'], root))) for item in queue]
+
+def run_benchmark(args):
+    db = make_project("Bench", shots=args.shots, assets=args.assets, task_types=args.task_types,
+                      revisions=args.revisions, file_size=dk.parse_size(args.file_size),
+                      episodes=args.episodes, sequences=args.sequences, seed=args.seed)
+    mock = MockKitsu(db, latency=args.latency_ms / 1000.0, error_rate=args.error_rate, seed=args.seed)
+    server = start_server(mock)
+
+    dk.KITSU_HOST = f"http://127.0.0.1:{server.server_port}/api"
+    gazu.client.set_host(dk.KITSU_HOST)
+    gazu.client.default_client.tokens = {'access_token': "bench", 'refresh_token': "bench"}
+    dk.set_api_limit(args.max_api_requests)
+    dk.SEGMENT_CONNECTIONS = max(1, args.segments)
+    auth_headers = dk.get_gazu_auth_headers()
+    dk.configure_http_session(max(dk.HTTP_POOL_SIZE, args.workers, args.max_api_requests))
+    project = db['projects'][0]
+
+    results = []
+    scan = None
+    for mode in [m.strip() for m in args.modes.split(',') if m.strip()]:
+        if mode not in ('live', 'bulk'):
+            print(f"[WARNING] Mode '{mode}' tidak dikenal, dilewati"); continue
+        reset_scan_state()
+        mock.reset_stats()
+        dk.METRICS.reset()
+        scan, seconds, peak = measure(lambda: dk.analyze_single_project(
+            project, auth_headers, 1, 1, scan_workers=args.scan_workers, bulk=(mode == 'bulk')
+        ), trace_memory=args.trace_memory)
+        total_size, total_files = scan[0], scan[1]
+        results.append({
+            'phase': f"scan-{mode}", 'seconds': round(seconds, 3), 'api_calls': sum(mock.calls.values()),
+            'errors_injected': mock.errors, 'files': total_files, 'bytes': total_size,
+            'peak_memory': peak, 'calls_by_endpoint': dict(mock.calls.most_common()),
+            'metrics': dk.METRICS.snapshot(),
+        })
+
+    if scan and args.download_files:
+        _, _, queue, root, _, _ = scan
+        if args.download_files > 0: queue = queue[:args.download_files]
+        target = tempfile.mkdtemp(prefix="kitsu_bench_")
+        try:
+            mock.reset_stats()
+            dk.METRICS.reset()
+            (progress, _), seconds, peak = measure(lambda: dk.run_download_pool(
+                relocate_queue(queue, root, target), auth_headers, workers=args.workers
+            ), trace_memory=args.trace_memory)
+            results.append({
+                'phase': "download", 'seconds': round(seconds, 3), 'api_calls': sum(mock.calls.values()),
+                'errors_injected': mock.errors, 'files': progress.success_count, 'failed': progress.failed_count,
+                'collided': progress.collided_count,
+                'bytes': progress.bytes_done, 'throughput': progress.bytes_done / seconds if seconds else 0,
+                'peak_memory': peak, 'calls_by_endpoint': dict(mock.calls.most_common()),
+                'metrics': dk.METRICS.snapshot(),
+            })
+        finally:
+            shutil.rmtree(target, ignore_errors=True)
+
+    server.shutdown()
+    return {
+        'config': {k: v for k, v in vars(args).items() if k != 'json'},
+        'dataset': {name: len(records) for name, records in db.items()},
+        'results': results,
+        'peak_rss': peak_rss_bytes(),
+    }
+
+def print_report(report):
+    print("="*92)
+    print("   KITSU DOWNLOADER - BENCHMARK (server tiruan lokal)")
+    print("="*92)
+    dataset = report['dataset']
+    print(f"Data: {dataset['shots']} shot, {dataset['assets']} asset, {dataset['tasks']} task, "
+          f"{dataset['preview-files'] + dataset['output-files'] + dataset['working-files']} file")
+    print("-"*92)
+    print(f"{'Fase':<12} {'Waktu':>9} {'API call':>9} {'Error':>6} {'File':>7} {'Ukuran':>11} {'Throughput':>12} {'Peak mem':>11}")
+    for row in report['results']:
+        throughput = f"{row['throughput'] / 1048576:.2f} MB/s" if 'throughput' in row else "-"
+        peak = dk.format_bytes(row['peak_memory']) if row['peak_memory'] is not None else "-"
+        print(f"{row['phase']:<12} {row['seconds']:>8.2f}s {row['api_calls']:>9} {row['errors_injected']:>6} "
+              f"{row['files']:>7} {dk.format_bytes(row['bytes']):>11} {throughput:>12} {peak:>11}")
+    print("-"*92)
+    for row in report['results']:
+        if row.get('collided'):
+            print(f"{row['phase']}: {row['collided']} file bentrok (path sama dengan revisi lain, tidak didownload)")
+        print(f"{row['phase']} - request per endpoint:")
+        for endpoint, count in list(row['calls_by_endpoint'].items())[:8]:
+            print(f"   {count:>7}  {endpoint}")
+    if report['peak_rss']: print(f"Peak RSS proses: {dk.format_bytes(report['peak_rss'])}")
+    print("="*92)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark Kitsu Downloader dengan server Kitsu tiruan")
+    parser.add_argument("--shots", type=int, default=200)
+    parser.add_argument("--assets", type=int, default=50)
+    parser.add_argument("--task-types", type=int, default=3)
+    parser.add_argument("--revisions", type=int, default=3, help="Revisi output/working file per task")
+    parser.add_argument("--episodes", type=int, default=2)
+    parser.add_argument("--sequences", type=int, default=4)
+    parser.add_argument("--file-size", default="256K", help="Ukuran setiap file sintetis (cth: 256K, 10M)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--latency-ms", type=float, default=0, help="Latency tambahan per request")
+    parser.add_argument("--error-rate", type=float, default=0, help="Peluang request dibalas 503 (0..1)")
+    parser.add_argument("--modes", default="live,bulk", help="Mode scan yang diukur: live,bulk")
+    parser.add_argument("--scan-workers", type=int, default=dk.SCAN_WORKERS)
+    parser.add_argument("--max-api-requests", type=int, default=dk.MAX_API_REQUESTS)
+    parser.add_argument("--workers", type=int, default=dk.DOWNLOAD_WORKERS)
+    parser.add_argument("--segments", type=int, default=dk.SEGMENT_CONNECTIONS)
+    parser.add_argument("--download-files", type=int, default=100,
+                        help="Jumlah file hasil scan terakhir yang diunduh (0 = lewati, -1 = semua)")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="Ukur peak memori Python per fase dengan tracemalloc (memperlambat)")
+    parser.add_argument("--json", metavar="FILE", help="Simpan hasil dalam format JSON")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = run_benchmark(args)
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Hasil disimpan ke '{args.json}'")
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,81 @@
-import gazu
-import requests
 import os
 import getpass
 import sys
 import time
 import json
-from datetime import datetime
+import gzip
+import hashlib
+import argparse
+import shutil
+import threading
+import random
+import socket
+import base64
+import ctypes
+import importlib
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_EXCEPTION
+from contextlib import contextmanager
+from urllib.parse import urlparse
+from collections import defaultdict
+from queue import Queue
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
+
+class LazyModule:
+    """Modul yang baru diimport saat atributnya pertama kali dipakai. Import gazu + requests
+    makan ~0.2 detik, jadi menu dari cache bisa tampil tanpa menunggu keduanya"""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+gazu = LazyModule("gazu")
+requests = LazyModule("requests")
 
 KITSU_HOST = "" 
 CACHE_FILENAME = "kitsu_scan_cache.json"
+CACHE_DIRNAME = "kitsu_scan_cache"
+CACHE_INDEX_FILENAME = "index.json"
+CACHE_VERSION = 2
+URL_PATTERNS_FILENAME = "kitsu_url_patterns.json"
+SESSION_FILENAME = "kitsu_session.json" # Token login tersimpan (mode 600)
+SAVE_SESSION = True # False dengan --no-save-token
+TOKEN_MIN_LIFETIME = 300 # Token tersimpan dipakai ulang jika masih berlaku minimal sekian detik
+MANIFEST_FILENAME = ".kitsu_manifest.json"
+MANIFEST_SAVE_EVERY = 500
+DOWNLOAD_WORKERS = 8
+MAX_CONNECTIONS_PER_HOST = 8
+HTTP_POOL_SIZE = 32
+SCAN_WORKERS = 8
+PARALLEL_PROJECTS = 3
+MAX_API_REQUESTS = 16
+STREAM_QUEUE_SIZE = 2000
+SEGMENT_CONNECTIONS = 4 # Koneksi paralel untuk satu file besar (1 = selalu satu stream)
+SEGMENT_THRESHOLD = 256 * 1024 * 1024
+SEGMENT_SIZE = 64 * 1024 * 1024
+BULK_PAGE_SIZE = 2000
+BULK_ID_CHUNK = 150
+DELTA_EVENTS_LIMIT = 20000
+DELTA_SAFETY_MINUTES = 10
+NAME_FAILURE_TTL = 300 # Detik sebelum id parent yang gagal dicari boleh dicoba lagi
+RETRY_ATTEMPTS = 5
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 60
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+CONNECT_TIMEOUT = 30
+STALL_WINDOW = 60 # Detik; download dianggap macet jika throughput di bawah STALL_MIN_SPEED selama ini
+STALL_MIN_SPEED = 10240
+BREAKER_THRESHOLD = 5 # Gagal berturut-turut sebelum endpoint dijeda
+BREAKER_COOLDOWN = 15
+BREAKER_MAX_COOLDOWN = 300
+PROGRESS_SPEED_WINDOW = 20 # Detik; ETA memakai kecepatan rata-rata selama jendela ini
+DISK_SPACE_RESERVE = 2**30 # Ruang yang tetap disisakan di disk tujuan saat preflight
+LIMIT_CHECK_SECONDS = 5 # Seberapa sering aturan jam / file limit bandwidth dicek ulang
 
 # ==========================================
 # UTILITY FUNCTIONS
@@ -42,39 +109,255 @@ def format_bytes(size):
         return f"{n:.2f} {power_labels.get(count, 'B')}"
     except: return "Unknown"
 
+# ==========================================
+# QUEUE ITEM (RINGKAS)
+# ==========================================
+
+QUEUE_ITEM_FIELDS = ('type', 'id', 'url', 'folder', 'filename', 'size', 'entity_id', 'revision', 'revision_group')
+
+def compact_url(url):
+    """URL disimpan tanpa host Kitsu (dibangun ulang lewat get_full_url saat dibaca)"""
+    if not url: return None
+    base = KITSU_HOST.replace("/api", "")
+    return url[len(base):] if url.startswith(base + "/") else url
+
+class QueueItem:
+    """Item download dengan __slots__. String yang berulang (type, folder, entity id) di-intern
+    sehingga dipakai bersama oleh semua item. Akses gaya dict (item['folder'], item.get('size'))
+    tetap didukung untuk kode lama"""
+    __slots__ = ('type', 'id', 'url_path', 'folder', 'filename', 'size', 'entity_id', 'revision', 'revision_group')
+
+    def __init__(self, item_type, file_id, folder, filename, size=0, entity_id=None, revision=None, url=None,
+                 revision_group=None):
+        self.type = sys.intern(item_type)
+        self.id = file_id
+        self.folder = sys.intern(folder)
+        self.filename = filename
+        self.size = size or 0
+        self.entity_id = sys.intern(entity_id) if entity_id else entity_id
+        self.revision = revision
+        self.url_path = compact_url(url)
+        # Grup revisi seperti saat scan (lihat revision_group), None untuk preview / cache lama
+        self.revision_group = revision_group
+
+    @property
+    def url(self):
+        return get_full_url(self.url_path)
+
+    @classmethod
+    def from_dict(cls, data):
+        if isinstance(data, cls): return data
+        return cls(data['type'], data['id'], data['folder'], data['filename'], data.get('size', 0),
+                   data.get('entity_id'), data.get('revision'), data.get('url'), data.get('revision_group'))
+
+    def to_dict(self):
+        return {key: getattr(self, key) for key in QUEUE_ITEM_FIELDS}
+
+    def to_row(self, folder_index, entity_index):
+        """Baris shard cache: folder dan entity id diganti nomor di tabel header"""
+        return [self.type, self.id, folder_index, self.filename, self.size, entity_index, self.revision,
+                self.url_path, self.revision_group]
+
+    @classmethod
+    def from_row(cls, row, folders, entities):
+        item = cls.__new__(cls)
+        (item_type, item.id, folder_index, item.filename, item.size,
+         entity_index, item.revision, item.url_path) = row[:8]
+        # Shard format 2 belum menyimpan grup revisi
+        item.revision_group = row[8] if len(row) > 8 else None
+        item.type = sys.intern(item_type)
+        item.folder = folders[folder_index]
+        item.entity_id = entities[entity_index] if entity_index is not None else None
+        return item
+
+    def copy(self, **changes):
+        data = self.to_dict()
+        data.update(changes)
+        return QueueItem.from_dict(data)
+
+    def __getitem__(self, key):
+        if key not in QUEUE_ITEM_FIELDS: raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in QUEUE_ITEM_FIELDS else default
+
+    def __contains__(self, key):
+        return key in QUEUE_ITEM_FIELDS
+
+    def __eq__(self, other):
+        if isinstance(other, (QueueItem, dict)):
+            return all(self.get(key) == other.get(key) for key in QUEUE_ITEM_FIELDS)
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"QueueItem({self.to_dict()!r})"
+
 # ==========================================
 # CACHE FILE HANDLERS
 # ==========================================
 
-def save_cache_to_disk(cache_data):
-    """Menyimpan data hasil scan ke file JSON"""
+# Format cache: folder CACHE_DIRNAME berisi index.json (ringkasan untuk menu)
+# dan satu shard <project_id>.jsonl.gz per project: header (scan_state + tabel folder)
+# lalu satu baris array per item queue. Queue baru dibaca saat project dipilih.
+
+SHARD_FORMAT = 3 # 1 = dict JSON per item (tanpa tabel folder), 2 = tanpa grup revisi
+SHARD_BLOCK_ROWS = 1000 # Item per baris shard (lebih sedikit panggilan json.loads saat load)
+
+SUMMARY_KEYS = ('project', 'total_size', 'total_files', 'download_root', 'total_shots', 'scan_filter')
+
+def atomic_write(path, write_fn, binary=False, file_mode=None):
+    """Tulis ke file sementara lalu os.replace agar file lama tidak pernah rusak.
+    file_mode: file sementara dibuat baru (O_EXCL) langsung dengan permission ini"""
+    temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.part"
+    mode = 'wb' if binary else 'w'
     try:
-        data_wrapper = {
+        if file_mode is None:
+            f = open(temp_path, mode)
+        else:
+            flags = os.O_CREAT | os.O_EXCL | os.O_WRONLY | getattr(os, 'O_BINARY', 0)
+            f = os.fdopen(os.open(temp_path, flags, file_mode), mode)
+        with f:
+            write_fn(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            try: os.remove(temp_path)
+            except: pass
+
+def shard_filename(project):
+    return f"{sanitize(str(project['id']))}.jsonl.gz"
+
+def write_project_shard(entry):
+    """Simpan scan_state dan queue satu project ke shard-nya"""
+    shard = shard_filename(entry['project'])
+
+    def write_fn(raw):
+        queue = [QueueItem.from_dict(item) for item in entry.get('queue', [])]
+        folder_index = {}
+        entity_index = {}
+        for item in queue:
+            folder_index.setdefault(item.folder, len(folder_index))
+            if item.entity_id is not None: entity_index.setdefault(item.entity_id, len(entity_index))
+        with gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=3) as gz:
+            header = {"format": SHARD_FORMAT, "scan_state": entry.get('scan_state'),
+                      "folders": list(folder_index), "entities": list(entity_index)}
+            gz.write((json.dumps(header, separators=(',', ':')) + "\n").encode('utf-8'))
+            for start in range(0, len(queue), SHARD_BLOCK_ROWS):
+                rows = [item.to_row(folder_index[item.folder], entity_index.get(item.entity_id))
+                        for item in queue[start:start + SHARD_BLOCK_ROWS]]
+                gz.write((json.dumps(rows, separators=(',', ':')) + "\n").encode('utf-8'))
+
+    atomic_write(os.path.join(CACHE_DIRNAME, shard), write_fn, binary=True)
+    return shard
+
+def iter_shard_lines(entry):
+    with gzip.open(os.path.join(CACHE_DIRNAME, entry['shard']), 'rt', encoding='utf-8') as f:
+        for line in f:
+            if line.strip(): yield json.loads(line)
+
+def read_shard(entry):
+    """(header, iterator QueueItem) dari shard; shard format lama (dict per baris) tetap terbaca"""
+    lines = iter_shard_lines(entry)
+    header = next(lines, None) or {}
+    if header.get('format', 1) < 2: return header, (QueueItem.from_dict(data) for data in lines)
+    folders = [sys.intern(folder) for folder in header.get('folders', [])]
+    entities = [sys.intern(entity_id) for entity_id in header.get('entities', [])]
+    return header, (QueueItem.from_row(row, folders, entities) for rows in lines for row in rows)
+
+def iter_cached_queue(entry):
+    """Stream item queue dari shard tanpa memuat semuanya ke memori"""
+    if 'queue' in entry:
+        yield from entry['queue']
+        return
+    yield from read_shard(entry)[1]
+
+def load_project_queue(entry):
+    """Muat queue (dan scan_state) satu project dari shard saat dibutuhkan"""
+    if 'queue' not in entry:
+        try:
+            header, items = read_shard(entry)
+            entry['scan_state'] = header.get('scan_state')
+            entry['queue'] = list(items)
+            entry['shard_saved'] = True
+        except Exception as e:
+            print(f"[WARNING] Shard cache '{entry.get('shard')}' tidak bisa dibaca: {e}")
+            entry['queue'] = []
+    return entry['queue']
+
+def save_cache_to_disk(cache_data, partial=False):
+    """Menyimpan data hasil scan: shard per project lalu index (atomic).
+    partial=True untuk simpanan sementara selama scan (tanpa pesan, shard lama tidak dihapus)"""
+    try:
+        os.makedirs(CACHE_DIRNAME, exist_ok=True)
+        index_projects = {}
+        for idx, entry in cache_data.items():
+            if not entry:
+                index_projects[str(idx)] = None
+                continue
+            # Shard hanya ditulis untuk project yang queue-nya ada di memori dan belum tersimpan
+            if 'queue' in entry and not (entry.get('shard') and entry.get('shard_saved')):
+                entry['shard'] = write_project_shard(entry)
+                entry['shard_saved'] = True
+            summary = {k: entry.get(k) for k in SUMMARY_KEYS}
+            summary['shard'] = entry.get('shard')
+            index_projects[str(idx)] = summary
+
+        index = {
+            "version": CACHE_VERSION,
             "timestamp": time.time(),
             "date_str": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            "data": cache_data
+            "projects": index_projects,
+            "names": dict(PARENT_NAME_CACHE) # nama parent/episode/sequence per id
         }
-        with open(CACHE_FILENAME, 'w') as f:
-            json.dump(data_wrapper, f, indent=2)
-        print(f"\n[INFO] Data scan berhasil disimpan ke '{CACHE_FILENAME}'")
+        atomic_write(os.path.join(CACHE_DIRNAME, CACHE_INDEX_FILENAME),
+                     lambda f: json.dump(index, f, separators=(',', ':')))
+
+        if partial: return
+
+        # Hapus shard yang sudah tidak dipakai
+        used = {p['shard'] for p in index_projects.values() if p and p.get('shard')}
+        for name in os.listdir(CACHE_DIRNAME):
+            if name.endswith(".jsonl.gz") and name not in used:
+                try: os.remove(os.path.join(CACHE_DIRNAME, name))
+                except: pass
+        print(f"\n[INFO] Data scan berhasil disimpan ke '{CACHE_DIRNAME}/'")
     except Exception as e:
         print(f"[WARNING] Gagal menyimpan cache: {e}")
 
+def load_legacy_cache():
+    """Membaca cache format lama (satu file JSON penuh)"""
+    with open(CACHE_FILENAME, 'r') as f:
+        wrapper = json.load(f)
+        
+    raw_data = wrapper.get("data", {})
+    processed_data = {}
+    for k, v in raw_data.items():
+        processed_data[int(k)] = v
+        
+    return processed_data, wrapper.get("date_str", "Unknown Date")
+
 def load_cache_from_disk():
-    """Membaca file cache jika ada"""
-    if not os.path.exists(CACHE_FILENAME):
-        return None
-    
+    """Membaca index cache jika ada (queue per project dibaca belakangan)"""
+    index_path = os.path.join(CACHE_DIRNAME, CACHE_INDEX_FILENAME)
     try:
-        with open(CACHE_FILENAME, 'r') as f:
-            wrapper = json.load(f)
-            
-        raw_data = wrapper.get("data", {})
+        if not os.path.exists(index_path):
+            if os.path.exists(CACHE_FILENAME): return load_legacy_cache()
+            return None
+
+        with open(index_path, 'r') as f:
+            index = json.load(f)
+        if index.get("version") != CACHE_VERSION: return None
+
         processed_data = {}
-        for k, v in raw_data.items():
+        for k, v in index.get("projects", {}).items():
             processed_data[int(k)] = v
-            
-        return processed_data, wrapper.get("date_str", "Unknown Date")
+        PARENT_NAME_CACHE.update(index.get("names") or {})
+        return processed_data, index.get("date_str", "Unknown Date")
     except Exception as e:
         print(f"[WARNING] File cache rusak atau tidak valid: {e}")
         return None
@@ -83,77 +366,998 @@ def load_cache_from_disk():
 # DOWNLOAD URL LOGIC
 # ==========================================
 
-def generate_url_candidates(entity_type, entity_id):
-    base_no_api = KITSU_HOST.replace("/api", "")
-    base_api = KITSU_HOST
-    
+# Pola URL per jenis file. {api} = KITSU_HOST, {base} = KITSU_HOST tanpa /api
+URL_PATTERNS = {
+    'preview_movie': [
+        "{api}/movies/originals/preview-files/{id}/download",
+        "{api}/movies/preview-files/{id}/download",
+        "{base}/api/movies/originals/preview-files/{id}/download",
+    ],
+    'preview_picture': [
+        "{api}/pictures/originals/preview-files/{id}/download",
+        "{api}/pictures/preview-files/{id}/download",
+        "{base}/api/pictures/originals/preview-files/{id}/download",
+    ],
+    'output': [
+        "{api}/data/output-files/{id}/download",
+        "{api}/data/output-files/{id}/file",
+    ],
+    'working': [
+        "{api}/data/working-files/{id}/download",
+        "{api}/data/working-files/{id}/file",
+    ],
+}
+ITEM_URL_PATTERN = "item_url"
+PICTURE_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp', 'bmp', 'tif', 'tiff', 'exr', 'tga', 'psd'}
+
+def url_kind(entity_type, filename=None):
+    """Jenis URL: preview dibedakan movie/picture dari ekstensi file"""
+    if entity_type != 'preview': return entity_type
+    ext = os.path.splitext(filename or "")[1].lstrip('.').lower()
+    return 'preview_picture' if ext in PICTURE_EXTENSIONS else 'preview_movie'
+
+def kind_patterns(kind):
+    patterns = list(URL_PATTERNS.get(kind, []))
+    # Preview dengan ekstensi tak dikenal tetap mencoba pola jenis lain
+    if kind == 'preview_movie': patterns += URL_PATTERNS['preview_picture']
+    elif kind == 'preview_picture': patterns += URL_PATTERNS['preview_movie']
+    return patterns
+
+def expand_url_pattern(pattern, entity_id):
+    return pattern.format(api=KITSU_HOST, base=KITSU_HOST.replace("/api", ""), id=entity_id)
+
+def generate_url_candidates(entity_type, entity_id, filename=None):
     candidates = []
-    if entity_type == 'preview':
-        candidates.append(f"{base_api}/movies/originals/preview-files/{entity_id}/download")
-        candidates.append(f"{base_api}/pictures/originals/preview-files/{entity_id}/download")
-        candidates.append(f"{base_api}/movies/preview-files/{entity_id}/download")
-        candidates.append(f"{base_api}/pictures/preview-files/{entity_id}/download")
-        candidates.append(f"{base_no_api}/api/movies/originals/preview-files/{entity_id}/download")
-        candidates.append(f"{base_no_api}/api/pictures/originals/preview-files/{entity_id}/download")
-        
-    elif entity_type == 'output':
-        candidates.append(f"{base_api}/data/output-files/{entity_id}/download")
-        candidates.append(f"{base_api}/data/output-files/{entity_id}/file")
-        
-    elif entity_type == 'working':
-        candidates.append(f"{base_api}/data/working-files/{entity_id}/download")
-        candidates.append(f"{base_api}/data/working-files/{entity_id}/file")
-    
+    for pattern in kind_patterns(url_kind(entity_type, filename)):
+        url = expand_url_pattern(pattern, entity_id)
+        if url not in candidates: candidates.append(url)
     return candidates
 
-def download_with_auto_fix(item, headers):
+class UrlResolver:
+    """Mengingat pola URL yang berhasil per jenis file (disimpan antar run)"""
+
+    def __init__(self, filename=URL_PATTERNS_FILENAME):
+        self.filename = filename
+        self.lock = threading.Lock()
+        self.host = ""
+        self.all_hosts = {}
+        self.preferred = {}
+        self.dirty = False
+
+    def load(self, host):
+        self.host = host
+        try:
+            with open(self.filename, 'r') as f:
+                self.all_hosts = json.load(f)
+        except Exception:
+            self.all_hosts = {}
+        self.preferred = dict(self.all_hosts.get(host, {}))
+
+    def save(self):
+        with self.lock:
+            if not self.dirty: return
+            self.all_hosts[self.host] = dict(self.preferred)
+            self.dirty = False
+            data = dict(self.all_hosts)
+        try:
+            atomic_write(self.filename, lambda f: json.dump(data, f, indent=2))
+        except Exception as e:
+            print(f"[WARNING] Gagal menyimpan pola URL: {e}")
+
+    def candidates(self, item):
+        """List (pattern, url) dengan pola yang sudah terbukti di urutan pertama"""
+        kind = url_kind(item['type'], item.get('filename'))
+        ordered = []
+        if item.get('url'): ordered.append((ITEM_URL_PATTERN, item['url']))
+        for pattern in kind_patterns(kind):
+            ordered.append((pattern, expand_url_pattern(pattern, item['id'])))
+
+        best = self.preferred.get(kind)
+        if best:
+            ordered.sort(key=lambda pair: pair[0] != best)
+        seen = set()
+        result = []
+        for pattern, url in ordered:
+            if url in seen: continue
+            seen.add(url)
+            result.append((pattern, url))
+        return result
+
+    def record_success(self, item, pattern):
+        kind = url_kind(item['type'], item.get('filename'))
+        with self.lock:
+            if self.preferred.get(kind) != pattern:
+                self.preferred[kind] = pattern
+                self.dirty = True
+
+    def probe(self, queue, headers=None):
+        """Cari pola yang valid per jenis file dengan request HEAD sebelum download"""
+        samples = {}
+        for item in queue:
+            kind = url_kind(item['type'], item.get('filename'))
+            if kind not in samples: samples[kind] = item
+
+        for kind, item in samples.items():
+            for pattern, url in self.candidates(item):
+                try:
+                    r = get_http_session().head(url, headers=headers, timeout=15, allow_redirects=True)
+                    if r.status_code in (405, 501):
+                        # Server tidak mendukung HEAD, minta 1 byte saja
+                        range_headers = dict(headers or {})
+                        range_headers['Range'] = "bytes=0-0"
+                        with http_get(url, headers=range_headers, stream=True, timeout=15) as g:
+                            status = g.status_code
+                    else:
+                        status = r.status_code
+                except Exception:
+                    continue
+                if status < 400:
+                    self.record_success(item, pattern)
+                    break
+        return dict(self.preferred)
+
+URL_RESOLVER = UrlResolver()
+
+# ==========================================
+# METRICS (INSTRUMENTASI)
+# ==========================================
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+ID_SEGMENT_CHARS = set("0123456789abcdef-")
+
+def url_endpoint(url):
+    """Path URL tanpa host dan id, cth '/data/entities' atau '/data/output-files/:id/download'"""
+    path = urlparse(url).path
+    if path.startswith("/api/"): path = path[4:]
+    return "/".join(":id" if len(p) >= 32 and set(p) <= ID_SEGMENT_CHARS else p for p in path.split("/"))
+
+def prometheus_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+class Metrics:
+    """Statistik run: latency API per endpoint, waktu per fase scan, byte per worker, event per pola URL"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.started = time.time()
+            self.api = {}
+            self.phases = defaultdict(lambda: {'count': 0, 'seconds': 0.0})
+            self.workers = defaultdict(lambda: {'bytes': 0, 'files': 0, 'failed': 0, 'seconds': 0.0})
+            self.url_events = defaultdict(int)
+
+    def observe_api(self, endpoint, seconds, ok=True):
+        with self.lock:
+            stat = self.api.get(endpoint)
+            if stat is None:
+                stat = self.api[endpoint] = {'count': 0, 'errors': 0, 'seconds': 0.0, 'max': 0.0,
+                                             'buckets': [0] * len(LATENCY_BUCKETS)}
+            stat['count'] += 1
+            stat['seconds'] += seconds
+            stat['max'] = max(stat['max'], seconds)
+            if not ok: stat['errors'] += 1
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= bound:
+                    stat['buckets'][i] += 1
+                    break
+
+    @contextmanager
+    def phase(self, name):
+        start = time.time()
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.phases[name]['count'] += 1
+                self.phases[name]['seconds'] += time.time() - start
+
+    def add_bytes(self, amount, worker=None):
+        """worker: nama worker download (default thread saat ini); thread segmen memakai worker induknya"""
+        with self.lock:
+            self.workers[worker or threading.current_thread().name]['bytes'] += amount
+
+    def finish_file(self, seconds, ok, worker=None):
+        with self.lock:
+            worker = self.workers[worker or threading.current_thread().name]
+            worker['files'] += 1
+            worker['seconds'] += seconds
+            if not ok: worker['failed'] += 1
+
+    def url_event(self, pattern, event):
+        """event: attempt, retry, not_found, success"""
+        with self.lock:
+            self.url_events[(pattern, event)] += 1
+
+    def snapshot(self):
+        """Ringkasan JSON"""
+        with self.lock:
+            api = {}
+            for endpoint, stat in sorted(self.api.items(), key=lambda kv: -kv[1]['seconds']):
+                # Persentil diperkirakan dari batas atas bucket histogram
+                def quantile(q):
+                    target, seen = q * stat['count'], 0
+                    for bound, count in zip(LATENCY_BUCKETS, stat['buckets']):
+                        seen += count
+                        if seen >= target: return bound
+                    return stat['max']
+                api[endpoint] = {
+                    'count': stat['count'], 'errors': stat['errors'], 'total_seconds': round(stat['seconds'], 3),
+                    'avg_seconds': round(stat['seconds'] / stat['count'], 4), 'max_seconds': round(stat['max'], 4),
+                    'p50_le': quantile(0.5), 'p95_le': quantile(0.95),
+                }
+            workers = {name: dict(w, throughput=round(w['bytes'] / w['seconds']) if w['seconds'] else 0)
+                       for name, w in sorted(self.workers.items())}
+            url_candidates = defaultdict(dict)
+            for (pattern, event), count in sorted(self.url_events.items()):
+                url_candidates[pattern][event] = count
+            return {
+                'duration_seconds': round(time.time() - self.started, 3),
+                'api': api,
+                'scan_phases': {name: {'count': p['count'], 'seconds': round(p['seconds'], 3)} for name, p in self.phases.items()},
+                'download_workers': workers,
+                'url_candidates': dict(url_candidates),
+            }
+
+    def prometheus(self):
+        """Format textfile Prometheus (node_exporter textfile collector)"""
+        lines = []
+        def metric(name, kind, help_text):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+        with self.lock:
+            metric("kitsu_api_request_seconds", "histogram", "Latency request API metadata per endpoint")
+            for endpoint, stat in sorted(self.api.items()):
+                label = f'endpoint="{prometheus_label(endpoint)}"'
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS, stat['buckets']):
+                    cumulative += count
+                    lines.append(f'kitsu_api_request_seconds_bucket{{{label},le="{bound}"}} {cumulative}')
+                lines.append(f'kitsu_api_request_seconds_bucket{{{label},le="+Inf"}} {stat["count"]}')
+                lines.append(f"kitsu_api_request_seconds_sum{{{label}}} {stat['seconds']:.6f}")
+                lines.append(f"kitsu_api_request_seconds_count{{{label}}} {stat['count']}")
+            metric("kitsu_api_request_errors_total", "counter", "Request API metadata yang gagal per endpoint")
+            for endpoint, stat in sorted(self.api.items()):
+                lines.append(f'kitsu_api_request_errors_total{{endpoint="{prometheus_label(endpoint)}"}} {stat["errors"]}')
+            metric("kitsu_scan_phase_seconds_total", "counter", "Waktu per fase scan (dijumlah semua project)")
+            for name, p in sorted(self.phases.items()):
+                lines.append(f'kitsu_scan_phase_seconds_total{{phase="{prometheus_label(name)}"}} {p["seconds"]:.6f}')
+            metric("kitsu_download_bytes_total", "counter", "Byte yang diunduh per worker")
+            for name, w in sorted(self.workers.items()):
+                lines.append(f'kitsu_download_bytes_total{{worker="{prometheus_label(name)}"}} {w["bytes"]}')
+            metric("kitsu_download_files_total", "counter", "File yang diproses per worker")
+            for name, w in sorted(self.workers.items()):
+                lines.append(f'kitsu_download_files_total{{worker="{prometheus_label(name)}"}} {w["files"]}')
+            metric("kitsu_url_candidate_events_total", "counter", "Percobaan/retry/404/sukses per pola URL download")
+            for (pattern, event), count in sorted(self.url_events.items()):
+                lines.append(f'kitsu_url_candidate_events_total{{pattern="{prometheus_label(pattern)}",event="{event}"}} {count}')
+            metric("kitsu_run_timestamp_seconds", "gauge", "Waktu metrics ditulis")
+            lines.append(f"kitsu_run_timestamp_seconds {time.time():.0f}")
+        return "\n".join(lines) + "\n"
+
+    def export(self, json_path=None, prom_path=None):
+        try:
+            if json_path:
+                summary = self.snapshot()
+                atomic_write(json_path, lambda f: json.dump(summary, f, indent=2))
+            if prom_path:
+                text = self.prometheus()
+                atomic_write(prom_path, lambda f: f.write(text))
+        except Exception as e:
+            print(f"[WARNING] Gagal menyimpan metrics: {e}")
+
+METRICS = Metrics()
+
+# ==========================================
+# HTTP SESSION (KEEP-ALIVE POOL)
+# ==========================================
+
+HTTP_SESSION = None
+HTTP_SESSION_LOCK = threading.Lock()
+
+def build_http_session(pool_size):
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+# Dict header auth bersama: di-update di tempat saat token di-refresh, jadi semua worker ikut memakai token baru
+AUTH_HEADERS = {}
+AUTH_LOCK = threading.Lock()
+
+def get_gazu_auth_headers():
+    """Header Authorization dari token gazu.client.default_client"""
+    raw_tokens = gazu.client.default_client.tokens
+    AUTH_HEADERS["Authorization"] = f"Bearer {raw_tokens['access_token']}"
+    return AUTH_HEADERS
+
+def refresh_auth_token(failed_auth):
+    """Refresh access token lewat gazu setelah respon 401. failed_auth = header Authorization
+    yang ditolak; jika token sudah diganti thread lain, tidak di-refresh lagi. True jika ada token baru"""
+    with AUTH_LOCK:
+        if failed_auth and AUTH_HEADERS.get("Authorization") not in (None, failed_auth): return True
+        try:
+            gazu.refresh_access_token()
+        except Exception:
+            return False
+        get_gazu_auth_headers()
+        if HTTP_SESSION is not None: HTTP_SESSION.headers.update(AUTH_HEADERS)
+    # Token hasil refresh ikut disimpan agar run berikutnya tidak memakai token lama
+    save_session()
+    return True
+
+def configure_http_session(pool_size=None):
+    """Membuat session bersama dengan header auth gazu, dipakai semua thread"""
+    global HTTP_SESSION, HTTP_POOL_SIZE
+    if pool_size: HTTP_POOL_SIZE = max(1, pool_size)
+    session = build_http_session(HTTP_POOL_SIZE)
+    session.headers.update(get_gazu_auth_headers())
+    # Session internal gazu juga diberi pool yang sama besar
+    try:
+        gazu_session = gazu.client.default_client.session
+        adapter = requests.adapters.HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+        gazu_session.mount("http://", adapter)
+        gazu_session.mount("https://", adapter)
+    except Exception: pass
+    with HTTP_SESSION_LOCK:
+        old_session = HTTP_SESSION
+        HTTP_SESSION = session
+    if old_session: old_session.close()
+    return session
+
+def get_http_session():
+    global HTTP_SESSION
+    if HTTP_SESSION is None:
+        with HTTP_SESSION_LOCK:
+            if HTTP_SESSION is None:
+                HTTP_SESSION = build_http_session(HTTP_POOL_SIZE)
+    return HTTP_SESSION
+
+def http_get(url, headers=None, **kwargs):
+    """GET lewat session bersama (koneksi dipakai ulang)"""
+    return get_http_session().get(url, headers=headers, **kwargs)
+
+# Batas global request API metadata yang berjalan bersamaan (semua project)
+API_SLOTS = threading.BoundedSemaphore(MAX_API_REQUESTS)
+
+def set_api_limit(limit):
+    global API_SLOTS, MAX_API_REQUESTS
+    MAX_API_REQUESTS = max(1, limit)
+    API_SLOTS = threading.BoundedSemaphore(MAX_API_REQUESTS)
+
+def api_call(fn, *args, **kwargs):
+    """Panggilan API metadata (gazu / REST) lewat slot global"""
+    # Endpoint REST dikelompokkan per path, fungsi gazu per nama fungsi
+    endpoint = url_endpoint(args[0]) if fn is http_get else getattr(fn, '__name__', str(fn))
+    with API_SLOTS:
+        start = time.time()
+        ok = False
+        try:
+            result = fn(*args, **kwargs)
+            ok = fn is not http_get or result.status_code < 400
+            return result
+        finally:
+            METRICS.observe_api(endpoint, time.time() - start, ok)
+
+class KitsuAuthError(Exception):
+    """Server menolak token (401) dan token tidak bisa di-refresh"""
+    pass
+
+def api_get(url, headers=None, **kwargs):
+    """GET metadata dengan retry/backoff, circuit breaker dan refresh token saat 401.
+    401 yang tetap gagal setelah refresh dilempar sebagai KitsuAuthError (bukan sukses breaker).
+    Status retry (5xx/429) di percobaan terakhir tetap dihitung gagal dan dikembalikan apa adanya"""
+    breaker = circuit_breaker(url)
+    for attempt in range(RETRY_ATTEMPTS):
+        breaker.wait()
+        try:
+            r = api_call(http_get, url, headers=headers, **kwargs)
+        except requests.RequestException:
+            breaker.record_failure()
+            if attempt == RETRY_ATTEMPTS - 1: raise
+            time.sleep(backoff_delay(attempt))
+            continue
+        if r.status_code == 401:
+            if attempt < RETRY_ATTEMPTS - 1 and refresh_auth_token(r.request.headers.get("Authorization")): continue
+            r.close()
+            raise KitsuAuthError(f"Token ditolak server (401): {url_endpoint(url)}")
+        if r.status_code in RETRY_STATUSES:
+            breaker.record_failure()
+            if attempt == RETRY_ATTEMPTS - 1: return r
+            time.sleep(backoff_delay(attempt, r.headers.get("Retry-After")))
+            r.close()
+            continue
+        breaker.record_success()
+        return r
+
+# ==========================================
+# LOGIN & TOKEN TERSIMPAN
+# ==========================================
+
+def jwt_expiry(token):
+    """Waktu kedaluwarsa (claim exp) dari JWT tanpa verifikasi signature, None jika tidak terbaca"""
+    try:
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        return json.loads(base64.urlsafe_b64decode(payload)).get("exp")
+    except Exception:
+        return None
+
+def token_is_fresh(token, min_lifetime=TOKEN_MIN_LIFETIME):
+    expiry = jwt_expiry(token) if token else None
+    return expiry is not None and expiry - time.time() > min_lifetime
+
+def load_saved_session():
+    try:
+        with open(SESSION_FILENAME, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def save_session():
+    """Simpan token gazu (hanya bisa dibaca user ini) agar run berikutnya tidak perlu login ulang"""
+    if not SAVE_SESSION: return
+    try:
+        tokens = gazu.client.default_client.tokens
+        data = {"host": KITSU_HOST, "access_token": tokens.get("access_token"),
+                "refresh_token": tokens.get("refresh_token"), "saved_at": time.time()}
+        atomic_write(SESSION_FILENAME, lambda f: json.dump(data, f), file_mode=0o600)
+    except Exception as e: print(f"\n[WARNING] Gagal menyimpan token: {e}")
+
+def forget_saved_session():
+    try: os.remove(SESSION_FILENAME)
+    except OSError: pass
+
+def resume_saved_session(saved):
+    """Pakai token tersimpan untuk KITSU_HOST: access token yang masih berlaku langsung dipakai,
+    jika sudah kedaluwarsa coba refresh token. True jika tidak perlu login"""
+    if not saved or saved.get("host") != KITSU_HOST: return False
+    access_token, refresh_token = saved.get("access_token"), saved.get("refresh_token")
+    if not token_is_fresh(access_token) and not token_is_fresh(refresh_token, 0): return False
+    gazu.client.set_tokens({"access_token": access_token, "refresh_token": refresh_token})
+    if token_is_fresh(access_token): return True
+    try:
+        gazu.refresh_access_token()
+    except Exception:
+        return False
+    save_session()
+    return True
+
+def connect_to_kitsu(args):
+    """Login ke Kitsu (atau pakai token tersimpan) lalu siapkan session HTTP.
+    Return header auth, None jika gagal dan mode non-interaktif"""
+    global KITSU_HOST, SAVE_SESSION
+    SAVE_SESSION = not args.no_save_token
+    saved = load_saved_session()
+    if args.host:
+        KITSU_HOST = args.host if args.host.endswith("/api") else f"{args.host}/api"
+    while True:
+        try:
+            if not KITSU_HOST:
+                default_host = (saved or {}).get("host", "")
+                hint = f" [{default_host}]" if default_host else " (cth: http://192.168.1.50/api)"
+                host_input = input(f"URL Server Kitsu{hint}: ").strip() or default_host
+                if not host_input: continue
+                if not host_input.endswith("/api"): host_input = f"{host_input}/api"
+                KITSU_HOST = host_input
+
+            print(f"Target Server: {KITSU_HOST}")
+            gazu.client.set_host(KITSU_HOST)
+            if resume_saved_session(saved):
+                print(">> Memakai token tersimpan (belum kedaluwarsa)")
+            else:
+                user_input = args.user or input("Username/Email : ")
+                pass_input = os.environ.get("KITSU_PASSWORD") or getpass.getpass("Password       : ")
+                gazu.log_in(user_input, pass_input)
+                save_session()
+            URL_RESOLVER.load(KITSU_HOST)
+            print(">> Login BERHASIL!\n")
+            break
+        except Exception as e:
+            print(f"!! Login GAGAL: {e}\n")
+            if args.stream or args.worker: return None
+            KITSU_HOST = ""
+            saved = None
+
+    try:
+        auth_headers = get_gazu_auth_headers()
+        configure_http_session(max(args.pool_size, args.workers, args.max_api_requests))
+    except Exception as e:
+        print(f"[X] Gagal ambil token: {e}")
+        return None
+    return auth_headers
+
+# ==========================================
+# CONNECTION LIMITS
+# ==========================================
+
+HOST_SLOTS = {}
+HOST_SLOTS_LOCK = threading.Lock()
+
+@contextmanager
+def host_slot(url):
+    """Membatasi jumlah koneksi paralel ke satu host"""
+    host = urlparse(url).netloc
+    with HOST_SLOTS_LOCK:
+        slot = HOST_SLOTS.get(host)
+        if slot is None:
+            slot = threading.BoundedSemaphore(MAX_CONNECTIONS_PER_HOST)
+            HOST_SLOTS[host] = slot
+    with slot:
+        yield
+
+# ==========================================
+# SCHEDULER (URUTAN & BANDWIDTH)
+# ==========================================
+
+DOWNLOAD_ORDERS = ('scan', 'smallest', 'largest')
+
+def parse_priority_list(text):
+    """'EP02, Animation' -> ['ep02', 'animation'] (urutan = prioritas)"""
+    if not text: return []
+    return [sanitize(part).lower() for part in text.split(',') if part.strip()]
+
+def order_queue(queue, root, order='scan', priority=None):
+    """Urutkan queue download. Item yang path folder-nya (episode, sequence, shot, task type,
+    asset type) cocok dengan nama di priority didahulukan sesuai urutan daftar, lalu policy
+    ukuran: smallest = banyak file cepat tersedia, largest = throughput stabil, scan = urutan scan"""
+    if order == 'scan' and not priority: return list(queue)
+    rank_of = {name: rank for rank, name in reversed(list(enumerate(priority or [])))}
+
+    def rank(item):
+        if not rank_of: return 0
+        parts = os.path.relpath(item['folder'], root).lower().split(os.sep)
+        return min((rank_of[part] for part in parts if part in rank_of), default=len(rank_of))
+
+    if order == 'smallest': key = lambda item: (rank(item), item.get('size') or 0)
+    elif order == 'largest': key = lambda item: (rank(item), -(item.get('size') or 0))
+    else: key = rank
+    return sorted(queue, key=key)
+
+class RateSchedule:
+    """Aturan limit bandwidth per jam: '08:00-18:00=5M,20M' -> 5 MB/s jam kerja, 20 MB/s selain itu.
+    Rentang boleh melewati tengah malam (22:00-06:00). Rate 0 = tanpa batas"""
+
+    def __init__(self, spec):
+        self.spec = spec
+        self.rules = []
+        self.default = 0
+        for part in str(spec).split(','):
+            part = part.strip()
+            if not part: continue
+            if '=' in part:
+                window, rate = part.split('=', 1)
+                start, end = (self.parse_clock(t) for t in window.split('-', 1))
+                self.rules.append((start, end, parse_size(rate)))
+            else:
+                self.default = parse_size(part)
+
+    @staticmethod
+    def parse_clock(text):
+        hour, minute = text.strip().split(':')
+        if not (0 <= int(hour) <= 24 and 0 <= int(minute) < 60): raise ValueError(f"Jam tidak valid: {text}")
+        return int(hour) * 60 + int(minute)
+
+    def rate_at(self, now=None):
+        now = now or datetime.now()
+        minute = now.hour * 60 + now.minute
+        for start, end, rate in self.rules:
+            if (start <= minute < end) if start <= end else (minute >= start or minute < end):
+                return rate
+        return self.default
+
+class BandwidthLimiter:
+    """Token bucket global untuk semua worker dan segmen (byte/detik, 0 = tanpa batas).
+    Rate bisa berubah selama download: set_rate(), aturan jam, atau file limit (--limit-rate @FILE)
+    yang dibaca ulang saat isinya berubah"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.rate = 0
+        self.tokens = 0.0
+        self.last = time.monotonic()
+        self.schedule = None
+        self.spec_file = None
+        self.spec_mtime = None
+        self.next_check = 0
+
+    def configure(self, spec):
+        """spec: '10M', '08:00-18:00=5M,0', atau '@path' ke file berisi spec tersebut"""
+        if spec and spec.startswith('@'):
+            self.spec_file = os.path.expanduser(spec[1:])
+            self.schedule = RateSchedule(self.read_spec_file() or 0)
+        else:
+            self.schedule = RateSchedule(spec or 0)
+        self.set_rate(self.schedule.rate_at())
+
+    def read_spec_file(self):
+        try:
+            self.spec_mtime = os.stat(self.spec_file).st_mtime
+            with open(self.spec_file, 'r') as f:
+                return f.read().strip()
+        except OSError:
+            return None
+
+    def set_rate(self, rate):
+        with self.lock:
+            self.rate = max(0, rate or 0)
+            self.tokens = min(self.tokens, self.rate)
+
+    def refresh(self):
+        """Cek aturan jam / file limit paling sering sekali per LIMIT_CHECK_SECONDS"""
+        now = time.monotonic()
+        if self.schedule is None or now < self.next_check: return
+        self.next_check = now + LIMIT_CHECK_SECONDS
+        if self.spec_file:
+            try: changed = os.stat(self.spec_file).st_mtime != self.spec_mtime
+            except OSError: changed = False
+            if changed:
+                try: self.schedule = RateSchedule(self.read_spec_file() or 0)
+                except ValueError as e: print(f"\n[WARNING] File limit bandwidth tidak valid: {e}")
+        rate = self.schedule.rate_at()
+        if rate != self.rate: self.set_rate(rate)
+
+    def consume(self, amount):
+        """Ambil token untuk amount byte; tidur jika bucket kurang. Return detik menunggu"""
+        self.refresh()
+        with self.lock:
+            if not self.rate: return 0
+            now = time.monotonic()
+            # Burst maksimal satu detik rate; token boleh minus (antrian worker lain ikut menunggu)
+            self.tokens = min(self.rate, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            self.tokens -= amount
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait: time.sleep(wait)
+        return wait
+
+    def describe(self):
+        return f"limit {format_bytes(self.rate)}/s" if self.rate else ""
+
+BANDWIDTH = BandwidthLimiter()
+
+# ==========================================
+# RETRY POLICY
+# ==========================================
+
+def parse_retry_after(value):
+    """Header Retry-After (detik atau HTTP-date) -> detik, None jika tidak valid"""
+    if not value: return None
+    try: return max(0.0, float(value))
+    except ValueError: pass
+    try: return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError): return None
+
+def backoff_delay(attempt, retry_after=None):
+    """Exponential backoff dengan full jitter; Retry-After dari server diutamakan"""
+    wait = parse_retry_after(retry_after)
+    if wait is not None: return min(wait, BREAKER_MAX_COOLDOWN)
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * (2 ** attempt)))
+
+class CircuitBreaker:
+    """Endpoint yang gagal berturut-turut dijeda (cooldown naik 2x tiap kali terbuka lagi),
+    worker yang memakai endpoint itu menunggu sampai cooldown habis"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.failures = 0
+        self.cooldown = BREAKER_COOLDOWN
+        self.open_until = 0
+
+    def wait(self):
+        while True:
+            with self.lock:
+                remaining = self.open_until - time.time()
+            if remaining <= 0: return
+            time.sleep(min(remaining, 1.0))
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.cooldown = BREAKER_COOLDOWN
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.failures < BREAKER_THRESHOLD or self.open_until > time.time(): return
+            self.open_until = time.time() + self.cooldown
+            self.cooldown = min(self.cooldown * 2, BREAKER_MAX_COOLDOWN)
+            # Setelah cooldown, satu kegagalan lagi langsung membuka breaker (half-open)
+            self.failures = BREAKER_THRESHOLD - 1
+
+CIRCUIT_BREAKERS = {}
+CIRCUIT_BREAKERS_LOCK = threading.Lock()
+
+def endpoint_key(url):
+    """Host + awal path tanpa id, cth 'host/api/data/output-files' atau 'host/api/movies/originals'"""
+    parsed = urlparse(url)
+    parts = [p for p in parsed.path.split('/') if p][:3]
+    return parsed.netloc + "/" + "/".join(parts)
+
+def circuit_breaker(url):
+    key = endpoint_key(url)
+    with CIRCUIT_BREAKERS_LOCK:
+        breaker = CIRCUIT_BREAKERS.get(key)
+        if breaker is None:
+            breaker = CIRCUIT_BREAKERS[key] = CircuitBreaker()
+    return breaker
+
+class DownloadStalled(Exception):
+    pass
+
+class StallDetector:
+    """Throughput diukur per jendela STALL_WINDOW detik, bukan timeout baca tetap"""
+
+    def __init__(self):
+        self.window_start = time.time()
+        self.window_bytes = 0
+
+    def exclude(self, seconds):
+        """Waktu menunggu limit bandwidth tidak dihitung sebagai download lambat"""
+        self.window_start += seconds
+
+    def update(self, amount):
+        self.window_bytes += amount
+        elapsed = time.time() - self.window_start
+        if elapsed < STALL_WINDOW: return
+        if self.window_bytes / elapsed < STALL_MIN_SPEED:
+            raise DownloadStalled(f"{self.window_bytes / elapsed:.0f} B/s selama {elapsed:.0f} detik")
+        self.window_start = time.time()
+        self.window_bytes = 0
+
+def iter_response_chunks(response, chunk_size=524288):
+    """Chunk dikembalikan begitu data tiba (read1), supaya StallDetector tetap jalan walau data menetes pelan"""
+    read1 = getattr(response.raw, 'read1', None)
+    # read1 membaca byte mentah tanpa decode: respon terkompresi (server mengabaikan
+    # Accept-Encoding: identity) harus lewat iter_content
+    encoding = response.headers.get('Content-Encoding', 'identity').strip().lower()
+    if read1 is None or encoding not in ('', 'identity'):
+        # urllib3 lama: chunk kecil agar throughput tetap bisa dipantau
+        yield from response.iter_content(chunk_size=65536)
+        return
+    while True:
+        chunk = read1(chunk_size)
+        if not chunk: return
+        yield chunk
+
+def load_partial_meta(temp_filepath):
+    """Info resume (url, etag, total) untuk file .tmp yang belum selesai"""
+    try:
+        with open(temp_filepath + ".json", 'r') as f:
+            return json.load(f)
+    except Exception:
+        return None
+
+def save_partial_meta(temp_filepath, meta):
+    try:
+        with open(temp_filepath + ".json", 'w') as f:
+            json.dump(meta, f)
+    except Exception: pass
+
+def discard_partial(temp_filepath):
+    for path in (temp_filepath, temp_filepath + ".json"):
+        if os.path.exists(path):
+            try: os.remove(path)
+            except: pass
+
+def preallocate_file(fd, size):
+    try:
+        os.posix_fallocate(fd, 0, size)
+    except (AttributeError, OSError):
+        os.ftruncate(fd, size)
+
+def write_at(fd, data, offset, lock=None):
+    """Positional write (pwrite); di platform tanpa pwrite memakai lseek + write dengan lock"""
+    if hasattr(os, 'pwrite'):
+        view = memoryview(data)
+        while view:
+            written = os.pwrite(fd, view, offset)
+            view = view[written:]
+            offset += written
+        return
+    with lock:
+        os.lseek(fd, offset, os.SEEK_SET)
+        os.write(fd, data)
+
+def download_segmented(url, headers, temp_filepath, progress=None):
+    """Download satu file besar dalam beberapa range paralel ke .tmp yang sudah dialokasikan.
+    Return True jika .tmp lengkap, None jika server tidak mendukung Range (pakai satu stream).
+    Error segmen dilempar ke pemanggil; segmen yang sudah selesai dicatat di .tmp.json untuk resume"""
+    req_headers = dict(headers or {})
+    req_headers['Accept-Encoding'] = 'identity'
+    with host_slot(url), http_get(url, headers=dict(req_headers, Range="bytes=0-0"), stream=True,
+                                  timeout=(CONNECT_TIMEOUT, STALL_WINDOW), allow_redirects=True) as r:
+        if r.status_code != 206: return None
+        start, total = parse_content_range(r.headers.get('content-range', ''))
+        etag = r.headers.get('etag')
+    if start != 0 or not total or total < SEGMENT_THRESHOLD: return None
+
+    meta = load_partial_meta(temp_filepath)
+    same_file = (meta and meta.get('segments') and meta.get('url') == url and meta.get('total') == total
+                 and meta.get('etag') == etag and os.path.exists(temp_filepath))
+    if not same_file:
+        discard_partial(temp_filepath)
+        segments = [[pos, min(pos + SEGMENT_SIZE, total) - 1, False] for pos in range(0, total, SEGMENT_SIZE)]
+        meta = {'url': url, 'etag': etag, 'total': total, 'segments': segments}
+    fd = os.open(temp_filepath, os.O_RDWR | os.O_CREAT | getattr(os, 'O_BINARY', 0))
+    meta_lock = threading.Lock()
+    write_lock = threading.Lock()
+    # Diset saat satu segmen gagal: segmen lain berhenti di chunk berikutnya
+    cancel = threading.Event()
+    # Byte dari thread segmen dihitung untuk worker download yang memanggil
+    worker = threading.current_thread().name
+    try:
+        if not same_file:
+            preallocate_file(fd, total)
+            save_partial_meta(temp_filepath, meta)
+
+        def fetch_segment(segment):
+            seg_start, seg_end, _ = segment
+            if cancel.is_set(): return
+            range_headers = dict(req_headers, Range=f"bytes={seg_start}-{seg_end}")
+            if etag and not etag.startswith('W/'): range_headers['If-Range'] = etag
+            with host_slot(url), http_get(url, headers=range_headers, stream=True,
+                                          timeout=(CONNECT_TIMEOUT, STALL_WINDOW), allow_redirects=True) as r:
+                r.raise_for_status()
+                if r.status_code != 206 or parse_content_range(r.headers.get('content-range', ''))[0] != seg_start:
+                    raise IOError("Server mengirim range yang tidak sesuai")
+                pos = seg_start
+                stall = StallDetector()
+                for chunk in iter_response_chunks(r):
+                    if cancel.is_set(): return
+                    chunk = chunk[:seg_end + 1 - pos]
+                    if not chunk: break
+                    write_at(fd, chunk, pos, write_lock)
+                    pos += len(chunk)
+                    METRICS.add_bytes(len(chunk), worker)
+                    if progress: progress.add_bytes(len(chunk))
+                    stall.update(len(chunk))
+                    stall.exclude(BANDWIDTH.consume(len(chunk)))
+            if pos != seg_end + 1: raise IOError(f"Segmen {seg_start}-{seg_end} tidak lengkap")
+            with meta_lock:
+                segment[2] = True
+                save_partial_meta(temp_filepath, meta)
+
+        pending = [segment for segment in meta['segments'] if not segment[2]]
+        with ThreadPoolExecutor(max_workers=max(1, SEGMENT_CONNECTIONS)) as executor:
+            futures = [executor.submit(fetch_segment, segment) for segment in pending]
+            done, not_done = wait(futures, return_when=FIRST_EXCEPTION)
+            failed = next((future for future in futures if future in done and future.exception()), None)
+            if failed:
+                cancel.set()
+                for future in not_done: future.cancel()
+                raise failed.exception()
+    finally:
+        os.close(fd)
+    return True
+
+def parse_content_range(value):
+    """'bytes 100-199/1000' -> (100, 1000). Total None jika '*'"""
+    try:
+        unit, _, spec = value.partition(' ')
+        span, _, total = spec.partition('/')
+        start = int(span.split('-')[0])
+        return start, (int(total) if total and total != '*' else None)
+    except Exception:
+        return None, None
+
+def download_with_auto_fix(item, headers, progress=None, manifest=None):
     folder = item['folder']
     filename = item['filename']
     
-    try:
-        if not os.path.exists(folder):
-            os.makedirs(folder, exist_ok=True)
-        if not os.access(folder, os.W_OK):
-            return False
-    except Exception as e:
+    # Folder yang sudah disiapkan preflight tidak dicek ulang per file
+    if folder not in PREPARED_FOLDERS and prepare_folders([item]):
         return False
     
     filepath = os.path.join(folder, filename)
     temp_filepath = filepath + ".tmp"
     
     if os.path.exists(filepath):
+        # File final hanya dibuat lewat rename setelah validasi, jadi cukup cek ukuran (harus persis,
+        # file 0 byte tidak pernah dianggap selesai) lalu cocokkan dengan manifest
         file_size = os.path.getsize(filepath)
-        expected_size = item.get('size', 0)
-        if file_size > 1000000 or (expected_size > 0 and file_size >= expected_size * 0.95):
+        expected_size = item.get('size') or 0
+        size_ok = file_size > 0 and (not expected_size or file_size == expected_size)
+        if size_ok and (manifest is None or manifest.allows_existing(item, file_size)):
             return True
-        elif file_size < 1000000:
-            try: os.remove(filepath)
-            except: pass
-
-    url_list = []
-    if item.get('url'): url_list.append(item['url'])
-    url_list.extend(generate_url_candidates(item['type'], item['id']))
+        try: os.remove(filepath)
+        except: pass
 
-    for url in url_list:
-        for attempt in range(3):
+    for pattern, url in URL_RESOLVER.candidates(item):
+        breaker = circuit_breaker(url)
+        # File besar: beberapa range paralel, kecuali ada .tmp satu-stream yang bisa dilanjutkan
+        meta = load_partial_meta(temp_filepath)
+        use_segments = (SEGMENT_CONNECTIONS > 1 and item.get('size', 0) >= SEGMENT_THRESHOLD
+                        and not (meta and meta.get('url') == url and not meta.get('segments')))
+        for attempt in range(RETRY_ATTEMPTS):
+            breaker.wait()
+            METRICS.url_event(pattern, 'attempt')
             try:
-                timeout = (30, 600)
-                with requests.get(url, headers=headers, stream=True, timeout=timeout, allow_redirects=True) as r:
-                    if r.status_code in [404, 403]: break 
-                    r.raise_for_status()
-                    
-                    content_length = r.headers.get('content-length')
-                    expected_bytes = int(content_length) if content_length else 0
-                    
-                    with open(temp_filepath, 'wb') as f:
-                        for chunk in r.iter_content(chunk_size=524288):
-                            if chunk: f.write(chunk)
+                if use_segments:
+                    if download_segmented(url, headers, temp_filepath, progress=progress):
+                        os.replace(temp_filepath, filepath)
+                        discard_partial(temp_filepath)
+                        URL_RESOLVER.record_success(item, pattern)
+                        breaker.record_success()
+                        METRICS.url_event(pattern, 'success')
+                        return True
+                    use_segments = False
+
+                # Read timeout = jendela stall: socket diam selama itu juga dianggap macet
+                timeout = (CONNECT_TIMEOUT, STALL_WINDOW)
+                req_headers = dict(headers or {})
+                req_headers['Accept-Encoding'] = 'identity'
+
+                # Lanjutkan .tmp lama jika berasal dari URL yang sama
+                offset = 0
+                meta = load_partial_meta(temp_filepath)
+                if meta and meta.get('segments'):
+                    # .tmp hasil segmen sudah dialokasikan penuh, ukurannya bukan progress
+                    discard_partial(temp_filepath)
+                    meta = None
+                if meta and meta.get('url') == url and os.path.exists(temp_filepath):
+                    offset = os.path.getsize(temp_filepath)
+                if offset > 0:
+                    req_headers['Range'] = f"bytes={offset}-"
+                    etag = meta.get('etag')
+                    if etag and not etag.startswith('W/'): req_headers['If-Range'] = etag
+
+                with host_slot(url), http_get(url, headers=req_headers, stream=True, timeout=timeout, allow_redirects=True) as r:
+                    # 401 ditangani di except bersama 401 dari segmen
+                    if r.status_code == 401: r.raise_for_status()
+                    if r.status_code in [404, 403]:
+                        breaker.record_success()
+                        METRICS.url_event(pattern, 'not_found')
+                        break 
+                    if r.status_code == 416 and offset > 0:
+                        # Range di luar file: .tmp sudah lengkap atau tidak cocok lagi
+                        _, total = parse_content_range(r.headers.get('content-range', ''))
+                        if total is None or total != offset or meta.get('total') not in (None, offset):
+                            discard_partial(temp_filepath)
+                            continue
+                        expected_bytes = total
+                    else:
+                        r.raise_for_status()
+                        etag = r.headers.get('etag')
+                        content_length = r.headers.get('content-length')
+                        mode = 'wb'
+
+                        if r.status_code == 206 and offset > 0:
+                            start, total = parse_content_range(r.headers.get('content-range', ''))
+                            same_etag = not meta.get('etag') or not etag or meta.get('etag') == etag
+                            same_total = meta.get('total') in (None, total)
+                            if start == offset and same_etag and same_total:
+                                mode = 'ab'
+                                expected_bytes = total or 0
+                            else:
+                                # File di server berubah, mulai dari nol
+                                discard_partial(temp_filepath)
+                                continue
+                        else:
+                            # Server mengabaikan Range: download penuh
+                            offset = 0
+                            expected_bytes = int(content_length) if content_length else 0
+
+                        save_partial_meta(temp_filepath, {'url': url, 'etag': etag, 'total': expected_bytes or None})
+                        stall = StallDetector()
+                        with open(temp_filepath, mode) as f:
+                            if expected_bytes: reserve_file_space(f.fileno(), expected_bytes)
+                            for chunk in iter_response_chunks(r):
+                                if chunk:
+                                    f.write(chunk)
+                                    METRICS.add_bytes(len(chunk))
+                                    if progress: progress.add_bytes(len(chunk))
+                                    stall.update(len(chunk))
+                                    stall.exclude(BANDWIDTH.consume(len(chunk)))
                     
                     temp_size = os.path.getsize(temp_filepath)
                     is_valid = False
                     
                     if expected_bytes > 0:
-                        is_valid = temp_size >= expected_bytes * 0.95
+                        is_valid = temp_size == expected_bytes
                     elif temp_size > 1000000: is_valid = True
                     elif temp_size > 100000: is_valid = True
                     
@@ -162,45 +1366,652 @@ def download_with_auto_fix(item, headers):
                             try: os.remove(filepath)
                             except: pass
                         os.rename(temp_filepath, filepath)
+                        discard_partial(temp_filepath)
+                        URL_RESOLVER.record_success(item, pattern)
+                        breaker.record_success()
+                        METRICS.url_event(pattern, 'success')
                         return True
                     else:
-                        if os.path.exists(temp_filepath): os.remove(temp_filepath)
-                        if attempt < 2: time.sleep(2)
+                        discard_partial(temp_filepath)
+                        METRICS.url_event(pattern, 'retry')
+                        if attempt < RETRY_ATTEMPTS - 1: time.sleep(backoff_delay(attempt))
                         continue
                         
-            except Exception:
-                if os.path.exists(temp_filepath):
-                    try: os.remove(temp_filepath)
-                    except: pass
-                if attempt < 2:
-                    time.sleep(2)
+            except Exception as e:
+                # .tmp disimpan agar percobaan berikutnya bisa resume
+                response = getattr(e, 'response', None)
+                status = response.status_code if response is not None else None
+                if status == 401:
+                    if attempt < RETRY_ATTEMPTS - 1 and refresh_auth_token(response.request.headers.get('Authorization')): continue
+                    # Token mati berlaku untuk semua file, jadi download dihentikan (bukan file gagal)
+                    raise KitsuAuthError(f"Token ditolak server (401): {url_endpoint(url)}")
+                # Error client selain 401/404/403 (mis. 400, 410) tidak akan berubah dengan retry
+                if status is not None and status not in RETRY_STATUSES: break
+                breaker.record_failure()
+                METRICS.url_event(pattern, 'retry')
+                if attempt < RETRY_ATTEMPTS - 1:
+                    time.sleep(backoff_delay(attempt, response.headers.get('Retry-After') if response is not None else None))
                     continue
                 break
     
-    if os.path.exists(temp_filepath):
-        try: os.remove(temp_filepath)
-        except: pass
-    
     return False
 
+# ==========================================
+# DOWNLOAD MANIFEST
+# ==========================================
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(4194304), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+class DownloadManifest:
+    """Catatan file yang sudah selesai di download_root, key = file id Kitsu"""
+
+    def __init__(self, root):
+        self.root = root
+        self.path = os.path.join(root, MANIFEST_FILENAME)
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.path_owners = {}
+        self.unsaved = 0
+
+    def load(self):
+        try:
+            with open(self.path, 'r') as f:
+                self.entries = json.load(f).get("files", {})
+        except Exception:
+            self.entries = {}
+        self.path_owners = {entry.get('path'): file_id for file_id, entry in self.entries.items()}
+        return self
+
+    def save(self):
+        with self.lock:
+            data = {"version": 1, "files": dict(self.entries)}
+            self.unsaved = 0
+        try:
+            os.makedirs(self.root, exist_ok=True)
+            atomic_write(self.path, lambda f: json.dump(data, f, separators=(',', ':')))
+        except Exception as e:
+            print(f"\n[WARNING] Gagal menyimpan manifest: {e}")
+
+    def relpath(self, item):
+        return os.path.relpath(os.path.join(item['folder'], item['filename']), self.root)
+
+    def record(self, item, checksum=False):
+        """Catat item yang sudah ada di disk (size, mtime, revision, sha256 opsional)"""
+        filepath = os.path.join(item['folder'], item['filename'])
+        try:
+            st = os.stat(filepath)
+        except OSError:
+            return
+        entry = {
+            'path': self.relpath(item), 'size': st.st_size, 'mtime': int(st.st_mtime),
+            'revision': item.get('revision'),
+        }
+        old = self.entries.get(item['id'])
+        if checksum:
+            entry['sha256'] = file_sha256(filepath)
+        elif old and old.get('sha256') and old.get('size') == st.st_size and old.get('mtime') == int(st.st_mtime):
+            entry['sha256'] = old['sha256']
+        with self.lock:
+            self.entries[item['id']] = entry
+            self.path_owners[entry['path']] = item['id']
+            self.unsaved += 1
+            should_save = self.unsaved >= MANIFEST_SAVE_EVERY
+        if should_save: self.save()
+
+    def allows_existing(self, item, size):
+        """File yang sudah ada di path item boleh dipakai tanpa download?
+        Path yang tercatat milik file id lain (revisi lain dengan nama sama) tidak dipakai"""
+        entry = self.entries.get(item['id'])
+        if entry: return entry.get('size') == size
+        return self.path_owners.get(self.relpath(item)) in (None, item['id'])
+
+    def path_owner(self, item):
+        """File id lain yang tercatat memiliki path item dan filenya masih lengkap di disk, atau None"""
+        relpath = self.relpath(item)
+        owner = self.path_owners.get(relpath)
+        entry = self.entries.get(owner) if owner not in (None, item['id']) else None
+        if entry is None: return None
+        try:
+            return owner if os.path.getsize(os.path.join(self.root, relpath)) == entry.get('size') else None
+        except OSError:
+            return None
+
+    def filter_pending(self, queue):
+        """Pisahkan item yang sudah lengkap menurut manifest (satu scandir per folder).
+        Return (pending, skipped); item skipped tetap dibutuhkan sebagai pemilik path-nya"""
+        dir_listing = {}
+        pending = []
+        skipped = []
+        for item in queue:
+            if self.is_complete(item, dir_listing): skipped.append(item)
+            else: pending.append(item)
+        return pending, skipped
+
+    def is_complete(self, item, dir_listing):
+        entry = self.entries.get(item['id'])
+        return bool(entry) and self.entry_matches(item, entry, dir_listing)
+
+    def entry_matches(self, item, entry, dir_listing):
+        if entry.get('path') != self.relpath(item): return False
+        if item.get('revision') is not None and entry.get('revision') not in (None, item['revision']):
+            return False
+        folder = item['folder']
+        if folder not in dir_listing:
+            listing = {}
+            try:
+                with os.scandir(folder) as it:
+                    for de in it:
+                        if de.is_file():
+                            st = de.stat()
+                            listing[de.name] = (st.st_size, int(st.st_mtime))
+            except OSError: pass
+            dir_listing[folder] = listing
+        return dir_listing[folder].get(item['filename']) == (entry.get('size'), entry.get('mtime'))
+
+def verify_download_root(root, queue=None, workers=None):
+    """Hash ulang semua file di manifest secara paralel.
+    Return dict: ok, missing, corrupt, stale, unchecked (list path)"""
+    manifest = DownloadManifest(root).load()
+    # Revisi baru di Kitsu = file id baru dengan path yang sama, jadi stale dicek lewat path
+    current_owners = {os.path.relpath(item_path(item), root): item['id'] for item in (queue or [])}
+    report = {'ok': [], 'missing': [], 'corrupt': [], 'stale': [], 'unchecked': []}
+    report_lock = threading.Lock()
+    done = 0
+
+    def check(file_id, entry):
+        # Path sudah dipakai file id lain (revisi lebih baru) -> isi file bukan milik entry ini lagi
+        owner = current_owners.get(os.path.normpath(entry['path']))
+        if owner is not None and owner != file_id: return 'stale', None
+        path = os.path.join(root, entry['path'])
+        if not os.path.exists(path): return 'missing', None
+        if os.path.getsize(path) != entry.get('size'): return 'corrupt', None
+        digest = file_sha256(path)
+        if entry.get('sha256') and digest != entry['sha256']: return 'corrupt', None
+        return ('ok' if entry.get('sha256') else 'unchecked'), digest
+
+    def worker(pair):
+        nonlocal done
+        file_id, entry = pair
+        try: status, digest = check(file_id, entry)
+        except OSError: status, digest = 'corrupt', None
+        with report_lock:
+            report[status].append(entry['path'])
+            done += 1
+            sys.stdout.write(f"\r>> Verifikasi {done}/{len(manifest.entries)} file")
+            sys.stdout.flush()
+        if status == 'unchecked':
+            # Checksum pertama dicatat agar verifikasi berikutnya bisa mendeteksi korupsi
+            manifest.entries[file_id]['sha256'] = digest
+
+    with ThreadPoolExecutor(max_workers=max(1, workers or DOWNLOAD_WORKERS)) as executor:
+        list(executor.map(worker, list(manifest.entries.items())))
+    if report['unchecked']: manifest.save()
+    return report
+
+# ==========================================
+# DEDUP & CONTENT STORE
+# ==========================================
+
+def item_path(item):
+    return os.path.join(item['folder'], item['filename'])
+
+def link_or_copy(src, dst):
+    """Hardlink src ke dst (atomic lewat file sementara), copy jika beda filesystem"""
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    try:
+        if os.path.samefile(src, dst): return
+    except OSError: pass
+    tmp_path = dst + ".link"
+    if os.path.exists(tmp_path): os.remove(tmp_path)
+    try:
+        os.link(src, tmp_path)
+    except OSError:
+        shutil.copy2(src, tmp_path)
+    os.replace(tmp_path, dst)
+
+def file_matches(path, size):
+    try: return os.path.getsize(path) == size if size else os.path.exists(path)
+    except OSError: return False
+
+class ContentStore:
+    """Store lokal bersama antar project/run. File Kitsu tidak berubah per id (revisi baru = id baru),
+    jadi object disimpan per tipe + file id"""
+
+    def __init__(self, root):
+        self.root = root
+        self.hits = 0
+
+    def object_path(self, item):
+        return os.path.join(self.root, item['type'], item['id'][:2], item['id'])
+
+    def fetch(self, item):
+        """Link object dari store ke path tujuan, True jika berhasil (tanpa download)"""
+        obj = self.object_path(item)
+        if not file_matches(obj, item.get('size', 0)): return False
+        dest = item_path(item)
+        try:
+            if not file_matches(dest, item.get('size', 0)): link_or_copy(obj, dest)
+        except OSError:
+            return False
+        self.hits += 1
+        return True
+
+    def put(self, item):
+        obj = self.object_path(item)
+        if file_matches(obj, item.get('size', 0)): return
+        try: link_or_copy(item_path(item), obj)
+        except OSError: pass
+
+class DownloadDeduper:
+    """Item dengan tipe + file id sama hanya didownload sekali, path lainnya dibuat hardlink.
+    File berbeda dengan path tujuan sama (revisi bernama sama) tidak boleh menimpa file pertama:
+    item tersebut dilaporkan bentrok (ok = None), bukan sukses. Antar run, pemilik path yang
+    tercatat di manifest tetap menang selama masih ada di queue.
+    Item yang sudah selesai hanya disimpan sebagai path + status (memori tetap kecil saat streaming)"""
+
+    def __init__(self, store=None, manifest=None):
+        self.lock = threading.Lock()
+        self.entries = {} # (tipe, id) -> {'path', 'ok'} (+ primary/aliases/collided selama didownload)
+        self.paths = {} # path tujuan -> (tipe, id) pemiliknya
+        # file id di queue yang belum diproses (mode streaming), untuk cek pemilik path di manifest
+        self.waiting = {}
+        self.store = store
+        self.manifest = manifest
+
+    def expect(self, items):
+        """Catat item yang masuk queue sebelum diproses (dipanggil per entity oleh QueueSink)"""
+        with self.lock:
+            for item in items: self.waiting[item['id']] = self.waiting.get(item['id'], 0) + 1
+
+    def processed(self, item):
+        count = self.waiting.get(item['id'], 0) - 1
+        if count > 0: self.waiting[item['id']] = count
+        else: self.waiting.pop(item['id'], None)
+
+    def skip(self, item):
+        """Item yang dilewati karena sudah lengkap menurut manifest tetap memiliki path-nya"""
+        with self.lock:
+            self.processed(item)
+            key = (item['type'], item['id'])
+            path = item_path(item)
+            self.entries.setdefault(key, {'path': path, 'ok': True})
+            self.paths.setdefault(path, key)
+
+    def fetch(self, item, headers, progress=None):
+        """Proses satu item, return list (item, ok, linked) yang selesai; ok None = bentrok path.
+        Alias/bentrok yang primary-nya masih didownload diselesaikan oleh worker primary."""
+        key = (item['type'], item['id'])
+        path = item_path(item)
+        recorded = self.manifest.path_owner(item) if self.manifest is not None else None
+        with self.lock:
+            self.processed(item)
+            entry = self.entries.get(key)
+            owner_key = self.paths.get(path)
+            if owner_key is None and recorded in self.waiting:
+                # File lengkap dari run sebelumnya milik item lain yang masih di queue: jangan ditimpa
+                return [(item, None, False)]
+            if owner_key is not None and owner_key != key:
+                # Path sudah dipakai file lain: tunggu file itu selesai, lalu laporkan bentrok
+                owner = self.entries[owner_key]
+                if owner['ok'] is None:
+                    owner['collided'].append(item)
+                    return []
+                return [(item, None, False)]
+            if entry is None:
+                entry = self.entries[key] = {'path': path, 'primary': item, 'ok': None, 'aliases': [], 'collided': []}
+            self.paths[path] = key
+            if entry['ok'] is None and entry['primary'] is not item:
+                entry['aliases'].append(item)
+                return []
+        if entry.get('primary') is not item:
+            return [self.link_alias(entry, item)]
+
+        start = time.time()
+        linked = bool(self.store) and self.store.fetch(item)
+        ok = linked or download_with_auto_fix(item, headers=headers, progress=progress, manifest=self.manifest)
+        METRICS.finish_file(time.time() - start, ok)
+        if ok and self.store and not linked: self.store.put(item)
+        with self.lock:
+            aliases, collided = entry['aliases'], entry['collided']
+            # Objek item dilepas, yang tersisa hanya path dan status
+            entry = self.entries[key] = {'path': entry['path'], 'ok': ok}
+        return ([(item, ok, linked)] + [self.link_alias(entry, alias) for alias in aliases]
+                + [(other, None, False) for other in collided])
+
+    def link_alias(self, entry, item):
+        if not entry['ok']: return item, False, False
+        try:
+            src = entry['path']
+            if not file_matches(item_path(item), os.path.getsize(src)): link_or_copy(src, item_path(item))
+            return item, True, True
+        except OSError:
+            return item, False, False
+
+# ==========================================
+# PREFLIGHT (FOLDER & RUANG DISK)
+# ==========================================
+
+PREPARED_FOLDERS = set() # Folder yang sudah dibuat + dicek izin tulisnya oleh preflight
+FALLOC_FL_KEEP_SIZE = 0x01
+LIBC_FALLOCATE = []
+
+class InsufficientDiskSpace(Exception):
+    pass
+
+def reserve_file_space(fd, size):
+    """Alokasikan blok untuk .tmp tanpa mengubah ukurannya (fallocate KEEP_SIZE, Linux), jadi
+    ukuran .tmp tetap menandai progress resume. Filesystem yang tidak mendukung dilewati saja"""
+    if not LIBC_FALLOCATE:
+        fallocate = None
+        if sys.platform.startswith('linux'):
+            try:
+                fallocate = ctypes.CDLL(None, use_errno=True).fallocate
+                fallocate.argtypes = (ctypes.c_int, ctypes.c_int, ctypes.c_longlong, ctypes.c_longlong)
+            except (OSError, AttributeError):
+                fallocate = None
+        LIBC_FALLOCATE.append(fallocate)
+    fallocate = LIBC_FALLOCATE[0]
+    return bool(fallocate) and size > 0 and fallocate(fd, FALLOC_FL_KEEP_SIZE, 0, size) == 0
+
+def prepare_folders(queue):
+    """Buat setiap folder unik satu kali dan cek izin tulis. Return set folder yang gagal"""
+    failed = set()
+    for folder in {item['folder'] for item in queue} - PREPARED_FOLDERS:
+        try:
+            os.makedirs(folder, exist_ok=True)
+            if not os.access(folder, os.W_OK): raise PermissionError(folder)
+            PREPARED_FOLDERS.add(folder)
+        except OSError:
+            failed.add(folder)
+    return failed
+
+def tmp_allocated(item):
+    """Byte blok disk yang sudah dialokasikan untuk .tmp item"""
+    try: return os.stat(item_path(item) + ".tmp").st_blocks * 512
+    except (OSError, AttributeError): return 0
+
+def bytes_still_needed(item):
+    """Byte yang masih harus ditulis: 0 jika file final sudah lengkap, dikurangi blok .tmp yang sudah teralokasi"""
+    size = item.get('size') or 0
+    try:
+        # Sama dengan download_with_auto_fix: file final dipakai hanya jika ukurannya persis
+        if size and os.path.getsize(item_path(item)) == size: return 0
+    except OSError: pass
+    return max(0, size - tmp_allocated(item))
+
+def disk_free(path):
+    """Ruang kosong di filesystem path; path yang belum dibuat dicek lewat folder induk terdekat"""
+    while not os.path.exists(path) and os.path.dirname(path) != path:
+        path = os.path.dirname(path)
+    try: return shutil.disk_usage(path).free
+    except OSError: return None
+
+def preflight_plan(queue, root, reserve=None):
+    """Satu kali jalan atas queue: hitung byte yang masih dibutuhkan dibanding ruang kosong
+    di root (statvfs). File yang sama (tipe + id / path) dihitung sekali karena duplikat di-hardlink.
+    Tidak membuat folder: prepare_folders dipanggil setelah queue final (trim/batal) diketahui.
+    Return dict: items [(item, byte)], needed, free, reserve"""
+    reserve = DISK_SPACE_RESERVE if reserve is None else reserve
+    seen = set()
+    items = []
+    needed = 0
+    for item in queue:
+        keys = ((item['type'], item['id']), item_path(item))
+        need = 0 if any(key in seen for key in keys) else bytes_still_needed(item)
+        seen.update(keys)
+        items.append((item, need))
+        needed += need
+    free = disk_free(root)
+    return {'items': items, 'needed': needed, 'free': free, 'reserve': reserve}
+
+def plan_fits(plan):
+    return plan['free'] is None or plan['needed'] + plan['reserve'] <= plan['free']
+
+def trim_plan(plan):
+    """Ambil item sesuai urutan queue selama masih muat; item yang tidak muat dilewati
+    (item kecil di belakangnya tetap boleh masuk). Return (queue, byte dilewati)"""
+    budget = max(0, (plan['free'] or 0) - plan['reserve'])
+    kept = []
+    dropped = 0
+    for item, need in plan['items']:
+        if need <= budget:
+            kept.append(item)
+            budget -= need
+        else:
+            dropped += need
+    return kept, dropped
+
+class DiskBudget:
+    """Preflight per file untuk mode streaming (queue belum diketahui di awal). Ruang kosong
+    dikurangi sisa byte file yang sedang didownload (yang belum teralokasi di .tmp)"""
+
+    def __init__(self, root, reserve=None):
+        self.root = root
+        self.reserve = DISK_SPACE_RESERVE if reserve is None else reserve
+        self.lock = threading.Lock()
+        self.active = {}
+
+    def acquire(self, item):
+        """True jika item muat (dan dicatat sampai release), False jika tidak"""
+        need = bytes_still_needed(item)
+        with self.lock:
+            free = disk_free(self.root)
+            if need and free is not None:
+                pending = sum(max(0, size - tmp_allocated(other)) for other, size in self.active.values())
+                if need + pending + self.reserve > free: return False
+            self.active[id(item)] = (item, need)
+        return True
+
+    def release(self, item):
+        with self.lock:
+            self.active.pop(id(item), None)
+
+def describe_plan(plan):
+    free = format_bytes(plan['free']) if plan['free'] is not None else "tidak diketahui"
+    return (f"butuh {format_bytes(plan['needed'])}, ruang kosong {free} "
+            f"(cadangan {format_bytes(plan['reserve'])})")
+
+# ==========================================
+# DOWNLOAD ENGINE (WORKER POOL)
+# ==========================================
+
+class DownloadProgress:
+    """Progress gabungan dari semua worker download. Persen dan ETA dihitung dari byte
+    (size hasil scan), bukan jumlah file, jadi satu file 50 GB tidak terlihat seperti 0.1%"""
+
+    def __init__(self, total_files, total_bytes=0):
+        self.lock = threading.Lock()
+        self.total_files = total_files
+        self.total_bytes = total_bytes
+        self.files_done = 0
+        self.success_count = 0
+        self.failed_count = 0
+        self.bytes_done = 0
+        self.finished_size = 0 # size file yang sudah selesai (sukses/gagal/dilewati/di-link)
+        self.downloaded_size = 0 # bagian finished_size yang lewat download (bukan dilewati/di-link)
+        self.skipped_count = 0
+        self.linked_count = 0
+        self.collided_count = 0 # file lain dengan path tujuan sama, tidak didownload
+        self.status = ""
+        self.start_time = time.time()
+        self.last_draw = 0
+        self.samples = [] # (waktu, bytes_done) untuk kecepatan beberapa detik terakhir
+
+    def add_total(self, count, size=0):
+        with self.lock:
+            self.total_files += count
+            self.total_bytes += size
+
+    def set_status(self, text):
+        with self.lock:
+            self.status = text
+        self.render()
+
+    def add_bytes(self, amount):
+        with self.lock:
+            self.bytes_done += amount
+        self.render()
+
+    def finish_file(self, ok, linked=False, size=0):
+        with self.lock:
+            self.files_done += 1
+            self.finished_size += size
+            if ok is None:
+                self.collided_count += 1
+            else:
+                if ok: self.success_count += 1
+                else: self.failed_count += 1
+                if ok and linked: self.linked_count += 1
+                else: self.downloaded_size += size
+        self.render(force=True)
+
+    def skip_file(self, size=0, count=1):
+        with self.lock:
+            self.files_done += count
+            self.skipped_count += count
+            self.finished_size += size
+        self.render()
+
+    def speed(self):
+        elapsed = time.time() - self.start_time
+        return self.bytes_done / elapsed if elapsed > 0 else 0
+
+    def done_bytes(self):
+        # File selesai dihitung penuh + byte file yang masih berjalan (perkiraan, file resume ikut terhitung)
+        in_flight = max(0, self.bytes_done - self.downloaded_size)
+        return min(self.total_bytes, self.finished_size + in_flight)
+
+    def recent_speed(self, now):
+        self.samples.append((now, self.bytes_done))
+        while len(self.samples) > 2 and now - self.samples[0][0] > PROGRESS_SPEED_WINDOW:
+            self.samples.pop(0)
+        (t0, b0), (t1, b1) = self.samples[0], self.samples[-1]
+        return (b1 - b0) / (t1 - t0) if t1 - t0 >= 1 else self.speed()
+
+    def eta(self, speed):
+        remaining = self.total_bytes - self.done_bytes()
+        if remaining <= 0: return "0:00:00"
+        if speed <= 0: return "--:--:--"
+        return str(timedelta(seconds=int(remaining / speed)))
+
+    def render(self, force=False):
+        now = time.time()
+        with self.lock:
+            if not force and now - self.last_draw < 0.2: return
+            self.last_draw = now
+            speed = self.recent_speed(now)
+            if self.total_bytes:
+                percent = int(self.done_bytes() / self.total_bytes * 100)
+                amount = f"{format_bytes(self.done_bytes())}/{format_bytes(self.total_bytes)} | ETA {self.eta(speed)}"
+            else:
+                percent = int(self.files_done / self.total_files * 100) if self.total_files else 100
+                amount = format_bytes(self.bytes_done)
+            limit = BANDWIDTH.describe()
+            line = (f"\r[{percent:>3}%] {amount} | Files {self.files_done}/{self.total_files} | "
+                    f"{speed / 1048576:6.2f} MB/s | Sukses {self.success_count} Gagal {self.failed_count}"
+                    f"{' | ' + limit if limit else ''}{' | ' + self.status if self.status else ''}   ")
+            sys.stdout.write(line)
+            sys.stdout.flush()
+
+def queue_bytes(queue):
+    return sum(item.get('size') or 0 for item in queue)
+
+def run_download_pool(queue, headers, workers=None, manifest=None, checksum=False, store=None, progress=None, skipped=()):
+    """Download semua item di queue secara paralel, return (DownloadProgress, hasil per item
+    [(item, ok, linked)], ok None = bentrok path).
+    progress yang sudah ada bisa diteruskan agar beberapa batch tampil di satu baris progress.
+    Token yang ditolak (KitsuAuthError) menghentikan pool lalu dilempar ke pemanggil.
+    skipped = item yang dilewati manifest; path-nya tidak boleh ditimpa item lain di queue"""
+    workers = max(1, workers or DOWNLOAD_WORKERS)
+    if progress is None: progress = DownloadProgress(len(queue), queue_bytes(queue))
+    else: progress.add_total(len(queue), queue_bytes(queue))
+    progress.render(force=True)
+    deduper = DownloadDeduper(store, manifest)
+    for item in skipped: deduper.skip(item)
+    # Diset saat token ditolak: item yang belum mulai tidak dicoba lagi
+    stop = threading.Event()
+    auth_error = []
+
+    def worker(item):
+        if stop.is_set():
+            progress.add_total(-1, -(item.get('size') or 0))
+            return []
+        try:
+            results = deduper.fetch(item, headers=headers, progress=progress)
+        except KitsuAuthError as e:
+            auth_error.append(e)
+            stop.set()
+            progress.set_status("token ditolak server, berhenti")
+            return [(item, False, False)]
+        except Exception:
+            return [(item, False, False)]
+        for done_item, ok, _ in results:
+            if ok and manifest: manifest.record(done_item, checksum=checksum)
+        return results
+
+    executor = ThreadPoolExecutor(max_workers=workers)
+    results = []
+    try:
+        futures = [executor.submit(worker, item) for item in queue]
+        for future in as_completed(futures):
+            for done_item, ok, linked in future.result():
+                progress.finish_file(ok, linked, done_item.get('size') or 0)
+                results.append((done_item, ok, linked))
+    except KeyboardInterrupt:
+        executor.shutdown(wait=False, cancel_futures=True)
+        raise
+    executor.shutdown(wait=True)
+    if auth_error: raise auth_error[0]
+    return progress, results
+
 # ==========================================
 # SCANNING & MAPPING LOGIC
 # ==========================================
-PARENT_NAME_CACHE = {}
+PARENT_NAME_CACHE = {} # id -> nama, ikut disimpan di index cache scan
+PARENT_NAME_FAILURES = {} # id -> waktu gagal (negative cache, berlaku NAME_FAILURE_TTL)
+
+def parent_lookup_blocked(parent_id):
+    failed_at = PARENT_NAME_FAILURES.get(parent_id)
+    return failed_at is not None and time.time() - failed_at < NAME_FAILURE_TTL
 
 def get_parent_name_direct(parent_id, headers):
     if not parent_id: return "No_Parent"
     if parent_id in PARENT_NAME_CACHE: return PARENT_NAME_CACHE[parent_id]
+    if parent_lookup_blocked(parent_id): return f"Parent_{parent_id[:8]}"
     try:
         url = f"{KITSU_HOST}/data/entities/{parent_id}"
-        r = requests.get(url, headers=headers, timeout=10)
+        r = api_get(url, headers=headers, timeout=10)
         if r.status_code == 200:
             name = r.json().get('name', 'Unknown_Parent')
             PARENT_NAME_CACHE[parent_id] = name 
             return name
     except: pass
+    PARENT_NAME_FAILURES[parent_id] = time.time()
     return f"Parent_{parent_id[:8]}" 
 
+def remember_names(name_map):
+    PARENT_NAME_CACHE.update(name_map)
+
+def prefetch_parent_names(parent_ids):
+    """Ambil nama parent yang belum dikenal sekaligus lewat /data/entities?id=[...]"""
+    missing = [i for i in dict.fromkeys(parent_ids)
+               if i and i not in PARENT_NAME_CACHE and not parent_lookup_blocked(i)]
+    if not missing: return
+    try:
+        records = fetch_data_by_ids("entities", "id", missing)
+    except Exception:
+        return # Filter bulk tidak didukung: tetap lewat get_parent_name_direct per id
+    for record in records:
+        PARENT_NAME_CACHE[record['id']] = record.get('name', 'Unknown_Parent')
+    now = time.time()
+    for parent_id in missing:
+        if parent_id not in PARENT_NAME_CACHE: PARENT_NAME_FAILURES[parent_id] = now
+
 def resolve_sequence_name(entity, seq_map, headers):
     if entity.get('sequence_name'): return entity['sequence_name']
     seq_id = entity.get('sequence_id')
@@ -216,292 +2027,1599 @@ def normalize_list_response(payload):
 
 def get_episodes_for_project(project, headers):
     if hasattr(gazu, "episode") and hasattr(gazu.episode, "all_episodes_for_project"):
-        try: return gazu.episode.all_episodes_for_project(project)
+        try: return api_call(gazu.episode.all_episodes_for_project, project)
         except: pass
     try:
         url = f"{KITSU_HOST}/data/episodes?project_id={project['id']}"
-        r = requests.get(url, headers=headers, timeout=15)
+        r = api_get(url, headers=headers, timeout=15)
+        if r.status_code == 200: return normalize_list_response(r.json())
+    except: pass
+    return []
+
+def get_sequences_for_episode(episode, headers):
+    if hasattr(gazu, "sequence") and hasattr(gazu.sequence, "all_sequences_for_episode"):
+        try: return api_call(gazu.sequence.all_sequences_for_episode, episode)
+        except: pass
+    try:
+        url = f"{KITSU_HOST}/data/sequences?episode_id={episode['id']}"
+        r = api_get(url, headers=headers, timeout=15)
         if r.status_code == 200: return normalize_list_response(r.json())
     except: pass
     return []
 
-def get_sequences_for_episode(episode, headers):
-    if hasattr(gazu, "sequence") and hasattr(gazu.sequence, "all_sequences_for_episode"):
-        try: return gazu.sequence.all_sequences_for_episode(episode)
-        except: pass
-    try:
-        url = f"{KITSU_HOST}/data/sequences?episode_id={episode['id']}"
-        r = requests.get(url, headers=headers, timeout=15)
-        if r.status_code == 200: return normalize_list_response(r.json())
-    except: pass
-    return []
+def get_sequences_for_project(project, headers):
+    if hasattr(gazu, "sequence") and hasattr(gazu.sequence, "all_sequences_for_project"):
+        try: return api_call(gazu.sequence.all_sequences_for_project, project)
+        except: pass
+    try:
+        url = f"{KITSU_HOST}/data/sequences?project_id={project['id']}"
+        r = api_get(url, headers=headers, timeout=15)
+        if r.status_code == 200: return normalize_list_response(r.json())
+    except: pass
+    return []
+
+def resolve_episode_and_sequence(entity, seq_map, seq_episode_map, episode_map, headers):
+    seq_name_raw = resolve_sequence_name(entity, seq_map, headers)
+    seq_name = sanitize(seq_name_raw)
+    episode_name = "No_Episode"
+
+    seq_id = entity.get('sequence_id') or entity.get('parent_id')
+    ep_id = entity.get('episode_id')
+
+    if not ep_id and seq_id and seq_id in seq_episode_map:
+        ep_id = seq_episode_map[seq_id]
+    if ep_id and ep_id in episode_map:
+        episode_name = episode_map[ep_id]
+    elif ep_id:
+        episode_name = get_parent_name_direct(ep_id, headers)
+
+    return sanitize(episode_name), seq_name
+
+# ==========================================
+# SCAN FILTERS
+# ==========================================
+
+FILE_KINDS = ('preview', 'output', 'working')
+
+def parse_size(text):
+    """'500M', '2G', '1.5T' atau angka byte -> int byte"""
+    if text is None: return None
+    text = str(text).strip().upper().rstrip('B')
+    units = {'K': 2**10, 'M': 2**20, 'G': 2**30, 'T': 2**40}
+    if text and text[-1] in units: return int(float(text[:-1]) * units[text[-1]])
+    return int(float(text))
+
+def parse_name_list(text):
+    """'Animation, Compositing' -> {'animation', 'compositing'} (nama sudah di-sanitize)"""
+    if not text: return None
+    return {sanitize(part).lower() for part in text.split(',') if part.strip()}
+
+class ScanFilter:
+    """Filter yang diterapkan saat scan (request API untuk data yang tidak dipilih tidak dibuat)"""
+
+    def __init__(self, kinds=None, task_types=None, episodes=None, sequences=None,
+                 asset_types=None, extensions=None, max_size=None, latest=None):
+        self.kinds = set(kinds) if kinds else None
+        self.task_types = task_types
+        self.episodes = episodes
+        self.sequences = sequences
+        self.asset_types = asset_types
+        self.extensions = {e.lower().lstrip('.') for e in extensions} if extensions else None
+        self.max_size = max_size
+        self.latest = latest
+
+    @classmethod
+    def from_args(cls, args):
+        kinds = None
+        if args.kinds:
+            kinds = {k.strip().lower() for k in args.kinds.split(',') if k.strip()}
+            unknown = kinds - set(FILE_KINDS)
+            if unknown: raise ValueError(f"Jenis file tidak dikenal: {', '.join(sorted(unknown))}")
+        extensions = [e for e in args.ext.split(',') if e.strip()] if args.ext else None
+        if args.latest is not None and args.latest < 1: raise ValueError("--latest minimal 1")
+        return cls(kinds=kinds, task_types=parse_name_list(args.task_types),
+                   episodes=parse_name_list(args.episodes), sequences=parse_name_list(args.sequences),
+                   asset_types=parse_name_list(args.asset_types), extensions=extensions,
+                   max_size=parse_size(args.max_size), latest=args.latest)
+
+    def is_active(self):
+        return any(v is not None for v in self.spec().values())
+
+    def spec(self):
+        """Bentuk JSON untuk disimpan di cache (dibandingkan saat delta scan / pakai cache)"""
+        as_list = lambda v: sorted(v) if v is not None else None
+        return {
+            'kinds': as_list(self.kinds), 'task_types': as_list(self.task_types),
+            'episodes': as_list(self.episodes), 'sequences': as_list(self.sequences),
+            'asset_types': as_list(self.asset_types), 'extensions': as_list(self.extensions),
+            'max_size': self.max_size, 'latest': self.latest,
+        }
+
+    def describe(self):
+        parts = []
+        for key, value in self.spec().items():
+            if value is None: continue
+            if key == 'max_size': value = format_bytes(value)
+            elif key == 'latest': value = f"{value} revisi terbaru"
+            elif isinstance(value, list): value = ",".join(value)
+            parts.append(f"{key}={value}")
+        return "; ".join(parts) if parts else "tanpa filter"
+
+    def allows_kind(self, kind):
+        return self.kinds is None or kind in self.kinds
+
+    def allows_task_type(self, task_type):
+        return self.task_types is None or task_type.lower() in self.task_types
+
+    def allows_shot(self, episode_name, seq_name):
+        # Filter khusus asset saja -> shot tidak ikut
+        if self.asset_types is not None and self.episodes is None and self.sequences is None: return False
+        if self.episodes is not None and episode_name.lower() not in self.episodes: return False
+        if self.sequences is not None and seq_name.lower() not in self.sequences: return False
+        return True
+
+    def allows_asset(self, type_name):
+        # Filter khusus episode/sequence saja -> asset tidak ikut
+        if self.asset_types is None: return self.episodes is None and self.sequences is None
+        return type_name.lower() in self.asset_types
+
+    def allows_file(self, filename, size):
+        if self.extensions is not None:
+            ext = os.path.splitext(filename)[1].lstrip('.').lower()
+            if ext not in self.extensions: return False
+        if self.max_size is not None and (size or 0) > self.max_size: return False
+        return True
+
+    def allows_item(self, item, root):
+        """Filter untuk queue dari cache: episode/sequence/asset type/task type dibaca dari path folder"""
+        if not self.allows_kind(item['type']): return False
+        if not self.allows_file(item['filename'], item.get('size', 0)): return False
+        parts = os.path.relpath(item['folder'], root).split(os.sep)
+        if parts[0] == "Assets":
+            if len(parts) > 1 and not self.allows_asset(parts[1]): return False
+        elif len(parts) > 1 and not self.allows_shot(parts[0], parts[1]): return False
+        # Preview entity ada di folder entity (tanpa folder task type)
+        if len(parts) > 3 and not self.allows_task_type(parts[3]): return False
+        if len(parts) <= 3 and self.task_types is not None: return False
+        return True
+
+NO_FILTER = ScanFilter()
+
+def revision_number(record):
+    try: return int(record.get('revision') or 0)
+    except (TypeError, ValueError): return 0
+
+def latest_revisions(records, keep, key):
+    """Ambil `keep` revisi terbaru per grup key(record), urutan asli dipertahankan.
+    Return (records yang dipakai, total byte revisi lama yang dilewati)"""
+    if not keep: return records, 0
+    groups = defaultdict(list)
+    for record in records: groups[key(record)].append(record)
+    kept_ids = set()
+    for group in groups.values():
+        group.sort(key=revision_number, reverse=True)
+        kept_ids.update(id(record) for record in group[:keep])
+    kept = [record for record in records if id(record) in kept_ids]
+    skipped_bytes = sum(record.get('file_size', record.get('size', 0)) or 0 for record in records if id(record) not in kept_ids)
+    return kept, skipped_bytes
+
+def output_revision_key(record):
+    return (record.get('task_type_id'), record.get('output_type_id'), record.get('name'))
+
+def working_revision_key(record):
+    return (record.get('task_id'), record.get('name'))
+
+def revision_group(key):
+    """Key grup revisi dalam bentuk string untuk disimpan di QueueItem / shard cache"""
+    return "|".join("" if part is None else str(part) for part in key)
+
+def queue_revision_key(item):
+    """Grup revisi untuk queue dari cache, sama dengan grup saat scan (per entity).
+    Preview tidak dikelompokkan; item dari cache lama tanpa grup memakai folder + nama file"""
+    if item['type'] == 'preview': return ('preview', item['id'])
+    group = item.get('revision_group')
+    if group is None: return (item['type'], item['folder'], item['filename'])
+    return (item['type'], item['entity_id'], group)
+
+# ==========================================
+# SCAN DATA SOURCES (LIVE / BULK)
+# ==========================================
+
+class LiveScanSource:
+    """Ambil data per entity langsung lewat gazu (beberapa request per entity)"""
+
+    def preview_file(self, preview_file_id):
+        return api_call(gazu.files.get_preview_file, preview_file_id)
+
+    def tasks_for(self, entity, entity_type):
+        if entity_type == 'Shot': return api_call(gazu.task.all_tasks_for_shot, entity)
+        return api_call(gazu.task.all_tasks_for_asset, entity)
+
+    def output_files(self, task):
+        # Output file terdaftar di entity (shot/asset), dipilah per task type
+        return api_call(gazu.files.all_output_files_for_entity, task['entity_id'], task_type=task['task_type_id'])
+
+    def working_files(self, task):
+        if hasattr(gazu.files, "get_working_files_for_task"):
+            return api_call(gazu.files.get_working_files_for_task, task)
+        return api_call(gazu.files.all_working_files_for_entity, task)
+
+LIVE_SCAN_SOURCE = LiveScanSource()
+
+def fetch_data_list(path, params=None):
+    """Ambil semua halaman dari endpoint REST /data/<path>"""
+    results = []
+    page = 1
+    while True:
+        query = dict(params or {})
+        query.update(page=page, limit=BULK_PAGE_SIZE)
+        r = api_get(f"{KITSU_HOST}/data/{path}", params=query, timeout=120)
+        r.raise_for_status()
+        payload = r.json()
+        results.extend(normalize_list_response(payload))
+        nb_pages = payload.get('nb_pages', 1) if isinstance(payload, dict) else 1
+        if page >= nb_pages: break
+        page += 1
+    return results
+
+def fetch_data_by_ids(path, field, ids):
+    """Query /data/<path>?<field>=[...] per potongan id (filter 'in' Kitsu)"""
+    ids = [i for i in dict.fromkeys(ids) if i]
+    results = []
+    for i in range(0, len(ids), BULK_ID_CHUNK):
+        results.extend(fetch_data_list(path, {field: json.dumps(ids[i:i + BULK_ID_CHUNK])}))
+    return results
+
+class BulkScanSource:
+    """Semua task/preview/output/working file satu project diambil sekaligus,
+    lalu di-join di memori lewat index entity id dan task id"""
+
+    def __init__(self, project, entities, scan_filter=None):
+        scan_filter = scan_filter or NO_FILTER
+        task_type_names = {tt['id']: tt['name'] for tt in fetch_data_list("task-types")}
+        entity_ids = {e['id'] for e in entities}
+
+        self.tasks_by_entity = defaultdict(list)
+        for task in fetch_data_list("tasks", {"project_id": project['id']}):
+            if task.get('entity_id') not in entity_ids: continue
+            if not task.get('task_type_name'):
+                task['task_type_name'] = task_type_names.get(task.get('task_type_id'), "Unknown")
+            self.tasks_by_entity[task['entity_id']].append(task)
+        wanted_tasks = [t for tasks in self.tasks_by_entity.values() for t in tasks
+                        if scan_filter.allows_task_type(sanitize(t['task_type_name']))]
+        # Urutan sama seperti gazu (sort_by_name)
+        for tasks in self.tasks_by_entity.values():
+            tasks.sort(key=lambda t: (t.get('name') or "").lower())
+
+        # Jenis file / task type yang difilter tidak diambil sama sekali
+        self.preview_files = {}
+        if scan_filter.allows_kind('preview'):
+            preview_ids = [e.get('preview_file_id') for e in entities]
+            preview_ids += [t.get('preview_file_id') for t in wanted_tasks]
+            self.preview_files = {pf['id']: pf for pf in fetch_data_by_ids("preview-files", "id", preview_ids)}
+
+        self.outputs_by_task = defaultdict(list)
+        if scan_filter.allows_kind('output'):
+            output_entity_ids = list(dict.fromkeys(t['entity_id'] for t in wanted_tasks))
+            for out in fetch_data_by_ids("output-files", "entity_id", output_entity_ids):
+                self.outputs_by_task[(out.get('entity_id'), out.get('task_type_id'))].append(out)
+
+        self.works_by_task = defaultdict(list)
+        if scan_filter.allows_kind('working'):
+            for work in fetch_data_by_ids("working-files", "task_id", [t['id'] for t in wanted_tasks]):
+                self.works_by_task[work.get('task_id')].append(work)
 
-def get_sequences_for_project(project, headers):
-    if hasattr(gazu, "sequence") and hasattr(gazu.sequence, "all_sequences_for_project"):
-        try: return gazu.sequence.all_sequences_for_project(project)
-        except: pass
-    try:
-        url = f"{KITSU_HOST}/data/sequences?project_id={project['id']}"
-        r = requests.get(url, headers=headers, timeout=15)
-        if r.status_code == 200: return normalize_list_response(r.json())
-    except: pass
-    return []
+    def preview_file(self, preview_file_id):
+        return self.preview_files.get(preview_file_id)
 
-def resolve_episode_and_sequence(entity, seq_map, seq_episode_map, episode_map, headers):
-    seq_name_raw = resolve_sequence_name(entity, seq_map, headers)
-    seq_name = sanitize(seq_name_raw)
-    episode_name = "No_Episode"
+    def tasks_for(self, entity, entity_type):
+        return self.tasks_by_entity.get(entity['id'], [])
 
-    seq_id = entity.get('sequence_id') or entity.get('parent_id')
-    ep_id = entity.get('episode_id')
+    def output_files(self, task):
+        return self.outputs_by_task.get((task.get('entity_id'), task.get('task_type_id')), [])
 
-    if not ep_id and seq_id and seq_id in seq_episode_map:
-        ep_id = seq_episode_map[seq_id]
-    if ep_id and ep_id in episode_map:
-        episode_name = episode_map[ep_id]
-    elif ep_id:
-        episode_name = get_parent_name_direct(ep_id, headers)
+    def working_files(self, task):
+        return self.works_by_task.get(task['id'], [])
 
-    return sanitize(episode_name), seq_name
+# ==========================================
+# ENTITY SCAN
+# ==========================================
+
+def entity_allowed(entity, entity_type, scan_filter, seq_map, episode_map, seq_episode_map, headers):
+    """Filter episode/sequence (shot) atau asset type (asset) untuk satu entity"""
+    if entity_type == 'Shot':
+        episode_name, seq_name = resolve_episode_and_sequence(entity, seq_map, seq_episode_map, episode_map, headers)
+        return scan_filter.allows_shot(episode_name, seq_name)
+    return scan_filter.allows_asset(sanitize(entity.get('asset_type_name', 'Props')))
 
-def scan_entity(entity, root_folder, entity_type, download_queue, seq_map, episode_map, seq_episode_map, headers):
+def scan_entity(entity, root_folder, entity_type, download_queue, seq_map, episode_map, seq_episode_map, headers, source=None, scan_filter=None):
+    """Isi download_queue untuk satu entity, return timestamp updated_at
+    entity/task/file untuk delta scan berikutnya"""
+    source = source or LIVE_SCAN_SOURCE
+    scan_filter = scan_filter or NO_FILTER
     entity_name = sanitize(entity['name'])
+    entity_id = entity['id']
+    stamps = {'updated_at': entity.get('updated_at'), 'tasks': {}, 'files': {}}
+    skipped_bytes = 0
     
     if entity_type == 'Shot':
         episode_name, seq_name = resolve_episode_and_sequence(
             entity, seq_map, seq_episode_map, episode_map, headers
         )
+        if not scan_filter.allows_shot(episode_name, seq_name): return stamps
         base_folder = os.path.join(root_folder, episode_name, seq_name, entity_name)
     else:
         type_name = sanitize(entity.get('asset_type_name', 'Props'))
+        if not scan_filter.allows_asset(type_name): return stamps
         base_folder = os.path.join(root_folder, "Assets", type_name, entity_name)
 
-    # Preview
-    if entity.get('preview_file_id'):
+    # Preview (preview entity tidak punya task type, jadi dilewati jika filter task type aktif)
+    if entity.get('preview_file_id') and scan_filter.allows_kind('preview') and scan_filter.task_types is None:
         try:
-            pf = gazu.files.get_preview_file(entity['preview_file_id'])
+            pf = source.preview_file(entity['preview_file_id'])
             if pf:
                 base_name = pf.get('original_name') or pf.get('name') or entity_name
                 ext = pf.get('extension', 'mp4')
                 clean_name = sanitize(base_name)
                 if not clean_name.lower().endswith(f".{ext}"): clean_name = f"{clean_name}.{ext}"
-                download_queue.append({
-                    'type': 'preview', 'id': pf['id'], 'url': get_full_url(pf.get('url')),
-                    'folder': base_folder, 'filename': clean_name, 'size': pf.get('file_size', 0)
-                })
+                if scan_filter.allows_file(clean_name, pf.get('file_size', 0)):
+                    download_queue.append(QueueItem(
+                        'preview', pf['id'], base_folder, clean_name, pf.get('file_size', 0),
+                        entity_id, pf.get('revision'), url=get_full_url(pf.get('url'))
+                    ))
+                stamps['files'][pf['id']] = pf.get('updated_at')
         except: pass
 
     # Tasks
     try:
-        if entity_type == 'Shot': tasks = gazu.task.all_tasks_for_shot(entity)
-        else: tasks = gazu.task.all_tasks_for_asset(entity)
+        tasks = source.tasks_for(entity, entity_type)
 
         for task in tasks:
+            stamps['tasks'][task['id']] = task.get('updated_at')
             task_type = sanitize(task['task_type_name'])
+            # Task type yang tidak dipilih: list file-nya tidak diminta ke server
+            if not scan_filter.allows_task_type(task_type): continue
             task_folder = os.path.join(base_folder, task_type)
             task_files = []
 
-            if task.get('preview_file_id'):
+            if task.get('preview_file_id') and scan_filter.allows_kind('preview'):
                 try:
-                    pf = gazu.files.get_preview_file(task['preview_file_id'])
+                    pf = source.preview_file(task['preview_file_id'])
                     if pf:
                         base_name = pf.get('original_name') or pf.get('name')
                         ext = pf.get('extension', 'mp4')
                         clean_name = f"{task_type}_Preview_{sanitize(base_name)}.{ext}"
-                        task_files.append({
-                            'type': 'preview', 'id': pf['id'], 'url': get_full_url(pf.get('url')),
-                            'folder': task_folder, 'filename': clean_name, 'size': pf.get('file_size', 0)
-                        })
+                        task_files.append(QueueItem(
+                            'preview', pf['id'], task_folder, clean_name, pf.get('file_size', 0),
+                            entity_id, pf.get('revision'), url=get_full_url(pf.get('url'))
+                        ))
+                        stamps['files'][pf['id']] = pf.get('updated_at')
                 except: pass
 
-            outputs = gazu.files.all_output_files_for_entity(task)
+            outputs = source.output_files(task) if scan_filter.allows_kind('output') else []
+            for out in outputs: stamps['files'][out['id']] = out.get('updated_at')
+            outputs, skipped = latest_revisions(outputs, scan_filter.latest, output_revision_key)
+            skipped_bytes += skipped
             for out in outputs:
                 base_name = out.get('original_name') or out.get('name')
                 ext = out.get('extension', '')
                 clean_name = f"{task_type}_Output_{sanitize(base_name)}"
                 if ext and not clean_name.lower().endswith(f".{ext}"): clean_name = f"{clean_name}.{ext}"
-                task_files.append({
-                    'type': 'output', 'id': out['id'], 'url': get_full_url(out.get('url')),
-                    'folder': task_folder, 'filename': clean_name, 'size': out.get('file_size', 0)
-                })
+                task_files.append(QueueItem(
+                    'output', out['id'], task_folder, clean_name, out.get('file_size', 0),
+                    entity_id, out.get('revision'), url=get_full_url(out.get('url')),
+                    revision_group=revision_group(output_revision_key(out))
+                ))
 
-            works = gazu.files.all_working_files_for_entity(task)
+            works = source.working_files(task) if scan_filter.allows_kind('working') else []
+            for work in works: stamps['files'][work['id']] = work.get('updated_at')
+            works, skipped = latest_revisions(works, scan_filter.latest, working_revision_key)
+            skipped_bytes += skipped
             for work in works:
                 base_name = work.get('original_name') or work.get('name')
                 ext = work.get('extension', '')
                 clean_name = f"{task_type}_SRC_{sanitize(base_name)}"
                 if ext and not clean_name.lower().endswith(f".{ext}"): clean_name = f"{clean_name}.{ext}"
-                task_files.append({
-                    'type': 'working', 'id': work['id'], 'url': get_full_url(work.get('url')),
-                    'folder': task_folder, 'filename': clean_name, 'size': work.get('file_size', 0)
-                })
+                task_files.append(QueueItem(
+                    'working', work['id'], task_folder, clean_name, work.get('file_size', 0),
+                    entity_id, work.get('revision'), url=get_full_url(work.get('url')),
+                    revision_group=revision_group(working_revision_key(work))
+                ))
 
+            task_files = [f for f in task_files if scan_filter.allows_file(f['filename'], f['size'])]
             if task_files: download_queue.extend(task_files)
+    except Exception:
+        # Scan tidak lengkap: paksa entity ini discan ulang di delta berikutnya
+        stamps['updated_at'] = None
+    if skipped_bytes: stamps['skipped_bytes'] = skipped_bytes
+    return stamps
+
+# ==========================================
+# DELTA SCAN
+# ==========================================
+
+EVENT_FILE_KEYS = {
+    'preview_file_id': "preview-files",
+    'output_file_id': "output-files",
+    'working_file_id': "working-files",
+}
+
+def get_project_events(project, since):
+    """Event Kitsu project sejak waktu tertentu, None jika tidak tersedia"""
+    try:
+        events = api_call(gazu.sync.get_last_events, limit=DELTA_EVENTS_LIMIT, project=project, after=since)
+    except Exception:
+        return None
+    if not isinstance(events, list) or len(events) >= DELTA_EVENTS_LIMIT:
+        # Terpotong limit: tidak bisa dipastikan lengkap
+        return None
+    return events
+
+def fetch_record(path, record_id):
+    try:
+        r = api_get(f"{KITSU_HOST}/data/{path}/{record_id}", timeout=15)
+        if r.status_code == 200: return r.json()
     except Exception: pass
+    return None
+
+def kitsu_server_time():
+    """Jam server Kitsu dalam UTC (header Date), jam lokal UTC jika server tidak bisa dihubungi"""
+    try:
+        with api_call(http_get, f"{KITSU_HOST}/", timeout=10) as r:
+            return parsedate_to_datetime(r.headers['Date']).astimezone(timezone.utc).replace(tzinfo=None)
+    except Exception:
+        return datetime.now(timezone.utc).replace(tzinfo=None)
+
+def find_dirty_entities(project, jobs, previous, hierarchy=None):
+    """Set entity id yang berubah sejak scan terakhir, None jika perlu full scan.
+    hierarchy = (seq_map, episode_map, seq_episode_map) scan saat ini: shot di bawah sequence/episode
+    yang berubah (rename, pindah episode) ikut ditandai"""
+    scan_state = (previous or {}).get('scan_state') or {}
+    old_states = scan_state.get('entities')
+    since = scan_state.get('scanned_at')
+    if not old_states or not since: return None
+    events = get_project_events(project, since)
+    if events is None: return None
+
+    dirty = set()
+    for entity, _ in jobs:
+        state = old_states.get(entity['id'])
+        if not state or not state.get('updated_at') or state['updated_at'] != entity.get('updated_at'):
+            dirty.add(entity['id'])
+
+    task_owner = {}
+    file_owner = {}
+    for entity_id, state in old_states.items():
+        for task_id in state.get('tasks', {}): task_owner[task_id] = entity_id
+        for file_id in state.get('files', {}): file_owner[file_id] = entity_id
+
+    def owner_of_task(task_id):
+        if task_id not in task_owner:
+            record = fetch_record("tasks", task_id)
+            task_owner[task_id] = record.get('entity_id') if record else None
+        return task_owner[task_id]
+
+    def owner_of_file(path, file_id):
+        if file_id not in file_owner:
+            record = fetch_record(path, file_id) or {}
+            owner = None
+            if record.get('task_id'): owner = owner_of_task(record['task_id'])
+            file_owner[file_id] = owner or record.get('entity_id')
+        return file_owner[file_id]
+
+    for event in events:
+        data = event.get('data') or {}
+        for key, value in data.items():
+            if not value or not isinstance(value, str): continue
+            if key in ('shot_id', 'asset_id', 'entity_id', 'sequence_id', 'episode_id'):
+                dirty.add(value)
+            elif key == 'task_id':
+                dirty.add(owner_of_task(value))
+            elif key in EVENT_FILE_KEYS:
+                dirty.add(owner_of_file(EVENT_FILE_KEYS[key], value))
+    dirty.discard(None)
+
+    # Nama folder shot berasal dari sequence/episode, jadi perubahannya tidak terlihat di updated_at shot
+    seq_map, episode_map, seq_episode_map = hierarchy or ({}, {}, {})
+    old_names = scan_state.get('parents') or {}
+    old_seq_episodes = scan_state.get('seq_episodes') or {}
+    for parent_id, name in list(seq_map.items()) + list(episode_map.items()):
+        if parent_id in old_names and old_names[parent_id] != name: dirty.add(parent_id)
+    for seq_id, episode_id in seq_episode_map.items():
+        if seq_id in old_seq_episodes and old_seq_episodes[seq_id] != episode_id: dirty.add(seq_id)
+    for entity, entity_type in jobs:
+        if entity_type != 'Shot': continue
+        seq_id = entity.get('sequence_id') or entity.get('parent_id')
+        parents = {seq_id, entity.get('episode_id'), seq_episode_map.get(seq_id)}
+        parents.discard(None)
+        if parents & dirty: dirty.add(entity['id'])
+    return dirty
+
+# ==========================================
+# SCAN PROGRESS DISPLAY
+# ==========================================
+
+class LineReporter:
+    """Progress scan satu baris (ditimpa dengan \\r)"""
+
+    def update(self, line):
+        sys.stdout.write(f"\r{line}")
+        sys.stdout.flush()
+
+    def finish(self, line):
+        sys.stdout.write(f"\r{line}   \n")
+        sys.stdout.flush()
+
+class ScanBoard:
+    """Progress multi-baris untuk beberapa project yang discan bersamaan.
+    Project yang selesai dicetak permanen di atas, yang aktif digambar ulang di bawah."""
+
+    def __init__(self, total_projects):
+        self.lock = threading.Lock()
+        self.total_projects = total_projects
+        self.finished = 0
+        self.active = {}
+        self.drawn_lines = 0
+        self.last_draw = 0
+        self.ansi = sys.stdout.isatty()
+
+    def reporter(self, key):
+        board = self
+        class _Reporter:
+            def update(self, line): board.update(key, line)
+            def finish(self, line): board.finish(key, line)
+        return _Reporter()
+
+    def _clear(self):
+        if self.ansi and self.drawn_lines:
+            sys.stdout.write(f"\x1b[{self.drawn_lines}F\x1b[J")
+        self.drawn_lines = 0
 
-def analyze_single_project(project, auth_headers, proj_idx, total_projects):
-    """Scan satu project dan return (total_size, total_files, download_queue, root, total_shots)"""
+    def _draw(self):
+        if not self.ansi: return
+        lines = [f"   [{self.finished}/{self.total_projects} project selesai, {len(self.active)} sedang discan]"]
+        lines += list(self.active.values())
+        width = shutil.get_terminal_size((120, 20)).columns - 1
+        sys.stdout.write("".join(f"{line[:width]}\n" for line in lines))
+        sys.stdout.flush()
+        self.drawn_lines = len(lines)
+
+    def update(self, key, line):
+        with self.lock:
+            self.active[key] = line
+            now = time.time()
+            if now - self.last_draw < 0.2: return
+            self.last_draw = now
+            self._clear()
+            self._draw()
+
+    def finish(self, key, line):
+        with self.lock:
+            self.active.pop(key, None)
+            self.finished += 1
+            self._clear()
+            sys.stdout.write(f"{line}\n")
+            self._draw()
+
+    def close(self):
+        with self.lock:
+            self._clear()
+            sys.stdout.flush()
+
+# ==========================================
+# PROJECT ANALYSIS
+# ==========================================
+
+def project_download_root(project):
     home_dir = os.path.expanduser("~")
     downloads_path = os.path.join(home_dir, "Downloads")
     folder_name = f"Kitsu_{sanitize(project['name'])}"
-    download_root = os.path.join(downloads_path, folder_name)
+    return os.path.join(downloads_path, folder_name)
+
+def ordered_map(executor, fn, items, window):
+    """Seperti executor.map, tapi hanya `window` job yang berjalan di depan konsumen"""
+    pending = []
+    for item in items:
+        pending.append(executor.submit(fn, item))
+        if len(pending) >= window:
+            yield pending.pop(0).result()
+    for future in pending:
+        yield future.result()
+
+def analyze_single_project(project, auth_headers, proj_idx, total_projects, scan_workers=None, bulk=False, previous=None, reporter=None, sink=None, scan_filter=None):
+    """Scan satu project dan return (total_size, total_files, download_queue, root, total_shots, scan_state).
+    Jika previous (entry cache lama) diberikan, hanya entity yang berubah yang discan ulang.
+    Jika sink diberikan, item langsung dikirim ke sink (append/extend) dan tidak disimpan di download_queue."""
+    reporter = reporter or LineReporter()
+    scan_filter = scan_filter or NO_FILTER
+    download_root = project_download_root(project)
 
     seq_map = {}
     episode_map = {}
     seq_episode_map = {}
+    # Waktu server Kitsu dalam UTC (bukan jam lokal), dikurangi margin untuk event yang telat tercatat
+    scanned_at = (kitsu_server_time() - timedelta(minutes=DELTA_SAFETY_MINUTES)).strftime("%Y-%m-%dT%H:%M:%S")
     
-    try:
-        episodes = get_episodes_for_project(project, auth_headers)
-        for ep in episodes:
-            episode_map[ep['id']] = ep['name']
-            seqs = get_sequences_for_episode(ep, auth_headers)
-            for s in seqs:
-                seq_map[s['id']] = s['name']
-                seq_episode_map[s['id']] = ep['id']
+    with METRICS.phase("hierarchy"):
+        try:
+            episodes = get_episodes_for_project(project, auth_headers)
+            for ep in episodes:
+                episode_map[ep['id']] = ep['name']
+                seqs = get_sequences_for_episode(ep, auth_headers)
+                for s in seqs:
+                    seq_map[s['id']] = s['name']
+                    seq_episode_map[s['id']] = ep['id']
         
-        root_seqs = get_sequences_for_project(project, auth_headers)
-        for s in root_seqs:
-            seq_map[s['id']] = s['name']
-            ep_id = s.get('episode_id')
-            if ep_id:
-                seq_episode_map[s['id']] = ep_id
+            root_seqs = get_sequences_for_project(project, auth_headers)
+            for s in root_seqs:
+                seq_map[s['id']] = s['name']
+                if s.get('episode_id'): seq_episode_map[s['id']] = s['episode_id']
+            prefetch_parent_names(ep_id for ep_id in seq_episode_map.values() if ep_id not in episode_map)
+            for ep_id in seq_episode_map.values():
                 if ep_id not in episode_map:
                     episode_map[ep_id] = get_parent_name_direct(ep_id, auth_headers)
-    except: pass
+        except: pass
+    remember_names(episode_map)
+    remember_names(seq_map)
 
     download_queue = []
     
     # === MODIFIKASI: MENGHITUNG SHOT SECARA EKSPLISIT ===
-    shots = gazu.shot.all_shots_for_project(project)
-    shot_count = len(shots) # Menghitung jumlah shot
+    with METRICS.phase("entity_list"):
+        shots = api_call(gazu.shot.all_shots_for_project, project)
+        shot_count = len(shots) # Menghitung jumlah shot
     
-    assets = gazu.asset.all_assets_for_project(project)
+        assets = api_call(gazu.asset.all_assets_for_project, project)
+
+    # Parent/episode yang tidak ada di listing diambil sekaligus, bukan satu request per shot
+    with METRICS.phase("parent_names"):
+        unknown_parents = []
+        for shot in shots:
+            parent_id = shot.get('parent_id')
+            known_seq = shot.get('sequence_name') or shot.get('sequence_id') in seq_map
+            if parent_id and parent_id not in seq_map and not known_seq: unknown_parents.append(parent_id)
+            if shot.get('episode_id') and shot['episode_id'] not in episode_map: unknown_parents.append(shot['episode_id'])
+        prefetch_parent_names(unknown_parents)
     
-    total_items = len(shots) + len(assets)
+    jobs = [(shot, 'Shot') for shot in shots] + [(asset, 'Asset') for asset in assets]
+
+    # Delta scan: entity yang tidak berubah memakai hasil cache lama
+    reused_queues = {}
+    entity_states = {}
+    # Delta hanya valid jika scan lama memakai filter yang sama
+    if previous and previous.get('scan_filter', NO_FILTER.spec()) != scan_filter.spec(): previous = None
+    with METRICS.phase("delta_check"):
+        hierarchy = (seq_map, episode_map, seq_episode_map)
+        dirty = find_dirty_entities(project, jobs, previous, hierarchy) if previous else None
+    if dirty is not None:
+        cached_queues = defaultdict(list)
+        for item in previous.get('queue', []):
+            cached_queues[item.get('entity_id')].append(item)
+        for entity, _ in jobs:
+            if entity['id'] not in dirty:
+                reused_queues[entity['id']] = cached_queues.get(entity['id'], [])
+                entity_states[entity['id']] = previous['scan_state']['entities'][entity['id']]
+    scan_jobs = [job for job in jobs if job[0]['id'] not in reused_queues]
+
+    source = LIVE_SCAN_SOURCE
+    if bulk and scan_jobs:
+        try:
+            with METRICS.phase("bulk_fetch"):
+                # Entity yang ditolak filter episode/sequence/asset type tidak ikut diambil datanya
+                entities = [entity for entity, entity_type in scan_jobs
+                            if entity_allowed(entity, entity_type, scan_filter, seq_map, episode_map, seq_episode_map, auth_headers)]
+                source = BulkScanSource(project, entities, scan_filter=scan_filter)
+        except Exception as e:
+            print(f"\n[WARNING] Bulk scan gagal ({e}), kembali ke scan per entity")
+
+    total_items = len(scan_jobs)
     processed_count = 0
+    progress_lock = threading.Lock()
     
     def print_scan_progress():
-        nonlocal processed_count
         percent = int((processed_count / total_items) * 100) if total_items > 0 else 100
-        sys.stdout.write(f"\r>> [{proj_idx}/{total_projects}] Menganalisis '{project['name']}' ... [{percent:>3}%] ({processed_count}/{total_items} items)")
-        sys.stdout.flush()
+        reporter.update(f">> [{proj_idx}/{total_projects}] Menganalisis '{project['name']}' ... [{percent:>3}%] ({processed_count}/{total_items} items)")
     
     print_scan_progress()
 
-    for shot in shots:
-        processed_count += 1
-        print_scan_progress()
-        scan_entity(shot, download_root, 'Shot', download_queue, seq_map, episode_map, seq_episode_map, auth_headers)
-
-    if assets:
-        for asset in assets:
+    def scan_one(job):
+        nonlocal processed_count
+        entity, entity_type = job
+        entity_queue = []
+        stamps = scan_entity(entity, download_root, entity_type, entity_queue, seq_map, episode_map, seq_episode_map, auth_headers, source=source, scan_filter=scan_filter)
+        with progress_lock:
             processed_count += 1
             print_scan_progress()
-            scan_entity(asset, download_root, 'Asset', download_queue, seq_map, episode_map, seq_episode_map, auth_headers)
-            
-    total_size = sum(item.get('size', 0) for item in download_queue)
-    sys.stdout.write(f"\r>> [{proj_idx}/{total_projects}] Menganalisis '{project['name']}' ... [DONE] Found {len(download_queue)} files ({format_bytes(total_size)})   \n")
-    sys.stdout.flush()
+        return entity['id'], entity_queue, stamps
+
+    # Scan paralel, hasil digabung sesuai urutan shot lalu asset seperti sebelumnya
+    scan_workers = max(1, scan_workers or SCAN_WORKERS)
+    scanned_queues = {}
+    total_size = 0
+    total_files = 0
+    with METRICS.phase("entity_scan"), ThreadPoolExecutor(max_workers=scan_workers) as executor:
+        for entity_id, entity_queue, stamps in ordered_map(executor, scan_one, scan_jobs, scan_workers * 4):
+            entity_states[entity_id] = stamps
+            if sink is not None:
+                # Mode streaming: item langsung diteruskan ke worker download
+                total_size += sum(item.get('size', 0) for item in entity_queue)
+                total_files += len(entity_queue)
+                sink.extend(entity_queue)
+            else:
+                scanned_queues[entity_id] = entity_queue
+    if sink is None:
+        for entity, _ in jobs:
+            entity_queue = reused_queues.get(entity['id'])
+            if entity_queue is None: entity_queue = scanned_queues.get(entity['id'], [])
+            download_queue.extend(entity_queue)
+        total_size = sum(item.get('size', 0) for item in download_queue)
+        total_files = len(download_queue)
+    delta_info = f", {len(reused_queues)} entity dari cache" if dirty is not None else ""
+    # Dihitung dari state entity, jadi entity hasil delta (dari cache) tetap ikut terhitung
+    skipped_bytes = sum(state.get('skipped_bytes', 0) for state in entity_states.values())
+    if skipped_bytes: delta_info += f", revisi lama dilewati: {format_bytes(skipped_bytes)}"
+    reporter.finish(f">> [{proj_idx}/{total_projects}] Menganalisis '{project['name']}' ... [DONE] Found {total_files} files ({format_bytes(total_size)}{delta_info})")
     
-    # Mengembalikan shot_count juga
-    return total_size, len(download_queue), download_queue, download_root, shot_count
+    scan_state = {'scanned_at': scanned_at, 'entities': entity_states, 'skipped_bytes': skipped_bytes,
+                  'parents': dict(episode_map, **seq_map), 'seq_episodes': dict(seq_episode_map)}
+    # Mengembalikan shot_count dan state delta scan juga
+    return total_size, total_files, download_queue, download_root, shot_count, scan_state
 
 # ==========================================
-# MAIN
+# STREAMING SCAN + DOWNLOAD
 # ==========================================
 
-def main():
-    global KITSU_HOST 
-    print("="*60)
-    print("   KITSU DOWNLOADER - SMART CACHE MODE")
+class QueueSink:
+    """Sink untuk analyze_single_project: item masuk ke queue terbatas (backpressure ke scanner).
+    Setelah stop diset (disk penuh / token ditolak), scan dihentikan lewat InsufficientDiskSpace"""
+
+    def __init__(self, work_queue, progress, stop=None, deduper=None):
+        self.work_queue = work_queue
+        self.progress = progress
+        self.stop = stop
+        self.deduper = deduper
+
+    def append(self, item):
+        if self.stop is not None and self.stop.is_set(): raise InsufficientDiskSpace("download dihentikan")
+        self.progress.add_total(1, item.get('size') or 0)
+        self.work_queue.put(item)
+
+    def extend(self, items):
+        # Satu entity dicatat dulu seluruhnya, jadi revisi dengan path sama saling tahu sebelum didownload
+        if self.deduper is not None: self.deduper.expect(items)
+        for item in items: self.append(item)
+
+class StatusReporter:
+    """Progress scan ditampilkan sebagai status di baris progress download"""
+
+    def __init__(self, progress):
+        self.progress = progress
+
+    def update(self, line):
+        self.progress.set_status(line.split("... ", 1)[-1].replace("items", "entity"))
+
+    def finish(self, line):
+        self.progress.set_status("scan selesai")
+
+def run_streaming_download(project, auth_headers, workers=None, scan_workers=None, bulk=False, checksum=False,
+                           scan_filter=None, store=None, if_full='refuse'):
+    """Scan dan download berjalan bersamaan: scan_entity -> queue terbatas -> worker download.
+    Ruang disk dicek per file (DiskBudget): if_full trim = file yang tidak muat dilewati,
+    ignore = tidak dicek, lainnya = scan dan download berhenti.
+    Token yang ditolak menghentikan scan dan download lalu dilempar sebagai KitsuAuthError.
+    Return (DownloadProgress, download_root, scan_error, file yang tidak muat)"""
+    workers = max(1, workers or DOWNLOAD_WORKERS)
+    download_root = project_download_root(project)
+    manifest = DownloadManifest(download_root).load()
+    work_queue = Queue(maxsize=STREAM_QUEUE_SIZE)
+    progress = DownloadProgress(0)
+    progress.set_status("scan dimulai")
+    deduper = DownloadDeduper(store, manifest)
+    budget = DiskBudget(download_root) if if_full != 'ignore' else None
+    stop = threading.Event()
+    no_space = []
+    auth_error = []
+    scan_error = []
+
+    def scanner():
+        try:
+            analyze_single_project(project, auth_headers, 1, 1, scan_workers=scan_workers, bulk=bulk,
+                                   reporter=StatusReporter(progress), sink=QueueSink(work_queue, progress, stop, deduper),
+                                   scan_filter=scan_filter)
+        except InsufficientDiskSpace:
+            pass
+        except Exception as e:
+            scan_error.append(e)
+        finally:
+            for _ in range(workers): work_queue.put(None)
+
+    def downloader():
+        dir_listing = {}
+        while True:
+            item = work_queue.get()
+            if item is None: return
+            size = item.get('size') or 0
+            if stop.is_set():
+                # Sisa queue setelah berhenti tidak didownload (tetap diambil agar scanner tidak macet)
+                progress.add_total(-1, -size)
+                continue
+            if manifest.is_complete(item, dir_listing):
+                deduper.skip(item)
+                progress.skip_file(size)
+                continue
+            if budget is not None and not budget.acquire(item):
+                no_space.append(item)
+                progress.add_total(-1, -size)
+                if if_full != 'trim':
+                    stop.set()
+                    progress.set_status("ruang disk tidak cukup, berhenti")
+                continue
+            try:
+                results = deduper.fetch(item, headers=auth_headers, progress=progress)
+            except KitsuAuthError as e:
+                auth_error.append(e)
+                stop.set()
+                progress.set_status("token ditolak server, berhenti")
+                results = [(item, False, False)]
+            except Exception:
+                results = [(item, False, False)]
+            finally:
+                if budget is not None: budget.release(item)
+            for done_item, ok, linked in results:
+                if ok: manifest.record(done_item, checksum=checksum)
+                progress.finish_file(ok, linked, done_item.get('size') or 0)
+
+    threads = [threading.Thread(target=scanner, daemon=True)]
+    threads += [threading.Thread(target=downloader, daemon=True) for _ in range(workers)]
+    try:
+        for t in threads: t.start()
+        for t in threads:
+            while t.is_alive(): t.join(0.5)
+    finally:
+        manifest.save()
+        URL_RESOLVER.save()
+    if auth_error: raise auth_error[0]
+    return progress, download_root, (scan_error[0] if scan_error else None), no_space
+
+def find_project(all_projects, key):
+    """Cari project berdasarkan id, nomor urut menu, atau nama (tidak case-sensitive)"""
+    for proj in all_projects:
+        if proj['id'] == key: return proj
+    if key.isdigit() and 1 <= int(key) <= len(all_projects):
+        return all_projects[int(key) - 1]
+    for proj in all_projects:
+        if proj['name'].lower() == key.lower(): return proj
+    return None
+
+def run_stream_mode(args, all_projects, auth_headers, scan_filter):
+    project = find_project(all_projects, args.stream)
+    if not project:
+        print(f"[X] Project '{args.stream}' tidak ditemukan."); return
+
+    print(f">> STREAMING: scan + download '{project['name']}' (worker {args.workers})")
+    print(f"   Filter: {scan_filter.describe()}")
+    start_time = time.time()
+    progress, download_root, scan_error, no_space = run_streaming_download(
+        project, auth_headers, workers=args.workers, scan_workers=args.scan_workers,
+        bulk=args.bulk_scan, checksum=args.checksum, scan_filter=scan_filter,
+        store=ContentStore(args.store) if args.store else None, if_full=args.if_full
+    )
+    duration = time.time() - start_time
+
+    print(f"\n\n" + "="*60)
+    print(f"SELESAI DALAM {duration:.1f} DETIK")
+    if scan_error: print(f"[X] Scan berhenti karena error: {scan_error}")
+    if no_space and args.if_full == 'trim':
+        print(f"Tidak muat: {len(no_space)} file ({format_bytes(sum(item.get('size') or 0 for item in no_space))}) dilewati karena ruang disk")
+    elif no_space:
+        print(f"[X] Ruang disk tidak cukup (cadangan {format_bytes(DISK_SPACE_RESERVE)}), scan dan download dihentikan")
+    print(f"Sukses   : {progress.success_count} file")
+    print(f"Gagal    : {progress.failed_count} file")
+    print(f"Dilewati : {progress.skipped_count} file (manifest)")
+    print(f"Di-link  : {progress.linked_count} file (duplikat/store, tanpa download)")
+    if progress.collided_count:
+        print(f"Bentrok  : {progress.collided_count} file (path sama dengan file lain, tidak didownload)")
+    print(f"Diunduh  : {format_bytes(progress.bytes_done)} ({progress.speed() / 1048576:.2f} MB/s)")
+    print(f"Folder   : {download_root}")
     print("="*60)
 
-    # --- 1. SETUP KONEKSI ---
-    while True:
+# ==========================================
+# DISTRIBUTED WORKER (LEASE FILE)
+# ==========================================
+
+# Layout folder job di shared storage (NAS):
+#   job.json            project, download root dan jumlah chunk (ditulis terakhir = job siap)
+#   chunks/NNNNN.json   item queue per chunk, folder relatif terhadap download root
+#   leases/NNNNN.lease  klaim worker (dibuat O_EXCL, mtime diperbarui heartbeat)
+#   done/NNNNN.json     hasil chunk + entry manifest
+#   workers/<id>        heartbeat worker, mtime-nya dipakai sebagai jam shared storage
+#   report.json         laporan gabungan setelah semua chunk selesai
+
+LEASE_SECONDS = 300 # Lease tanpa heartbeat selama ini dianggap milik worker yang crash
+WORKER_CHUNK_ITEMS = 100
+WORKER_POLL_SECONDS = 5
+
+def group_chunks(queue, chunk_items):
+    """Bagi queue menjadi chunk berisi sekitar chunk_items item. Item dengan path tujuan sama
+    selalu satu chunk: dedup path hanya berlaku di dalam chunk, jadi dua mesin tidak menulis .tmp yang sama"""
+    groups = {}
+    for item in queue:
+        groups.setdefault(item_path(item), []).append(item)
+    chunk = []
+    for group in groups.values():
+        if chunk and len(chunk) + len(group) > chunk_items:
+            yield chunk
+            chunk = []
+        chunk.extend(group)
+    if chunk: yield chunk
+
+class ChunkManifest(DownloadManifest):
+    """Manifest di memori untuk satu chunk; entry-nya ikut ditulis ke file done chunk dan
+    digabung ke manifest download root oleh worker terakhir (bukan disimpan tiap worker).
+    File lama dan pemilik path dicek ke manifest download root (base)"""
+
+    def __init__(self, root, base=None):
+        super().__init__(root)
+        self.base = base
+
+    def save(self):
+        pass
+
+    def allows_existing(self, item, size):
+        if self.base is not None and item['id'] not in self.entries: return self.base.allows_existing(item, size)
+        return super().allows_existing(item, size)
+
+    def path_owner(self, item):
+        return self.base.path_owner(item) if self.base is not None else None
+
+class WorkerJob:
+    """Queue satu project di shared storage yang dikerjakan bersama oleh beberapa proses/mesin.
+    Chunk diklaim lewat lease file (O_CREAT | O_EXCL). Lease yang tidak diperbarui selama
+    LEASE_SECONDS diambil alih worker lain, sehingga chunk milik worker yang crash tetap selesai."""
+
+    def __init__(self, job_dir, worker_id=None):
+        self.job_dir = os.path.abspath(os.path.expanduser(job_dir))
+        self.worker_id = worker_id or f"{sanitize(socket.gethostname())}-{os.getpid()}"
+        self.meta = None
+        self.held = set()
+        self.lock = threading.Lock()
+
+    def path(self, *parts):
+        return os.path.join(self.job_dir, *parts)
+
+    def chunk_path(self, index): return self.path("chunks", f"{index:05d}.json")
+    def lease_path(self, index): return self.path("leases", f"{index:05d}.lease")
+    def done_path(self, index): return self.path("done", f"{index:05d}.json")
+
+    def load(self):
         try:
-            if not KITSU_HOST:
-                host_input = input("URL Server Kitsu (cth: http://192.168.1.50/api): ").strip()
-                if not host_input: continue
-                if not host_input.endswith("/api"): host_input = f"{host_input}/api"
-                KITSU_HOST = host_input
+            with open(self.path("job.json"), 'r') as f:
+                self.meta = json.load(f)
+        except (OSError, ValueError):
+            self.meta = None
+        return self.meta
 
-            print(f"Target Server: {KITSU_HOST}")
-            user_input = input("Username/Email : ")
-            pass_input = getpass.getpass("Password       : ")
-            
-            gazu.client.set_host(KITSU_HOST)
-            gazu.log_in(user_input, pass_input)
-            print(">> Login BERHASIL!\n")
-            break
-        except Exception as e:
-            print(f"!! Login GAGAL: {e}\n")
-            KITSU_HOST = "" 
+    def create(self, project, queue, download_root, scan_filter_spec=None):
+        """Tulis chunk lalu job.json (atomic), worker lain baru mulai setelah job.json ada"""
+        for sub in ("chunks", "leases", "done", "workers"):
+            os.makedirs(self.path(sub), exist_ok=True)
+        chunk_count = 0
+        total_size = 0
+        for chunk in group_chunks(queue, WORKER_CHUNK_ITEMS):
+            items = []
+            for item in chunk:
+                data = QueueItem.from_dict(item).to_dict()
+                data['folder'] = os.path.relpath(data['folder'], download_root)
+                total_size += data.get('size') or 0
+                items.append(data)
+            atomic_write(self.chunk_path(chunk_count),
+                         lambda f: json.dump({"items": items}, f, separators=(',', ':')))
+            chunk_count += 1
+        meta = {
+            "version": 1, "project": {'id': project['id'], 'name': project['name']},
+            "root_name": os.path.basename(download_root), "host": KITSU_HOST,
+            "chunks": chunk_count, "total_files": len(queue), "total_size": total_size,
+            "scan_filter": scan_filter_spec, "created_by": self.worker_id, "created_at": time.time(),
+        }
+        atomic_write(self.path("job.json"), lambda f: json.dump(meta, f, indent=2))
+        self.meta = meta
+        return meta
 
-    # --- 2. AMBIL TOKEN ---
-    auth_headers = None
+    def download_root(self, override=None):
+        if override: return os.path.abspath(os.path.expanduser(override))
+        return self.path(self.meta['root_name'])
+
+    def load_chunk(self, index, download_root):
+        with open(self.chunk_path(index), 'r') as f:
+            items = json.load(f)["items"]
+        for data in items:
+            data['folder'] = os.path.normpath(os.path.join(download_root, data['folder']))
+        return [QueueItem.from_dict(data) for data in items]
+
+    # --- Lease ---
+
+    def shared_now(self):
+        """Waktu menurut shared storage: mtime file heartbeat worker ini yang baru disentuh.
+        Expiry lease dibandingkan dengan mtime juga, jadi jam tiap mesin tidak perlu sinkron"""
+        beat = self.path("workers", self.worker_id)
+        try:
+            with open(beat, 'a'): pass
+            os.utime(beat, None)
+            return os.stat(beat).st_mtime
+        except OSError:
+            return time.time()
+
+    def is_expired(self, path, now=None):
+        try: mtime = os.stat(path).st_mtime
+        except OSError: return False
+        return (now if now is not None else self.shared_now()) - mtime > LEASE_SECONDS
+
+    def lease_data(self):
+        data = {"worker": self.worker_id, "host": socket.gethostname(), "pid": os.getpid(), "claimed_at": time.time()}
+        return json.dumps(data).encode('utf-8')
+
+    def acquire(self, path):
+        """Buat lease baru secara eksklusif; lease kedaluwarsa diambil alih di bawah lock .steal"""
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+        except FileExistsError:
+            return self.steal(path)
+        try: os.write(fd, self.lease_data())
+        finally: os.close(fd)
+        with self.lock: self.held.add(path)
+        return True
+
+    def steal(self, path):
+        if not self.is_expired(path): return False
+        steal_lock = path + ".steal"
+        try:
+            fd = os.open(steal_lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+        except FileExistsError:
+            # Lock .steal sisa worker yang crash saat mengambil alih
+            if self.is_expired(steal_lock):
+                try: os.remove(steal_lock)
+                except OSError: pass
+            return False
+        os.close(fd)
+        try:
+            # Dicek ulang di bawah lock: worker lain mungkin baru saja mengambil alih
+            if not self.is_expired(path): return False
+            atomic_write(path, lambda f: f.write(self.lease_data()), binary=True)
+            with self.lock: self.held.add(path)
+            return True
+        finally:
+            try: os.remove(steal_lock)
+            except OSError: pass
+
+    def owns(self, path):
+        try:
+            with open(path, 'r') as f:
+                return json.load(f).get("worker") == self.worker_id
+        except (OSError, ValueError):
+            return False
+
+    def release(self, path):
+        with self.lock: self.held.discard(path)
+        if self.owns(path):
+            try: os.remove(path)
+            except OSError: pass
+
+    def renew(self):
+        """Heartbeat: perbarui mtime semua lease yang masih dimiliki worker ini"""
+        self.shared_now()
+        with self.lock: held = list(self.held)
+        for path in held:
+            if not self.owns(path):
+                with self.lock: self.held.discard(path)
+                print(f"\n[WARNING] Lease {os.path.basename(path)} diambil alih worker lain")
+                continue
+            try: os.utime(path, None)
+            except OSError: pass
+
+    @contextmanager
+    def heartbeat(self):
+        stop = threading.Event()
+
+        def beat():
+            while not stop.wait(LEASE_SECONDS / 5):
+                try: self.renew()
+                except Exception: pass
+
+        thread = threading.Thread(target=beat, daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            thread.join()
+
+    # --- Chunk ---
+
+    def claim(self):
+        """Klaim satu chunk yang belum selesai. Urutan mulai dari offset per worker agar
+        worker tidak berebut chunk yang sama. Return index atau None"""
+        total = self.meta['chunks']
+        offset = int(hashlib.md5(self.worker_id.encode()).hexdigest(), 16) % max(1, total)
+        for step in range(total):
+            index = (offset + step) % total
+            if os.path.exists(self.done_path(index)): continue
+            if self.acquire(self.lease_path(index)):
+                # Chunk bisa saja selesai tepat sebelum lease lamanya dihapus
+                if os.path.exists(self.done_path(index)):
+                    self.release(self.lease_path(index)); continue
+                return index
+        return None
+
+    def complete(self, index, result):
+        result = dict(result, chunk=index, worker=self.worker_id, finished_at=time.time())
+        atomic_write(self.done_path(index), lambda f: json.dump(result, f, separators=(',', ':')))
+        self.release(self.lease_path(index))
+
+    def done_results(self):
+        results = []
+        for index in range(self.meta['chunks']):
+            try:
+                with open(self.done_path(index), 'r') as f:
+                    results.append(json.load(f))
+            except (OSError, ValueError):
+                pass
+        return results
+
+    def status(self):
+        """Jumlah chunk selesai / sedang dikerjakan (lease aktif) / kedaluwarsa / menunggu"""
+        now = self.shared_now()
+        counts = {'done': 0, 'leased': 0, 'expired': 0, 'pending': 0}
+        for index in range(self.meta['chunks']):
+            if os.path.exists(self.done_path(index)): counts['done'] += 1
+            elif not os.path.exists(self.lease_path(index)): counts['pending'] += 1
+            elif self.is_expired(self.lease_path(index), now): counts['expired'] += 1
+            else: counts['leased'] += 1
+        return counts
+
+    def is_finished(self):
+        try: done = len([name for name in os.listdir(self.path("done")) if name.endswith(".json")])
+        except OSError: return False
+        return done >= self.meta['chunks']
+
+    def build_report(self):
+        results = self.done_results()
+        report = {
+            "project": self.meta['project']['name'], "chunks": self.meta['chunks'],
+            "chunks_done": len(results), "total_files": self.meta['total_files'],
+            "total_size": self.meta['total_size'], "workers": {}, "failed": [],
+        }
+        for key in ('success', 'failed_count', 'skipped', 'linked', 'collided', 'bytes'):
+            report[key] = sum(r.get(key, 0) for r in results)
+        for r in results:
+            stats = report["workers"].setdefault(r['worker'], {'chunks': 0, 'success': 0, 'failed_count': 0, 'bytes': 0})
+            stats['chunks'] += 1
+            for key in ('success', 'failed_count', 'bytes'): stats[key] += r.get(key, 0)
+            report["failed"].extend(r.get('failed', []))
+        if results:
+            report["duration"] = max(r['finished_at'] for r in results) - self.meta['created_at']
+        return report
+
+    def finalize(self, download_root):
+        """Gabungkan entry manifest semua chunk ke manifest download root dan tulis report.json.
+        Aman dijalankan lebih dari satu worker: hasilnya sama (gabungan semua file done)"""
+        manifest = DownloadManifest(download_root).load()
+        for r in self.done_results():
+            manifest.entries.update(r.get('manifest', {}))
+        manifest.save()
+        report = self.build_report()
+        atomic_write(self.path("report.json"), lambda f: json.dump(report, f, indent=2))
+        return report
+
+def download_job_chunk(job, index, download_root, auth_headers, manifest, progress, args, store):
+    """Download satu chunk, return ringkasan hasil untuk file done chunk"""
+    items = job.load_chunk(index, download_root)
+    pending, skipped = manifest.filter_pending(items)
+    plan = preflight_plan(pending, download_root)
+    if not plan_fits(plan) and args.if_full != 'ignore': raise InsufficientDiskSpace(describe_plan(plan))
+    prepare_folders(pending)
+    skipped_bytes = queue_bytes(items) - queue_bytes(pending)
+    progress.add_total(len(skipped), skipped_bytes)
+    progress.skip_file(skipped_bytes, len(skipped))
+
+    chunk_manifest = ChunkManifest(download_root, base=manifest)
+    before = (progress.success_count, progress.failed_count, progress.linked_count, progress.bytes_done,
+              progress.collided_count)
+    _, results = run_download_pool(pending, auth_headers, workers=args.workers, manifest=chunk_manifest,
+                      checksum=args.checksum, store=store, progress=progress, skipped=skipped)
+    return {
+        'success': progress.success_count - before[0], 'failed_count': progress.failed_count - before[1],
+        'linked': progress.linked_count - before[2], 'bytes': progress.bytes_done - before[3],
+        'collided': progress.collided_count - before[4],
+        'skipped': len(skipped), 'manifest': chunk_manifest.entries,
+        # Hanya item yang benar-benar gagal (bentrok / duplikat tidak dihitung)
+        'failed': [os.path.relpath(item_path(item), download_root) for item, ok, _ in results if ok is False],
+    }
+
+def prepare_worker_job(job, args, all_projects, auth_headers, scan_filter):
+    """Pakai job yang sudah ada di --job-dir, atau scan project dan buat job baru.
+    Hanya satu worker yang membuat job (lock init.lock), worker lain menunggu job.json"""
+    while not job.load():
+        os.makedirs(job.path("workers"), exist_ok=True)
+        init_lock = job.path("init.lock")
+        if not job.acquire(init_lock):
+            print(f">> Menunggu worker lain menyiapkan job di {job.job_dir}...")
+            time.sleep(WORKER_POLL_SECONDS)
+            continue
+        try:
+            if job.load(): break
+            if not args.project:
+                print("[X] Job belum ada, pilih project untuk job baru dengan --project."); return None
+            project = find_project(all_projects, args.project)
+            if not project:
+                print(f"[X] Project '{args.project}' tidak ditemukan."); return None
+            print(f">> Scan '{project['name']}' untuk job baru...")
+            _, _, queue, root, _, _ = analyze_single_project(
+                project, auth_headers, 1, 1, scan_workers=args.scan_workers,
+                bulk=args.bulk_scan, scan_filter=scan_filter
+            )
+            queue = order_queue(queue, root, args.order, parse_priority_list(args.priority))
+            meta = job.create(project, queue, root, scan_filter.spec())
+            print(f">> Job dibuat: {meta['total_files']} file, {meta['chunks']} chunk")
+        finally:
+            job.release(init_lock)
+    return job.meta
+
+def print_job_report(report, download_root=None):
+    print(f"\n\n" + "="*60)
+    print(f"LAPORAN GABUNGAN JOB: {report['project']}")
+    if report.get('duration') is not None: print(f"Durasi   : {report['duration']:.1f} detik (sejak job dibuat)")
+    print(f"Chunk    : {report['chunks_done']}/{report['chunks']}")
+    print(f"Sukses   : {report['success']} file")
+    print(f"Gagal    : {report['failed_count']} file")
+    print(f"Dilewati : {report['skipped']} file (manifest)")
+    print(f"Di-link  : {report['linked']} file (duplikat/store, tanpa download)")
+    if report['collided']: print(f"Bentrok  : {report['collided']} file (path sama dengan file lain, tidak didownload)")
+    print(f"Diunduh  : {format_bytes(report['bytes'])}")
+    for worker_id, stats in sorted(report['workers'].items()):
+        print(f"   {worker_id:<30} {stats['chunks']:>4} chunk | {stats['success']:>6} sukses | "
+              f"{stats['failed_count']:>4} gagal | {format_bytes(stats['bytes'])}")
+    for path in report['failed'][:20]: print(f"   - {path}")
+    if len(report['failed']) > 20: print(f"   ... dan {len(report['failed']) - 20} lainnya")
+    if download_root: print(f"Folder   : {download_root}")
+    print("="*60)
+
+def run_worker_mode(args, all_projects, auth_headers, scan_filter):
+    """Mode --worker: ambil chunk dari job di shared storage sampai semua chunk selesai"""
+    job = WorkerJob(args.worker)
+    # Heartbeat juga menjaga init.lock selama scan job baru yang bisa lama
+    with job.heartbeat():
+        meta = prepare_worker_job(job, args, all_projects, auth_headers, scan_filter)
+    if not meta: return
+    if meta.get('host') and meta['host'] != KITSU_HOST:
+        print(f"[WARNING] Job dibuat untuk server {meta['host']}, login ke {KITSU_HOST}")
+    download_root = job.download_root(args.download_root)
+    os.makedirs(download_root, exist_ok=True)
+
+    print(f">> WORKER {job.worker_id}: job '{meta['project']['name']}' "
+          f"({meta['total_files']} file, {meta['chunks']} chunk, {format_bytes(meta['total_size'])})")
+    print(f"   Folder: {download_root}")
+    manifest = DownloadManifest(download_root).load()
+    store = ContentStore(args.store) if args.store else None
+    progress = DownloadProgress(0)
+    chunks_done = 0
+    try:
+        with job.heartbeat():
+            while True:
+                index = job.claim()
+                if index is None:
+                    if job.is_finished(): break
+                    counts = job.status()
+                    progress.set_status(f"menunggu {counts['leased']} chunk di worker lain")
+                    time.sleep(WORKER_POLL_SECONDS)
+                    continue
+                progress.set_status(f"chunk {index + 1}/{meta['chunks']}")
+                try:
+                    result = download_job_chunk(job, index, download_root, auth_headers, manifest, progress, args, store)
+                except InsufficientDiskSpace as e:
+                    # Chunk dikembalikan ke antrian untuk worker lain yang disknya masih cukup
+                    job.release(job.lease_path(index))
+                    print(f"\n[X] Ruang disk tidak cukup untuk chunk {index + 1}: {e}. Worker berhenti.")
+                    break
+                except BaseException:
+                    # Lease dilepas (juga saat Ctrl+C) agar chunk langsung bisa diambil worker lain
+                    job.release(job.lease_path(index))
+                    raise
+                job.complete(index, result)
+                chunks_done += 1
+    finally:
+        URL_RESOLVER.save()
+
+    print(f"\n>> Worker ini menyelesaikan {chunks_done} chunk ({progress.success_count} file sukses)")
+    if job.is_finished(): print_job_report(job.finalize(download_root), download_root)
+
+def run_job_status(job_dir):
+    """Mode --job-status: progres job di shared storage tanpa perlu login"""
+    job = WorkerJob(job_dir)
+    if not job.load():
+        print(f"Job tidak ditemukan di '{job.job_dir}'."); return
+    counts = job.status()
+    print(f"Job '{job.meta['project']['name']}': {counts['done']} selesai, {counts['leased']} dikerjakan, "
+          f"{counts['expired']} lease kedaluwarsa, {counts['pending']} menunggu (dari {job.meta['chunks']} chunk)")
+    print_job_report(job.build_report())
+
+# ==========================================
+# MAIN
+# ==========================================
+
+def apply_filter_to_entry(entry, scan_filter):
+    """Hitung estimasi size/jumlah file project dari cache sesuai filter (queue dibaca streaming)"""
+    total_size = 0
+    total_files = 0
     try:
-        client_instance = gazu.client.default_client
-        raw_tokens = client_instance.tokens
-        auth_headers = {"Authorization": f"Bearer {raw_tokens['access_token']}"}
+        if scan_filter.latest:
+            # Pilih revisi terbaru butuh seluruh grup, jadi queue dikumpulkan dulu
+            items = [item for item in iter_cached_queue(entry) if scan_filter.allows_item(item, entry['download_root'])]
+            items, _ = latest_revisions(items, scan_filter.latest, queue_revision_key)
+        else:
+            items = (item for item in iter_cached_queue(entry) if scan_filter.allows_item(item, entry['download_root']))
+        for item in items:
+            total_size += item.get('size', 0)
+            total_files += 1
     except Exception as e:
-        print(f"[X] Gagal ambil token: {e}")
-        return
+        print(f"[WARNING] Gagal membaca cache '{entry['project']['name']}': {e}")
+    entry['filtered_size'] = total_size
+    entry['filtered_files'] = total_files
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Kitsu Downloader")
+    parser.add_argument("--host", help="URL server Kitsu (tanpa prompt)")
+    parser.add_argument("--user", help="Username/email Kitsu (password dari env KITSU_PASSWORD jika ada)")
+    parser.add_argument("--no-save-token", action="store_true",
+                        help=f"Jangan simpan token login ke {SESSION_FILENAME}")
+    parser.add_argument("--logout", action="store_true", help="Hapus token login tersimpan lalu keluar")
+    parser.add_argument("--stream", metavar="PROJECT",
+                        help="Non-interaktif: scan dan download project (nama, id, atau nomor) bersamaan lalu keluar")
+    parser.add_argument("--workers", type=int, default=DOWNLOAD_WORKERS,
+                        help=f"Jumlah worker download paralel (default {DOWNLOAD_WORKERS})")
+    parser.add_argument("--per-host", type=int, default=MAX_CONNECTIONS_PER_HOST,
+                        help=f"Maksimal koneksi paralel per host (default {MAX_CONNECTIONS_PER_HOST})")
+    parser.add_argument("--pool-size", type=int, default=HTTP_POOL_SIZE,
+                        help=f"Ukuran pool koneksi HTTP keep-alive (default {HTTP_POOL_SIZE})")
+    parser.add_argument("--segments", type=int, default=SEGMENT_CONNECTIONS,
+                        help=f"Koneksi paralel untuk satu file besar (default {SEGMENT_CONNECTIONS}, 1 = nonaktif)")
+    parser.add_argument("--segment-threshold", default=f"{SEGMENT_THRESHOLD // 2**20}M",
+                        help="File sebesar ini atau lebih diunduh per segmen (cth: 256M, 1G)")
+    parser.add_argument("--order", choices=DOWNLOAD_ORDERS, default='scan',
+                        help="Urutan download: scan (default), smallest = file kecil dulu, largest = file besar dulu "
+                             "(tidak bisa dipakai dengan --stream)")
+    parser.add_argument("--priority",
+                        help="Nama episode/sequence/task type/asset type yang didahulukan, urut prioritas (cth: EP02,Animation) "
+                             "(tidak bisa dipakai dengan --stream)")
+    parser.add_argument("--limit-rate", metavar="SPEC",
+                        help="Limit bandwidth total: '10M', per jam '08:00-18:00=5M,0' (0 = tanpa batas), "
+                             "atau '@FILE' berisi spec yang dibaca ulang saat file diubah")
+    parser.add_argument("--min-free", default=f"{DISK_SPACE_RESERVE // 2**30}G",
+                        help="Ruang disk yang tetap disisakan saat preflight (default 1G)")
+    parser.add_argument("--if-full", choices=('ask', 'trim', 'refuse', 'ignore'), default='ask',
+                        help="Jika download tidak muat di disk: ask (default), trim = ambil yang muat, "
+                             "refuse = batal, ignore = tetap jalan. Mode --worker: berhenti kecuali ignore. "
+                             "Mode --stream dicek per file: trim = lewati file yang tidak muat, ask/refuse = berhenti")
+    parser.add_argument("--scan-workers", type=int, default=SCAN_WORKERS,
+                        help=f"Jumlah thread scan entity per project (default {SCAN_WORKERS})")
+    parser.add_argument("--parallel-projects", type=int, default=PARALLEL_PROJECTS,
+                        help=f"Jumlah project yang discan bersamaan (default {PARALLEL_PROJECTS})")
+    parser.add_argument("--max-api-requests", type=int, default=MAX_API_REQUESTS,
+                        help=f"Maksimal request API metadata bersamaan, total semua project (default {MAX_API_REQUESTS})")
+    parser.add_argument("--bulk-scan", action="store_true",
+                        help="Ambil metadata seluruh project sekaligus (jauh lebih sedikit request API)")
+    parser.add_argument("--kinds", help="Jenis file: preview,output,working (default semua)")
+    parser.add_argument("--task-types", help="Nama task type, pisahkan dengan koma (cth: Animation,Compositing)")
+    parser.add_argument("--episodes", help="Nama episode, pisahkan dengan koma (hanya shot)")
+    parser.add_argument("--sequences", help="Nama sequence, pisahkan dengan koma (hanya shot)")
+    parser.add_argument("--asset-types", help="Nama asset type, pisahkan dengan koma (hanya asset)")
+    parser.add_argument("--ext", help="Ekstensi file, pisahkan dengan koma (cth: exr,mov)")
+    parser.add_argument("--max-size", help="Lewati file lebih besar dari ukuran ini (cth: 500M, 2G)")
+    parser.add_argument("--latest", type=int, nargs='?', const=1, metavar="N",
+                        help="Hanya ambil N revisi terbaru output/working file per task, output type dan nama (default 1)")
+    parser.add_argument("--store", metavar="DIR",
+                        help="Folder store bersama: file yang sudah pernah diunduh (project/run lain) di-hardlink dari sini")
+    parser.add_argument("--metrics-json", metavar="FILE",
+                        help="Simpan ringkasan metrics (latency API, fase scan, byte per worker) ke file JSON")
+    parser.add_argument("--metrics-prom", metavar="FILE",
+                        help="Tulis metrics dalam format textfile Prometheus (cth: untuk node_exporter)")
+    parser.add_argument("--worker", metavar="JOB_DIR",
+                        help="Mode worker terdistribusi: ambil chunk queue dari folder job di shared storage (NAS)")
+    parser.add_argument("--project", help="Project untuk job baru di --worker (nama, id, atau nomor)")
+    parser.add_argument("--download-root", metavar="DIR",
+                        help="Folder tujuan download mode --worker (default: di dalam folder job)")
+    parser.add_argument("--job-status", metavar="JOB_DIR",
+                        help="Tampilkan progres dan laporan gabungan job worker lalu keluar")
+    parser.add_argument("--checksum", action="store_true",
+                        help="Simpan SHA-256 setiap file yang selesai ke manifest")
+    parser.add_argument("--verify", metavar="ROOT",
+                        help="Verifikasi paralel isi folder download terhadap manifest lalu keluar")
+    parser.add_argument("--probe-urls", action="store_true",
+                        help="Cek pola URL download dengan HEAD sebelum mulai download")
+    return parser.parse_args(argv)
 
-    # --- 3. GET PROJECT LIST ---
+def run_verify(root, workers):
+    """Mode --verify: cek ulang hasil download tanpa perlu login"""
+    root = os.path.abspath(os.path.expanduser(root))
+    if not os.path.exists(os.path.join(root, MANIFEST_FILENAME)):
+        print(f"Manifest tidak ditemukan di '{root}'."); return
+
+    # Queue dari cache scan dipakai untuk mendeteksi file yang revisinya sudah usang
+    queue = None
+    cached = load_cache_from_disk()
+    if cached:
+        for entry in cached[0].values():
+            if entry and os.path.abspath(entry.get('download_root', '')) == root:
+                queue = load_project_queue(entry)
+                break
+
+    start_time = time.time()
+    report = verify_download_root(root, queue=queue, workers=workers)
+    print(f"\n\n" + "="*60)
+    print(f"VERIFIKASI SELESAI DALAM {time.time() - start_time:.1f} DETIK")
+    print(f"OK          : {len(report['ok'])} file")
+    print(f"Baru dicatat: {len(report['unchecked'])} file (checksum pertama)")
+    for key, label in (('corrupt', "Rusak"), ('stale', "Usang"), ('missing', "Hilang")):
+        print(f"{label:<12}: {len(report[key])} file")
+        for path in report[key][:20]: print(f"   - {path}")
+        if len(report[key]) > 20: print(f"   ... dan {len(report[key]) - 20} lainnya")
+    print("="*60)
+
+def main(argv=None):
+    args = parse_args(argv)
+    try:
+        run_app(args)
+    except KitsuAuthError as e:
+        print(f"\n[X] {e}. Token tidak bisa di-refresh, jalankan ulang untuk login kembali.")
+    finally:
+        # Metrics tetap ditulis walau run berhenti di tengah (Ctrl+C / error)
+        METRICS.export(args.metrics_json, args.metrics_prom)
+
+def run_app(args):
+    global MAX_CONNECTIONS_PER_HOST, SEGMENT_CONNECTIONS, SEGMENT_THRESHOLD, DISK_SPACE_RESERVE
+    MAX_CONNECTIONS_PER_HOST = max(1, args.per_host)
+    SEGMENT_CONNECTIONS = max(1, args.segments)
+    try:
+        SEGMENT_THRESHOLD = parse_size(args.segment_threshold)
+    except ValueError as e:
+        print(f"[X] --segment-threshold tidak valid: {e}"); return
     try:
-        all_projects = gazu.project.all_open_projects()
-    except:
-        print("Gagal ambil project."); return
+        DISK_SPACE_RESERVE = parse_size(args.min_free)
+    except ValueError as e:
+        print(f"[X] --min-free tidak valid: {e}"); return
+    try:
+        BANDWIDTH.configure(args.limit_rate)
+    except ValueError as e:
+        print(f"[X] --limit-rate tidak valid: {e}"); return
+    set_api_limit(args.max_api_requests)
+    if args.stream and (args.order != 'scan' or args.priority):
+        # Mode streaming mendownload file begitu selesai discan, jadi queue tidak bisa diurutkan
+        print("[X] --order/--priority tidak bisa dipakai dengan --stream"); return
 
-    if not all_projects:
-        print("Tidak ada project aktif."); return
+    if args.verify:
+        run_verify(args.verify, args.workers)
+        return
+    if args.job_status:
+        run_job_status(args.job_status)
+        return
+    if args.logout:
+        forget_saved_session()
+        print(f"Token tersimpan ({SESSION_FILENAME}) dihapus.")
+        return
 
-    # --- 4. CEK CACHE ATAU SCAN BARU ---
-    PROJECT_CACHE = {} 
-    
-    # Cek apakah ada file cache
-    loaded_cache_data, cache_date = load_cache_from_disk() or (None, None)
+    try:
+        scan_filter = ScanFilter.from_args(args)
+    except ValueError as e:
+        print(f"[X] Filter tidak valid: {e}"); return
+    print("="*60)
+    print("   KITSU DOWNLOADER - SMART CACHE MODE")
+    if scan_filter.is_active(): print(f"   Filter: {scan_filter.describe()}")
+    print("="*60)
+
+    # --- 1. CEK CACHE (TANPA LOGIN) ---
+    # Menu project bisa tampil hanya dari index cache; login baru dilakukan saat dibutuhkan
+    PROJECT_CACHE = {}
     use_cache = False
+    previous_scans = {}
+    interactive = not (args.stream or args.worker)
+    loaded_cache_data, cache_date = (load_cache_from_disk() if interactive else None) or (None, None)
 
     if loaded_cache_data:
         print("="*60)
         print(f"DITEMUKAN DATA SCAN TERSIMPAN!")
         print(f"Tanggal Scan: {cache_date}")
         print("="*60)
-        confirm_cache = input(">> Gunakan data lama (tidak perlu scan ulang)? (y/n): ").lower().strip()
+        print("   y = pakai data lama, n = scan ulang penuh, d = scan ulang yang berubah saja")
+        confirm_cache = input(">> Gunakan data lama (tidak perlu scan ulang)? (y/n/d): ").lower().strip()
         if confirm_cache == 'y':
             use_cache = True
             PROJECT_CACHE = loaded_cache_data
             print("\n>> Data berhasil dimuat dari file.")
+        elif confirm_cache == 'd':
+            # Dicocokkan lewat project id, urutan project bisa berubah
+            for entry in loaded_cache_data.values():
+                if entry:
+                    load_project_queue(entry)
+                    if entry.get('scan_state'): previous_scans[entry['project']['id']] = entry
+            print(">> Melakukan delta scan (hanya entity yang berubah)...")
         else:
             print(">> Melakukan scan ulang...")
 
+    # --- 2. LOGIN & PROJECT LIST ---
+    auth_headers = None
+    if use_cache:
+        # Nama project diambil dari cache, server tidak dihubungi sampai download dimulai
+        all_projects = [(PROJECT_CACHE.get(idx) or {}).get('project') or {'id': None, 'name': '-'}
+                        for idx in range(max(PROJECT_CACHE, default=-1) + 1)]
+    else:
+        auth_headers = connect_to_kitsu(args)
+        if auth_headers is None: return
+        try:
+            all_projects = gazu.project.all_open_projects()
+        except:
+            print("Gagal ambil project."); return
+
+        if not all_projects:
+            print("Tidak ada project aktif."); return
+
+    if args.stream:
+        run_stream_mode(args, all_projects, auth_headers, scan_filter)
+        return
+    if args.worker:
+        run_worker_mode(args, all_projects, auth_headers, scan_filter)
+        return
+
+    # --- 3. SCAN BARU ---
     if not use_cache:
         print("="*60)
         print(f">> MEMULAI ANALISIS {len(all_projects)} PROJECT...")
-        print("   (Harap tunggu, data akan disimpan setelah selesai)")
+        print(f"   ({args.parallel_projects} project bersamaan, hasil disimpan setiap project selesai)")
         print("="*60)
 
-        for idx, proj in enumerate(all_projects):
-            try:
-                # Menangkap 5 variable return (ada p_shots)
-                p_size, p_files, p_queue, p_root, p_shots = analyze_single_project(proj, auth_headers, idx+1, len(all_projects))
-                PROJECT_CACHE[idx] = {
-                    'project': proj, 
-                    'total_size': p_size,
-                    'total_files': p_files,
-                    'queue': p_queue,
-                    'download_root': p_root,
-                    'total_shots': p_shots # Simpan jumlah shot ke cache
-                }
-            except Exception as e:
-                print(f"\n[X] Error analyzing {proj['name']}: {e}")
-                PROJECT_CACHE[idx] = None 
+        board = ScanBoard(len(all_projects))
+
+        def scan_project(idx, proj):
+            # Menangkap 6 variable return (ada p_shots dan p_state)
+            previous = previous_scans.get(proj['id'])
+            p_size, p_files, p_queue, p_root, p_shots, p_state = analyze_single_project(
+                proj, auth_headers, idx+1, len(all_projects),
+                scan_workers=args.scan_workers, bulk=args.bulk_scan, previous=previous,
+                reporter=board.reporter(idx), scan_filter=scan_filter
+            )
+            return {
+                'project': proj, 
+                'total_size': p_size,
+                'total_files': p_files,
+                'queue': p_queue,
+                'download_root': p_root,
+                'total_shots': p_shots, # Simpan jumlah shot ke cache
+                'scan_state': p_state, # updated_at entity/task/file untuk delta scan
+                'scan_filter': scan_filter.spec()
+            }
+
+        # Beberapa project discan bersamaan, request API dibatasi API_SLOTS
+        with ThreadPoolExecutor(max_workers=max(1, args.parallel_projects)) as executor:
+            futures = {executor.submit(scan_project, idx, proj): idx for idx, proj in enumerate(all_projects)}
+            for future in as_completed(futures):
+                idx = futures[future]
+                try:
+                    PROJECT_CACHE[idx] = future.result()
+                except Exception as e:
+                    board.finish(idx, f"[X] Error analyzing {all_projects[idx]['name']}: {e}")
+                    PROJECT_CACHE[idx] = None 
+                # Simpan hasil sementara agar crash tidak menghilangkan semua scan
+                save_cache_to_disk(PROJECT_CACHE, partial=True)
+        board.close()
         
         # Simpan ke file setelah scan selesai
         save_cache_to_disk(PROJECT_CACHE)
 
-    # --- 5. LOOP MENU UTAMA ---
+    # Cache hasil scan dengan filter lain: estimasi menu dihitung ulang dari queue cache
+    if scan_filter.is_active():
+        for entry in PROJECT_CACHE.values():
+            if entry and entry.get('scan_filter') != scan_filter.spec():
+                apply_filter_to_entry(entry, scan_filter)
+
+    # --- 4. LOOP MENU UTAMA ---
     while True:
         print("\n" + "="*80) # Lebarkan sedikit agar muat
         print("   DAFTAR PROJECT")
@@ -515,8 +3633,8 @@ def main():
                 continue
 
             if data:
-                size_str = format_bytes(data['total_size'])
-                files_count = data['total_files']
+                size_str = format_bytes(data.get('filtered_size', data['total_size']))
+                files_count = data.get('filtered_files', data['total_files'])
                 # Ambil total shot (fallback ke '-' jika cache lama belum ada datanya)
                 shots_count = data.get('total_shots', '-') 
                 
@@ -545,9 +3663,13 @@ def main():
                 print("Masukkan angka yang benar.")
 
         # --- KONFIRMASI DOWNLOAD ---
-        final_queue = selected_data['queue']
+        final_queue = load_project_queue(selected_data)
         final_root = selected_data['download_root']
         final_size = selected_data['total_size']
+        if 'filtered_size' in selected_data:
+            final_queue = [item for item in final_queue if scan_filter.allows_item(item, final_root)]
+            final_queue, _ = latest_revisions(final_queue, scan_filter.latest, queue_revision_key)
+            final_size = selected_data['filtered_size']
         human_size = format_bytes(final_size)
         total_shots = selected_data.get('total_shots', 'Unknown')
         
@@ -574,37 +3696,68 @@ def main():
             continue 
 
         # --- EKSEKUSI DOWNLOAD ---
+        if auth_headers is None:
+            auth_headers = connect_to_kitsu(args)
+            if auth_headers is None: continue
         print("\n>> Memulai Download...")
-        try: os.makedirs(final_root, exist_ok=True)
-        except: pass
         
-        success_count = 0
-        failed_count = 0
-        downloaded_size = 0
-        start_time = time.time()
-        total_files = len(final_queue)
+        print(f"   Worker paralel: {args.workers} (maks {MAX_CONNECTIONS_PER_HOST} koneksi/host)")
+        manifest = DownloadManifest(final_root).load()
+        pending_queue, skipped = manifest.filter_pending(final_queue)
+        skipped_count = len(skipped)
+        if skipped_count:
+            print(f"   {skipped_count} file sudah lengkap menurut manifest, dilewati")
 
-        for i, item in enumerate(final_queue):
-            percent = int((i + 1) / total_files * 100)
-            fname = item['filename']
-            file_size_display = format_bytes(item.get('size', 0))
-            if len(fname) > 30: fname = fname[:27] + "..."
-            
-            sys.stdout.write(f"\r[{percent}%] {fname:<33} ({file_size_display})")
-            sys.stdout.flush()
-            
-            if download_with_auto_fix(item, headers=auth_headers):
-                success_count += 1
-                downloaded_size += item.get('size', 0)
-            else:
-                failed_count += 1
+        pending_queue = order_queue(pending_queue, final_root, args.order, parse_priority_list(args.priority))
+        if args.order != 'scan' or args.priority:
+            print(f"   Urutan: {args.order}{' | prioritas ' + args.priority if args.priority else ''}")
+        if BANDWIDTH.rate: print(f"   Limit bandwidth saat ini: {format_bytes(BANDWIDTH.rate)}/s")
+
+        # Preflight: byte yang dibutuhkan dibanding ruang kosong, sebelum ada folder yang dibuat
+        plan = preflight_plan(pending_queue, final_root)
+        print(f"   Preflight: {describe_plan(plan)}")
+        if not plan_fits(plan):
+            action = args.if_full
+            if action == 'ask':
+                print("   !! Ruang disk tidak cukup untuk seluruh download.")
+                answer = input(">> (t) download yang muat saja, (l) lanjut semua, (b) batal: ").lower().strip()
+                action = {'t': 'trim', 'l': 'ignore'}.get(answer, 'refuse')
+            if action == 'refuse':
+                print(">> Download dibatalkan, kembali ke menu...")
+                continue
+            if action == 'trim':
+                pending_queue, dropped = trim_plan(plan)
+                print(f"   {len(plan['items']) - len(pending_queue)} file ({format_bytes(dropped)}) dilewati karena ruang disk")
+
+        # Folder hanya dibuat untuk file yang benar-benar didownload, sekali per folder unik
+        try: os.makedirs(final_root, exist_ok=True)
+        except: pass
+        bad_folders = prepare_folders(pending_queue)
+        if bad_folders:
+            print(f"   [WARNING] {len(bad_folders)} folder tidak bisa ditulis, file di dalamnya akan gagal")
 
+        if args.probe_urls:
+            print(">> Mencari pola URL download (HEAD)...")
+            URL_RESOLVER.probe(pending_queue, headers=auth_headers)
+        start_time = time.time()
+        try:
+            progress, _ = run_download_pool(pending_queue, auth_headers, workers=args.workers,
+                                         manifest=manifest, checksum=args.checksum,
+                                         store=ContentStore(args.store) if args.store else None, skipped=skipped)
+        finally:
+            URL_RESOLVER.save()
+            manifest.save()
         duration = time.time() - start_time
         
         print(f"\n\n" + "="*60)
         print(f"SELESAI DALAM {duration:.1f} DETIK")
-        print(f"Sukses   : {success_count} file")
-        print(f"Gagal    : {failed_count} file")
+        print(f"Sukses   : {progress.success_count} file")
+        print(f"Gagal    : {progress.failed_count} file")
+        print(f"Dilewati : {skipped_count} file (manifest)")
+        print(f"Di-link  : {progress.linked_count} file (duplikat/store, tanpa download)")
+        if progress.collided_count:
+            print(f"Bentrok  : {progress.collided_count} file (path sama dengan file lain, tidak didownload)")
+        print(f"Diunduh  : {format_bytes(progress.bytes_done)} ({progress.speed() / 1048576:.2f} MB/s)")
         print(f"Folder   : {final_root}")
         print("="*60)
 
@@ -0,0 +1,85 @@
+import json
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import download_kitsu as dk  # noqa: E402
+
+
+def make_db(n_shots=6, n_assets=3):
+    """Project kecil: tiap entity punya 2 task, output beberapa revisi dan working file"""
+    task_types = [{'id': 'tt1', 'name': 'Animation'}, {'id': 'tt2', 'name': 'Comp'}]
+    shots = [{'id': f's{i}', 'name': f'SH{i:03d}', 'parent_id': 'q1', 'project_id': 'P',
+              'preview_file_id': f'pe{i}' if i % 2 else None, 'updated_at': '2024-01-01T00:00:00'}
+             for i in range(n_shots)]
+    assets = [{'id': f'a{i}', 'name': f'AS{i:03d}', 'asset_type_name': 'Props', 'project_id': 'P',
+               'preview_file_id': None, 'updated_at': '2024-01-01T00:00:00'} for i in range(n_assets)]
+    tasks, previews, outputs, works = [], [], [], []
+    for e in shots + assets:
+        if e['preview_file_id']:
+            previews.append({'id': e['preview_file_id'], 'original_name': 'ent_' + e['name'],
+                             'extension': 'mp4', 'file_size': 111, 'revision': 1})
+        for k, tt in enumerate(task_types):
+            task = {'id': f"{e['id']}_t{k}", 'name': 'main', 'entity_id': e['id'], 'project_id': 'P',
+                    'task_type_id': tt['id'], 'preview_file_id': f"{e['id']}_tp{k}" if k == 0 else None}
+            tasks.append(task)
+            if task['preview_file_id']:
+                previews.append({'id': task['preview_file_id'], 'original_name': 'tp', 'extension': 'mp4',
+                                 'file_size': 222, 'task_id': task['id'], 'revision': 2})
+            for r in (1, 2, 3):
+                outputs.append({'id': f"{task['id']}_o{r}", 'name': 'out', 'extension': 'exr',
+                                'file_size': 1000 * r, 'revision': r, 'entity_id': e['id'],
+                                'task_type_id': tt['id'], 'output_type_id': 'ot1'})
+            # Output type lain dengan nama sama: grup revisi sendiri walau nama file sama
+            outputs.append({'id': f"{task['id']}_m1", 'name': 'out', 'extension': 'exr', 'file_size': 700,
+                            'revision': 1, 'entity_id': e['id'], 'task_type_id': tt['id'], 'output_type_id': 'ot2'})
+            for r in (1, 2):
+                works.append({'id': f"{task['id']}_w{r}", 'name': 'work', 'extension': 'blend',
+                              'file_size': 5000 * r, 'revision': r, 'task_id': task['id'],
+                              'entity_id': e['id']})
+    return {'sequence_name': 'SQ01', 'events': [], 'task-types': task_types, 'shots': shots, 'assets': assets, 'tasks': tasks,
+            'preview-files': previews, 'output-files': outputs, 'working-files': works}
+
+
+@pytest.fixture
+def kitsu(monkeypatch):
+    """Ganti gazu dan endpoint /data dengan data di memori"""
+    db = make_db()
+    type_names = {t['id']: t['name'] for t in db['task-types']}
+
+    def tasks_for(entity):
+        return [dict(t, task_type_name=type_names[t['task_type_id']])
+                for t in db['tasks'] if t['entity_id'] == entity['id']]
+
+    def fetch_data_list(path, params=None):
+        rows = db[path]
+        for key, value in (params or {}).items():
+            wanted = set(json.loads(value)) if value.startswith('[') else {value}
+            rows = [row for row in rows if row.get(key) in wanted]
+        return [dict(row) for row in rows]
+
+    fake_gazu = SimpleNamespace(
+        shot=SimpleNamespace(all_shots_for_project=lambda project: [dict(s) for s in db['shots']]),
+        asset=SimpleNamespace(all_assets_for_project=lambda project: [dict(a) for a in db['assets']]),
+        task=SimpleNamespace(all_tasks_for_shot=tasks_for, all_tasks_for_asset=tasks_for),
+        sync=SimpleNamespace(get_last_events=lambda **kwargs: list(db['events'])),
+        files=SimpleNamespace(
+            get_preview_file=lambda i: next(dict(p) for p in db['preview-files'] if p['id'] == i),
+            all_output_files_for_entity=lambda entity_id, task_type=None: [
+                dict(o) for o in db['output-files']
+                if o['entity_id'] == entity_id and o['task_type_id'] == task_type],
+            get_working_files_for_task=lambda task: [
+                dict(w) for w in db['working-files'] if w['task_id'] == task['id']],
+        ),
+    )
+    monkeypatch.setattr(dk, 'gazu', fake_gazu)
+    monkeypatch.setattr(dk, 'fetch_data_list', fetch_data_list)
+    monkeypatch.setattr(dk, 'get_episodes_for_project', lambda p, h: [{'id': 'e1', 'name': 'EP01'}])
+    monkeypatch.setattr(dk, 'get_sequences_for_episode', lambda e, h: [{'id': 'q1', 'name': db['sequence_name']}])
+    monkeypatch.setattr(dk, 'get_sequences_for_project',
+                        lambda p, h: [{'id': 'q1', 'name': db['sequence_name'], 'episode_id': 'e1'}])
+    return db
@@ -0,0 +1,35 @@
+import download_kitsu as dk
+
+
+def scan(previous=None):
+    project = {'id': 'P', 'name': 'Proj'}
+    total_size, total_files, queue, root, shots, state = dk.analyze_single_project(
+        project, {}, 1, 1, scan_workers=2, previous=previous)
+    return {'queue': queue, 'scan_state': state, 'scan_filter': dk.NO_FILTER.spec()}
+
+
+def test_delta_scan_without_changes_reuses_cache(kitsu, monkeypatch):
+    first = scan()
+    calls = []
+    monkeypatch.setattr(dk, 'scan_entity', lambda *args, **kwargs: calls.append(args) or {})
+    second = scan(previous=first)
+    assert calls == []
+    assert second['queue'] == first['queue']
+
+
+def test_sequence_rename_rescans_its_shots(kitsu):
+    first = scan()
+    kitsu['sequence_name'] = 'SQ01_new'
+    second = scan(previous=first)
+    full = scan()
+    assert [item.to_dict() for item in second['queue']] == [item.to_dict() for item in full['queue']]
+    assert any('SQ01_new' in item.folder for item in second['queue'])
+    assert not any(item.folder.endswith('SQ01') or '/SQ01/' in item.folder for item in second['queue'])
+
+
+def test_scan_cutoff_uses_server_clock(kitsu, monkeypatch):
+    server_now = dk.datetime(2030, 1, 2, 3, 4, 5)
+    monkeypatch.setattr(dk, 'kitsu_server_time', lambda: server_now)
+    state = scan()['scan_state']
+    expected = server_now - dk.timedelta(minutes=dk.DELTA_SAFETY_MINUTES)
+    assert state['scanned_at'] == expected.strftime("%Y-%m-%dT%H:%M:%S")
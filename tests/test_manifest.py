@@ -0,0 +1,113 @@
+import os
+
+import download_kitsu as dk
+
+
+def write_item(root, file_id, data, revision):
+    item = dk.QueueItem('output', file_id, os.path.join(root, 'SH010', 'Comp'), 'out.exr', len(data), 'e1', revision)
+    os.makedirs(item.folder, exist_ok=True)
+    with open(os.path.join(item.folder, item.filename), 'wb') as f:
+        f.write(data)
+    return item
+
+
+def test_verify_reports_old_revision_of_same_path_as_stale(tmp_path, capsys):
+    root = str(tmp_path)
+    manifest = dk.DownloadManifest(root)
+    old = write_item(root, 'f1', b'old', 1)
+    manifest.record(old, checksum=True)
+    # Revisi baru (file id baru) menimpa path yang sama
+    new = write_item(root, 'f2', b'newer', 2)
+    manifest.record(new, checksum=True)
+    manifest.save()
+
+    report = dk.verify_download_root(root, queue=[new.to_dict()], workers=1)
+    assert report['stale'] == [os.path.join('SH010', 'Comp', 'out.exr')]
+    assert report['ok'] == [os.path.join('SH010', 'Comp', 'out.exr')]
+    assert report['corrupt'] == []
+
+
+def test_existing_file_needs_exact_size_and_matching_manifest(tmp_path, monkeypatch):
+    # Tanpa URL kandidat: item yang tidak diterima langsung gagal, tanpa request
+    monkeypatch.setattr(dk.URL_RESOLVER, 'candidates', lambda item: [])
+    root = str(tmp_path)
+    manifest = dk.DownloadManifest(root)
+    item = write_item(root, 'f1', b'12345', 1)
+    assert dk.download_with_auto_fix(item, {}, manifest=manifest)
+
+    item = write_item(root, 'f1', b'1234', 1)
+    item.size = 5
+    assert not dk.download_with_auto_fix(item, {}, manifest=manifest)
+
+    empty = write_item(root, 'f1', b'', 1)
+    assert not dk.download_with_auto_fix(empty, {})
+
+    # Path yang sama tercatat milik revisi lain
+    old = write_item(root, 'f1', b'abcde', 1)
+    manifest.record(old)
+    new = write_item(root, 'f2', b'abcde', 2)
+    assert not dk.download_with_auto_fix(new, {}, manifest=manifest)
+    assert not os.path.exists(os.path.join(new.folder, new.filename))
+
+
+def fake_download(calls):
+    def download(item, headers, progress=None, manifest=None):
+        calls.append(item['id'])
+        with open(dk.item_path(item), 'wb') as f:
+            f.write(item['id'].encode() * item['size'])
+        return True
+    return download
+
+
+def test_rerun_keeps_path_owner_and_reports_sibling_as_collision(tmp_path, monkeypatch):
+    calls = []
+    monkeypatch.setattr(dk, 'download_with_auto_fix', fake_download(calls))
+    root = str(tmp_path)
+    folder = os.path.join(root, 'SH010', 'Comp')
+    os.makedirs(folder)
+    # Dua revisi (file id berbeda) dengan nama file yang sama
+    queue = [dk.QueueItem('output', 'f1', folder, 'out.exr', 3, 'e1', 1),
+             dk.QueueItem('output', 'f2', folder, 'out.exr', 4, 'e1', 2)]
+
+    for run in range(2):
+        manifest = dk.DownloadManifest(root).load()
+        pending, skipped = manifest.filter_pending(queue)
+        progress, results = dk.run_download_pool(pending, {}, workers=1, manifest=manifest, skipped=skipped)
+        manifest.save()
+        assert progress.collided_count == 1
+        expected = [('f2', None)] if run else [('f1', True), ('f2', None)]
+        assert [(item['id'], ok) for item, ok, _ in results] == expected
+    assert calls == ['f1']
+    with open(os.path.join(folder, 'out.exr'), 'rb') as f:
+        assert f.read() == b'f1' * 3
+
+
+def test_stream_sibling_waits_for_recorded_path_owner(tmp_path, monkeypatch):
+    calls = []
+    monkeypatch.setattr(dk, 'download_with_auto_fix', fake_download(calls))
+    root = str(tmp_path)
+    first = write_item(root, 'f1', b'old', 1)
+    manifest = dk.DownloadManifest(root)
+    manifest.record(first)
+    sibling = first.copy(id='f2', revision=2, size=5)
+    deduper = dk.DownloadDeduper(manifest=manifest)
+    deduper.expect([first, sibling])
+    # Revisi lain datang lebih dulu dari pemilik path yang filenya sudah lengkap
+    assert deduper.fetch(sibling, {}) == [(sibling, None, False)]
+    deduper.skip(first)
+    assert calls == []
+
+
+def test_deduper_keeps_only_paths_of_finished_items(tmp_path, monkeypatch):
+    calls = []
+    monkeypatch.setattr(dk, 'download_with_auto_fix', fake_download(calls))
+    item = dk.QueueItem('output', 'f1', str(tmp_path / 'a'), 'out.exr', 3)
+    alias = item.copy(folder=str(tmp_path / 'b'))
+    os.makedirs(item.folder)
+    os.makedirs(alias.folder)
+    deduper = dk.DownloadDeduper()
+    assert deduper.fetch(item, {}) == [(item, True, False)]
+    assert deduper.fetch(alias, {}) == [(alias, True, True)]
+    assert calls == ['f1']
+    assert deduper.entries == {('output', 'f1'): {'path': dk.item_path(item), 'ok': True}}
+    assert set(deduper.paths.values()) == {('output', 'f1')}
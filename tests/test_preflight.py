@@ -0,0 +1,64 @@
+import os
+from types import SimpleNamespace
+
+import download_kitsu as dk
+
+
+def make_item(folder, name, size):
+    return dk.QueueItem('output', name, str(folder), name, size)
+
+
+def write(path, data):
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def test_bytes_still_needed(tmp_path):
+    item = make_item(tmp_path, 'a.bin', 1000)
+    assert dk.bytes_still_needed(item) == 1000
+
+    write(tmp_path / 'a.bin', b'x' * 1000)
+    assert dk.bytes_still_needed(item) == 0
+    # File final yang tidak lengkap tidak dihitung selesai
+    write(tmp_path / 'a.bin', b'x' * 999)
+    assert dk.bytes_still_needed(item) == 1000
+
+    os.remove(tmp_path / 'a.bin')
+    write(tmp_path / 'a.bin.tmp', b'x' * 4096)
+    allocated = os.stat(tmp_path / 'a.bin.tmp').st_blocks * 512
+    assert dk.bytes_still_needed(make_item(tmp_path, 'a.bin', 100000)) == 100000 - allocated
+
+
+def test_preflight_plan_counts_duplicates_once_and_trims(tmp_path):
+    root = str(tmp_path)
+    big = make_item(tmp_path / 'x', 'big.bin', 800)
+    small = make_item(tmp_path / 'y', 'small.bin', 100)
+    duplicate = big.copy(folder=str(tmp_path / 'z'))
+    plan = dk.preflight_plan([big, small, duplicate], root, reserve=0)
+    assert plan['needed'] == 900
+    # Folder belum dibuat sebelum keputusan trim/batal
+    assert not any(os.path.exists(tmp_path / name) for name in 'xyz')
+
+    plan['free'] = 500
+    assert not dk.plan_fits(plan)
+    kept, dropped = dk.trim_plan(plan)
+    assert kept == [small, duplicate] and dropped == 800
+    assert dk.prepare_folders(kept) == set()
+    assert sorted(os.listdir(tmp_path)) == ['y', 'z']
+
+
+def test_disk_free_uses_nearest_existing_parent(tmp_path, monkeypatch):
+    monkeypatch.setattr(dk.shutil, 'disk_usage', lambda path: SimpleNamespace(free=len(path)))
+    assert dk.disk_free(str(tmp_path / 'belum' / 'ada')) == len(str(tmp_path))
+
+
+def test_disk_budget_counts_files_in_flight(tmp_path, monkeypatch):
+    free = 1000
+    monkeypatch.setattr(dk.shutil, 'disk_usage', lambda root: SimpleNamespace(free=free))
+    budget = dk.DiskBudget(str(tmp_path), reserve=100)
+    first = make_item(tmp_path, 'a.bin', 500)
+    second = make_item(tmp_path, 'b.bin', 500)
+    assert budget.acquire(first)
+    assert not budget.acquire(second)
+    budget.release(first)
+    assert budget.acquire(second)
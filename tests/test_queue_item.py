@@ -0,0 +1,40 @@
+import download_kitsu as dk
+
+
+def make_item(**changes):
+    data = {'type': 'output', 'id': 'f1', 'folder': '/dl/Proj/EP01/SQ01/SH010/Comp',
+            'filename': 'Comp_Output_out.exr', 'size': 1234, 'entity_id': 'e1', 'revision': 3,
+            'url': None, 'revision_group': 'tt1|ot1|out'}
+    data.update(changes)
+    return dk.QueueItem.from_dict(data)
+
+
+def test_row_roundtrip():
+    item = make_item()
+    row = item.to_row(0, 0)
+    restored = dk.QueueItem.from_row(row, [item.folder], [item.entity_id])
+    assert restored == item
+    assert restored.to_dict() == item.to_dict()
+
+
+def test_row_without_entity_and_old_format():
+    item = make_item(entity_id=None, revision_group=None)
+    assert dk.QueueItem.from_row(item.to_row(0, None), [item.folder], []) == item
+    # Baris shard format 2 (tanpa grup revisi) tetap terbaca
+    old_row = item.to_row(0, None)[:8]
+    assert dk.QueueItem.from_row(old_row, [item.folder], []).revision_group is None
+
+
+def test_dict_style_access_and_shared_strings():
+    item = make_item()
+    assert item['size'] == 1234 and item.get('missing', 'x') == 'x' and 'folder' in item
+    other = make_item(id='f2')
+    assert item.folder is other.folder and item.type is other.type
+    assert item.copy(size=1) != item
+
+
+def test_url_is_stored_without_host(monkeypatch):
+    monkeypatch.setattr(dk, 'KITSU_HOST', 'http://kitsu.local/api')
+    item = make_item(url='http://kitsu.local/api/pictures/originals/preview-files/f1.png')
+    assert item.url_path == '/api/pictures/originals/preview-files/f1.png'
+    assert item.url == 'http://kitsu.local/api/pictures/originals/preview-files/f1.png'
@@ -0,0 +1,20 @@
+import download_kitsu as dk
+
+
+def test_parse_content_range():
+    assert dk.parse_content_range('bytes 100-199/1000') == (100, 1000)
+    assert dk.parse_content_range('bytes 0-0/5') == (0, 5)
+    assert dk.parse_content_range('bytes 100-199/*') == (100, None)
+    assert dk.parse_content_range('') == (None, None)
+    assert dk.parse_content_range('bytes */1000') == (None, None)
+
+
+def test_partial_meta_roundtrip_and_discard(tmp_path):
+    temp = str(tmp_path / 'f.bin.tmp')
+    assert dk.load_partial_meta(temp) is None
+    with open(temp, 'wb') as f:
+        f.write(b'x')
+    dk.save_partial_meta(temp, {'url': 'u', 'etag': '"e"', 'total': 10})
+    assert dk.load_partial_meta(temp) == {'url': 'u', 'etag': '"e"', 'total': 10}
+    dk.discard_partial(temp)
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,70 @@
+from types import SimpleNamespace
+
+import pytest
+
+import download_kitsu as dk
+
+
+def test_backoff_delay_is_jittered_and_capped(monkeypatch):
+    monkeypatch.setattr(dk.random, 'uniform', lambda low, high: high)
+    assert dk.backoff_delay(0) == dk.RETRY_BASE_DELAY
+    assert dk.backoff_delay(3) == dk.RETRY_BASE_DELAY * 8
+    assert dk.backoff_delay(50) == dk.RETRY_MAX_DELAY
+    monkeypatch.setattr(dk.random, 'uniform', lambda low, high: low)
+    assert dk.backoff_delay(3) == 0
+
+
+def test_backoff_delay_prefers_retry_after():
+    assert dk.backoff_delay(0, "7") == 7
+    assert dk.backoff_delay(0, str(10 ** 6)) == dk.BREAKER_MAX_COOLDOWN
+    assert dk.backoff_delay(0, "Wed, 21 Oct 2015 07:28:00 GMT") == 0
+
+
+def test_parse_retry_after_rejects_garbage():
+    assert dk.parse_retry_after(None) is None
+    assert dk.parse_retry_after("soon") is None
+
+
+def test_api_get_counts_final_retry_status_as_failure(monkeypatch):
+    response = SimpleNamespace(status_code=503, headers={}, close=lambda: None)
+    monkeypatch.setattr(dk, 'RETRY_ATTEMPTS', 3)
+    monkeypatch.setattr(dk, 'CIRCUIT_BREAKERS', {})
+    monkeypatch.setattr(dk.time, 'sleep', lambda seconds: None)
+    monkeypatch.setattr(dk, 'api_call', lambda fn, url, **kwargs: response)
+    url = "http://kitsu.test/api/data/projects/1"
+    assert dk.api_get(url).status_code == 503
+    assert dk.circuit_breaker(url).failures == 3
+
+
+class FakeHTTPError(Exception):
+    def __init__(self, response):
+        super().__init__(f"HTTP {response.status_code}")
+        self.response = response
+
+
+class RejectedResponse:
+    status_code = 401
+    headers = {}
+    request = SimpleNamespace(headers={'Authorization': 'Bearer expired'})
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def raise_for_status(self):
+        raise FakeHTTPError(self)
+
+
+def test_rejected_token_stops_download_pool(tmp_path, monkeypatch):
+    calls = []
+    monkeypatch.setattr(dk, 'CIRCUIT_BREAKERS', {})
+    monkeypatch.setattr(dk, 'refresh_auth_token', lambda failed_auth: False)
+    monkeypatch.setattr(dk, 'http_get', lambda url, **kwargs: calls.append(url) or RejectedResponse())
+    monkeypatch.setattr(dk.URL_RESOLVER, 'candidates', lambda item: [('p', f"http://kitsu.test/api/{item['id']}")])
+    queue = [dk.QueueItem('output', f'f{i}', str(tmp_path), f'f{i}.bin', 10) for i in range(4)]
+    with pytest.raises(dk.KitsuAuthError):
+        dk.run_download_pool(queue, {}, workers=1)
+    # File berikutnya tidak dicoba setelah token ditolak
+    assert calls == ["http://kitsu.test/api/f0"]
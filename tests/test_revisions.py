@@ -0,0 +1,40 @@
+import download_kitsu as dk
+
+
+def output(file_id, revision, name='out', output_type='ot1', size=100):
+    return {'id': file_id, 'name': name, 'revision': revision, 'task_type_id': 'tt1',
+            'output_type_id': output_type, 'file_size': size}
+
+
+def test_latest_revisions_keeps_newest_per_group_in_original_order():
+    records = [output('a1', 1), output('a3', 3), output('b1', 1, output_type='ot2'), output('a2', 2)]
+    kept, skipped = dk.latest_revisions(records, 1, dk.output_revision_key)
+    assert [r['id'] for r in kept] == ['a3', 'b1']
+    assert skipped == 200
+
+    kept, skipped = dk.latest_revisions(records, 2, dk.output_revision_key)
+    assert [r['id'] for r in kept] == ['a3', 'b1', 'a2']
+    assert skipped == 100
+
+
+def test_latest_revisions_without_limit_returns_everything():
+    records = [output('a1', 1), output('a2', 2)]
+    assert dk.latest_revisions(records, None, dk.output_revision_key) == (records, 0)
+
+
+def test_latest_revisions_treats_missing_revision_as_oldest():
+    records = [output('x', None), output('y', '2'), output('z', 'bad')]
+    kept, _ = dk.latest_revisions(records, 1, dk.output_revision_key)
+    assert [r['id'] for r in kept] == ['y']
+
+
+def test_queue_revision_key_groups_like_scan():
+    item = dk.QueueItem('output', 'f1', '/root/SH010/Comp', 'Comp_Output_out.exr', 10, 'e1', 2,
+                        revision_group=dk.revision_group(('tt1', 'ot1', 'out')))
+    same_group = item.copy(id='f2', revision=3)
+    other_entity = item.copy(id='f3', entity_id='e2')
+    assert dk.queue_revision_key(item) == dk.queue_revision_key(same_group)
+    assert dk.queue_revision_key(item) != dk.queue_revision_key(other_entity)
+    # Preview tidak pernah dikelompokkan
+    preview = dk.QueueItem('preview', 'p1', '/root/SH010', 'a.mp4')
+    assert dk.queue_revision_key(preview) != dk.queue_revision_key(preview.copy(id='p2'))
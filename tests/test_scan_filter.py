@@ -0,0 +1,56 @@
+import os
+
+import pytest
+
+import download_kitsu as dk
+
+
+def scan_filter(*argv):
+    return dk.ScanFilter.from_args(dk.parse_args(list(argv)))
+
+
+def test_no_filter_allows_everything():
+    f = scan_filter()
+    assert not f.is_active()
+    assert f.allows_kind('working') and f.allows_task_type('Comp')
+    assert f.allows_shot('EP01', 'SQ01') and f.allows_asset('Props')
+    assert f.allows_file('a.exr', 10 ** 12)
+
+
+def test_filter_values_are_case_insensitive_and_sanitized():
+    f = scan_filter('--task-types', 'Animation, Comp', '--episodes', 'ep01', '--ext', '.EXR', '--max-size', '2K')
+    assert f.allows_task_type('Comp') and not f.allows_task_type('Layout')
+    assert f.allows_shot('EP01', 'SQ09') and not f.allows_shot('EP02', 'SQ01')
+    assert f.allows_file('x.exr', 2048) and not f.allows_file('x.exr', 2049) and not f.allows_file('x.mov', 1)
+    # Filter episode saja: asset tidak ikut
+    assert not f.allows_asset('Props')
+    assert 'episodes=ep01' in f.describe()
+
+
+def test_asset_type_filter_excludes_shots():
+    f = scan_filter('--asset-types', 'Props')
+    assert f.allows_asset('props') and not f.allows_asset('Chars')
+    assert not f.allows_shot('EP01', 'SQ01')
+
+
+def test_invalid_arguments_raise_value_error():
+    with pytest.raises(ValueError):
+        scan_filter('--kinds', 'output,renders')
+    with pytest.raises(ValueError):
+        scan_filter('--latest', '0')
+
+
+def test_allows_item_reads_hierarchy_from_folder():
+    root = os.path.join('dl', 'Kitsu_Proj')
+    f = scan_filter('--sequences', 'SQ01', '--task-types', 'Comp')
+    item = {'type': 'output', 'filename': 'a.exr', 'size': 1,
+            'folder': os.path.join(root, 'EP01', 'SQ01', 'SH010', 'Comp')}
+    assert f.allows_item(item, root)
+    assert not f.allows_item(dict(item, folder=os.path.join(root, 'EP01', 'SQ02', 'SH010', 'Comp')), root)
+    # Preview entity (tanpa folder task type) tidak lolos filter task type
+    assert not f.allows_item(dict(item, type='preview', folder=os.path.join(root, 'EP01', 'SQ01', 'SH010')), root)
+
+
+def test_spec_is_stable_for_cache_comparison():
+    assert scan_filter('--task-types', 'Comp,Animation').spec() == scan_filter('--task-types', 'animation,comp').spec()
+    assert scan_filter('--latest').spec()['latest'] == 1
@@ -0,0 +1,41 @@
+import json
+import os
+import stat
+from types import SimpleNamespace
+
+import download_kitsu as dk
+
+
+def fake_gazu(tokens):
+    return SimpleNamespace(client=SimpleNamespace(default_client=SimpleNamespace(tokens=tokens)))
+
+
+def test_save_session_creates_private_file(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(dk, 'gazu', fake_gazu({'access_token': 'a', 'refresh_token': 'r'}))
+    monkeypatch.setattr(dk, 'SAVE_SESSION', True)
+    # File lama dengan permission terbuka diganti file baru 600
+    with open(dk.SESSION_FILENAME, 'w') as f:
+        f.write('{}')
+    os.chmod(dk.SESSION_FILENAME, 0o644)
+    dk.save_session()
+    assert stat.S_IMODE(os.stat(dk.SESSION_FILENAME).st_mode) == 0o600
+    assert dk.load_saved_session()['access_token'] == 'a'
+    assert os.listdir(tmp_path) == [dk.SESSION_FILENAME]
+
+
+def test_refresh_saves_new_token_unless_disabled(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    tokens = {'access_token': 'old', 'refresh_token': 'r'}
+    gazu = fake_gazu(tokens)
+    gazu.refresh_access_token = lambda: tokens.update(access_token='new')
+    monkeypatch.setattr(dk, 'gazu', gazu)
+    monkeypatch.setattr(dk, 'get_gazu_auth_headers', lambda: {})
+    monkeypatch.setattr(dk, 'SAVE_SESSION', False)
+    assert dk.refresh_auth_token(None)
+    assert dk.load_saved_session() is None
+
+    monkeypatch.setattr(dk, 'SAVE_SESSION', True)
+    assert dk.refresh_auth_token(None)
+    with open(dk.SESSION_FILENAME) as f:
+        assert json.load(f)['access_token'] == 'new'
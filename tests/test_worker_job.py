@@ -0,0 +1,93 @@
+import os
+from types import SimpleNamespace
+
+import download_kitsu as dk
+
+
+def make_job(tmp_path, worker_id, items=3):
+    job = dk.WorkerJob(str(tmp_path / 'job'), worker_id=worker_id)
+    root = str(tmp_path / 'job' / 'Kitsu_Proj')
+    queue = [dk.QueueItem('output', f'f{i}', os.path.join(root, 'SH010'), f'{i}.exr', 10) for i in range(items)]
+    job.create({'id': 'P', 'name': 'Proj'}, queue, root)
+    return job
+
+
+def age(path, seconds):
+    st = os.stat(path)
+    os.utime(path, (st.st_atime - seconds, st.st_mtime - seconds))
+
+
+def test_chunks_and_items_roundtrip(tmp_path, monkeypatch):
+    monkeypatch.setattr(dk, 'WORKER_CHUNK_ITEMS', 2)
+    job = make_job(tmp_path, 'w1')
+    assert job.meta['chunks'] == 2 and job.meta['total_size'] == 30
+    root = job.download_root()
+    items = job.load_chunk(0, root) + job.load_chunk(1, root)
+    assert [item.id for item in items] == ['f0', 'f1', 'f2']
+    assert items[0].folder == os.path.join(root, 'SH010')
+
+
+def test_live_lease_is_not_stolen_but_expired_one_is(tmp_path, monkeypatch):
+    monkeypatch.setattr(dk, 'WORKER_CHUNK_ITEMS', 10)
+    first = make_job(tmp_path, 'w1')
+    second = dk.WorkerJob(first.job_dir, worker_id='w2')
+    second.load()
+
+    assert first.claim() == 0
+    assert second.claim() is None
+    assert second.status()['leased'] == 1
+
+    # Worker pertama berhenti memperbarui lease
+    age(first.lease_path(0), dk.LEASE_SECONDS + 5)
+    assert second.status()['expired'] == 1
+    assert second.claim() == 0
+    assert second.owns(second.lease_path(0)) and not first.owns(first.lease_path(0))
+
+    # Heartbeat worker lama tidak mengambil kembali lease yang sudah diambil alih
+    first.renew()
+    assert second.lease_path(0) not in first.held
+
+
+def test_complete_marks_chunk_done(tmp_path, monkeypatch):
+    monkeypatch.setattr(dk, 'WORKER_CHUNK_ITEMS', 10)
+    job = make_job(tmp_path, 'w1')
+    index = job.claim()
+    job.complete(index, {'success': 2, 'failed_count': 1, 'bytes': 20, 'failed': [os.path.join('SH010', '2.exr')]})
+    assert not os.path.exists(job.lease_path(index))
+    assert job.claim() is None
+    assert job.status()['done'] == 1
+    assert job.done_results()[0]['worker'] == 'w1'
+
+    report = job.build_report()
+    assert report['chunks_done'] == 1 and report['success'] == 2 and report['failed_count'] == 1
+    assert report['failed'] == [os.path.join('SH010', '2.exr')]
+    assert report['workers'] == {'w1': {'chunks': 1, 'success': 2, 'failed_count': 1, 'bytes': 20}}
+
+
+def test_items_with_same_path_share_a_chunk(tmp_path, monkeypatch):
+    monkeypatch.setattr(dk, 'WORKER_CHUNK_ITEMS', 2)
+    folder = str(tmp_path / 'SH010')
+    queue = [dk.QueueItem('output', 'f0', folder, 'a.exr', 10), dk.QueueItem('output', 'f1', folder, 'b.exr', 10),
+             dk.QueueItem('output', 'f2', folder, 'a.exr', 10)]
+    assert [[item.id for item in chunk] for chunk in dk.group_chunks(queue, 2)] == [['f0', 'f2'], ['f1']]
+
+
+def test_chunk_failed_lists_only_failed_downloads(tmp_path, monkeypatch):
+    monkeypatch.setattr(dk, 'WORKER_CHUNK_ITEMS', 10)
+    job = make_job(tmp_path, 'w1')
+    root = job.download_root()
+    # f3 memakai path yang sama dengan f0 (bentrok), f2 gagal
+    chunk = job.load_chunk(0, root)
+    chunk.append(chunk[0].copy(id='f3'))
+    monkeypatch.setattr(job, 'load_chunk', lambda index, download_root: chunk)
+
+    def download(item, headers, progress=None, manifest=None):
+        if item['id'] == 'f2': return False
+        with open(dk.item_path(item), 'wb') as f:
+            f.write(b'x' * item['size'])
+        return True
+    monkeypatch.setattr(dk, 'download_with_auto_fix', download)
+    args = SimpleNamespace(workers=1, checksum=False, if_full='ignore')
+    result = dk.download_job_chunk(job, 0, root, {}, dk.DownloadManifest(root), dk.DownloadProgress(0), args, None)
+    assert result['failed'] == [os.path.join('SH010', '2.exr')]
+    assert result['failed_count'] == 1 and result['collided'] == 1 and result['success'] == 2